@@ -0,0 +1,160 @@
+"""
+Offline batch processor for backlogs of disputes.
+
+Reads a manifest of cases, runs each through the DisputeResolutionPipeline
+with bounded concurrency and appends one JSON line per case to the output
+file as soon as it finishes. The output doubles as the checkpoint: on restart,
+cases already recorded as "ok" are skipped, so a crash resumes where it stopped.
+Retried cases are appended again; the last line for an id is the current result.
+
+Manifest (JSONL, or CSV with a header row), paths relative to the manifest:
+    {"id": "case-001", "conversation": "case-001/chat.txt", "buyer_pdf": "case-001/buyer.pdf", "seller_pdf": "case-001/seller.pdf"}
+
+Usage (from the backend folder):
+    python batch_disputes.py cases/manifest.jsonl --out cases/results.jsonl --concurrency 4
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.DisputeResolutionPipeline import DisputeResolutionPipeline
+from utils.Deadline import Deadline
+
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    Read the manifest and resolve its paths.
+    :return: Cases with "id", "conversation", "buyer_pdf" and "seller_pdf" (absolute paths).
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    cases = []
+    for index, row in enumerate(rows):
+        missing = [field for field in ("conversation", "buyer_pdf", "seller_pdf") if not row.get(field)]
+        if missing:
+            raise ValueError(f"Manifest row {index + 1} is missing {missing}")
+        case = {"id": str(row.get("id") or index + 1)}
+        for field in ("conversation", "buyer_pdf", "seller_pdf"):
+            case[field] = row[field] if os.path.isabs(row[field]) else os.path.join(base, row[field])
+        cases.append(case)
+
+    ids = Counter(case["id"] for case in cases)
+    duplicates = [case_id for case_id, count in ids.items() if count > 1]
+    if duplicates:
+        raise ValueError(f"Duplicate case ids in manifest: {duplicates[:5]}")
+    return cases
+
+
+def completed_case_ids(output_path: str, retry_statuses: Set[str]) -> Set[str]:
+    """
+    Ids already recorded in the output, except those whose status should be retried.
+    A truncated last line (crash mid-write) is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") not in retry_statuses:
+                done.add(record["id"])
+    return done
+
+
+class BatchRunner:
+    """Runs cases concurrently and appends each result to the output JSONL as it completes."""
+
+    def __init__(self, pipeline: DisputeResolutionPipeline, output_path: str, deadline_seconds: Optional[float] = None):
+        self.pipeline = pipeline
+        self.output_path = output_path
+        self.deadline_seconds = deadline_seconds
+        self._write_lock = threading.Lock()
+
+    def process_case(self, case: Dict[str, str]) -> Dict:
+        start = time.perf_counter()
+        record = {"id": case["id"]}
+        try:
+            with open(case["conversation"]) as f:
+                conversation_chain = f.read()
+            deadline = Deadline.from_env()
+            if self.deadline_seconds:
+                deadline.total = self.deadline_seconds
+            result = self.pipeline.process_dispute(conversation_chain, case["buyer_pdf"], case["seller_pdf"], deadline=deadline)
+            record.update(status="partial" if result["partial"] else "ok", **result)
+        except Exception as e:
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record["duration_s"] = round(time.perf_counter() - start, 3)
+        self._append(record)
+        return record
+
+    def _append(self, record: Dict):
+        line = json.dumps(record, default=str)
+        with self._write_lock:
+            with open(self.output_path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def run(self, cases: List[Dict[str, str]], concurrency: int) -> Counter:
+        statuses, decided_by = Counter(), Counter()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="case") as executor:
+            futures = [executor.submit(self.process_case, case) for case in cases]
+            for done, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                statuses[record["status"]] += 1
+                decided_by[record.get("decided_by") or "-"] += 1
+                rate = done / (time.perf_counter() - start) * 60
+                print(f"[{done}/{len(cases)}] {record['id']}: {record['status']} "
+                      f"{record.get('selected_tool', '')} in {record['duration_s']:.1f}s | {rate:.1f} cases/min")
+
+        elapsed = time.perf_counter() - start
+        print(f"\nProcessed {len(cases)} cases in {elapsed:.1f}s ({len(cases) / elapsed * 60 if elapsed else 0:.1f} cases/min)")
+        print("Status: " + ", ".join(f"{status}={count}" for status, count in statuses.items()))
+        print("Decided by: " + ", ".join(f"{source}={count}" for source, count in decided_by.items()))
+        return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-adjudicate a backlog of disputes.")
+    parser.add_argument("manifest", help="JSONL or CSV manifest of cases.")
+    parser.add_argument("--out", default="batch_results.jsonl", help="Results JSONL, also used to resume.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Cases processed at once.")
+    parser.add_argument("--model", default="gpt-4o", help="Final model of the resolution cascade.")
+    parser.add_argument("--deadline", type=float, help="Per-case time budget in seconds (default: DISPUTE_DEADLINE).")
+    parser.add_argument("--retry", default="error,partial", help="Recorded statuses to process again on resume.")
+    parser.add_argument("--limit", type=int, help="Process at most this many pending cases.")
+    args = parser.parse_args()
+
+    cases = load_manifest(args.manifest)
+    done = completed_case_ids(args.out, set(filter(None, args.retry.split(","))))
+    pending = [case for case in cases if case["id"] not in done]
+    if args.limit:
+        pending = pending[:args.limit]
+    print(f"{len(cases)} cases in manifest, {len(done)} already done, {len(pending)} to process")
+    if not pending:
+        return
+
+    runner = BatchRunner(DisputeResolutionPipeline(model=args.model), args.out, args.deadline)
+    runner.run(pending, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
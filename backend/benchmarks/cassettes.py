@@ -0,0 +1,255 @@
+"""
+Record/replay proxy for the OpenAI, Gemini and Supabase APIs, so pipeline
+changes can be benchmarked end to end, offline, on identical provider answers.
+
+record: forwards every call to the real provider and appends the request
+        fingerprint, the response and its timings to a cassette (JSONL).
+replay: answers from the cassette without network access, either with the
+        recorded latency (time to first byte, then each streamed chunk at its
+        original offset) or with zero latency.
+
+Requests are matched on method, path, query and a hash of the body (JSON is
+canonicalized, multipart boundaries and API keys are ignored). Identical
+requests recorded several times are replayed in recorded order, the last one
+repeating. API keys and request headers are never written to the cassette.
+
+Usage (from the backend folder):
+    python -m benchmarks.cassettes record --cassette cassettes/disputes.jsonl --port 9102
+    python -m benchmarks.cassettes replay --cassette cassettes/disputes.jsonl --port 9102 --latency zero
+
+Then start the backend against it (disable the caches while recording so every call reaches the proxy):
+    OPENAI_BASE_URL=http://127.0.0.1:9102/v1 GEMINI_API_ENDPOINT=http://127.0.0.1:9102 \\
+    SUPABASE_URL=http://127.0.0.1:9102 SHARED_CACHE_ENABLED=0 python main.py
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+UPSTREAMS = {
+    "openai": "https://api.openai.com",
+    "gemini": "https://generativelanguage.googleapis.com",
+    "supabase": os.getenv("SUPABASE_URL", ""),
+}
+SUPABASE_PREFIXES = ("/rest/", "/auth/", "/storage/", "/functions/")
+# Query parameters that carry credentials and must not affect matching or be stored
+SECRET_PARAMS = {"key", "apikey", "api_key"}
+DROPPED_REQUEST_HEADERS = {"host", "content-length", "accept-encoding", "connection"}
+KEPT_RESPONSE_HEADERS = ("content-type", "content-range")
+# Request bodies up to this size are stored for inspection; larger ones (e.g. inline PDFs) only by hash
+MAX_STORED_REQUEST = 32 * 1024
+
+
+def provider_for(path: str) -> str:
+    if path.startswith(("/v1beta/", "/upload/")):
+        return "gemini"
+    if path.startswith(SUPABASE_PREFIXES):
+        return "supabase"
+    return "openai"
+
+
+def _normalized_body(body: bytes, content_type: str) -> bytes:
+    if "json" in content_type:
+        try:
+            return json.dumps(json.loads(body), sort_keys=True).encode()
+        except ValueError:
+            return body
+    if "multipart/form-data" in content_type and "boundary=" in content_type:
+        boundary = content_type.split("boundary=", 1)[1].split(";")[0].strip('"')
+        return body.replace(boundary.encode(), b"BOUNDARY")
+    return body
+
+
+def request_fingerprint(method: str, path: str, query: str, content_type: str, body: bytes) -> Dict[str, str]:
+    """Method, path, credential-free query and body hash that identify a provider call."""
+    params = sorted((name, value) for name, value in parse_qsl(query, keep_blank_values=True) if name.lower() not in SECRET_PARAMS)
+    body_hash = hashlib.sha256(_normalized_body(body, content_type)).hexdigest()
+    clean_query = urlencode(params)
+    return {"method": method, "path": path, "query": clean_query, "body_sha256": body_hash,
+            "key": f"{method} {path}?{clean_query} {body_hash}"}
+
+
+def _decode(data: bytes) -> Dict[str, str]:
+    try:
+        return {"text": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(data).decode()}
+
+
+def _encode(part: Dict[str, str]) -> bytes:
+    return part["text"].encode("utf-8") if "text" in part else base64.b64decode(part["b64"])
+
+
+class Cassette:
+    """The recorded calls of one session, appended to and read from a JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, List[dict]] = defaultdict(list)
+        self._served: Counter = Counter()
+        self.stats = Counter()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def append(self, entry: dict):
+        self._entries[entry["key"]].append(entry)
+        self.stats["recorded"] += 1
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def next(self, key: str) -> Optional[dict]:
+        """The next recorded answer for `key`; repeats the last one once all were served."""
+        entries = self._entries.get(key)
+        if not entries:
+            self.stats["misses"] += 1
+            return None
+        index = min(self._served[key], len(entries) - 1)
+        self._served[key] += 1
+        self.stats["hits"] += 1
+        return entries[index]
+
+
+def create_record_app(cassette: Cassette, upstreams: Dict[str, str], timeout: float = 120.0) -> FastAPI:
+    app = FastAPI(title="Provider recorder")
+    client = httpx.AsyncClient(timeout=timeout)
+
+    @app.get("/stats")
+    async def stats():
+        return {"mode": "record", "entries": len(cassette), **cassette.stats}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PATCH", "PUT", "DELETE"])
+    async def record(path: str, request: Request):
+        path = "/" + path
+        provider = provider_for(path)
+        if not upstreams.get(provider):
+            return JSONResponse(status_code=502, content={"error": {"message": f"No upstream configured for {provider}"}})
+
+        body = await request.body()
+        content_type = request.headers.get("content-type", "")
+        fingerprint = request_fingerprint(request.method, path, request.url.query, content_type, body)
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in DROPPED_REQUEST_HEADERS}
+        upstream_url = upstreams[provider].rstrip("/") + path + (f"?{request.url.query}" if request.url.query else "")
+
+        start = time.perf_counter()
+        upstream = await client.send(client.build_request(request.method, upstream_url, headers=headers, content=body),
+                                     stream=True)
+        latency_ms = (time.perf_counter() - start) * 1000
+        response_headers = {name: upstream.headers[name] for name in KEPT_RESPONSE_HEADERS if name in upstream.headers}
+        entry = {**fingerprint, "provider": provider, "status": upstream.status_code, "headers": response_headers,
+                 "latency_ms": round(latency_ms, 1), "recorded_at": time.time()}
+        if len(body) <= MAX_STORED_REQUEST:
+            entry["request"] = _decode(body)
+        streamed = "text/event-stream" in upstream.headers.get("content-type", "")
+
+        async def relay():
+            chunks = []
+            try:
+                async for chunk in upstream.aiter_bytes():
+                    chunks.append(((time.perf_counter() - start) * 1000, chunk))
+                    if streamed:
+                        yield chunk
+            finally:
+                await upstream.aclose()
+            entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if streamed:
+                entry["chunks"] = [{"offset_ms": round(offset, 1), **_decode(chunk)} for offset, chunk in chunks]
+            else:
+                entry["body"] = _decode(b"".join(chunk for _, chunk in chunks))
+            cassette.append(entry)
+            if not streamed:
+                yield _encode(entry["body"])
+
+        if streamed:
+            return StreamingResponse(relay(), status_code=upstream.status_code, headers=response_headers)
+        content = b"".join([chunk async for chunk in relay()])
+        return Response(content, status_code=upstream.status_code, headers=response_headers)
+
+    @app.on_event("shutdown")
+    async def close_client():
+        await client.aclose()
+
+    return app
+
+
+def create_replay_app(cassette: Cassette, latency: str = "original") -> FastAPI:
+    app = FastAPI(title="Provider replay")
+    realtime = latency == "original"
+
+    @app.get("/stats")
+    async def stats():
+        return {"mode": "replay", "latency": latency, "entries": len(cassette), **cassette.stats}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PATCH", "PUT", "DELETE"])
+    async def replay(path: str, request: Request):
+        path = "/" + path
+        body = await request.body()
+        fingerprint = request_fingerprint(request.method, path, request.url.query, request.headers.get("content-type", ""), body)
+        entry = cassette.next(fingerprint["key"])
+        if entry is None:
+            print(f"Cassette miss: {fingerprint['method']} {path} (body {fingerprint['body_sha256'][:12]})")
+            return JSONResponse(status_code=404, content={"error": {"message": f"No cassette entry for {fingerprint['key']}"}})
+
+        start = time.perf_counter()
+
+        async def wait_until(offset_ms: float):
+            if realtime:
+                await asyncio.sleep(max(0.0, offset_ms / 1000 - (time.perf_counter() - start)))
+
+        await wait_until(entry["latency_ms"])
+        if "chunks" in entry:
+            async def chunks():
+                for chunk in entry["chunks"]:
+                    await wait_until(chunk["offset_ms"])
+                    yield _encode(chunk)
+            return StreamingResponse(chunks(), status_code=entry["status"], headers=entry["headers"])
+        await wait_until(entry["duration_ms"])
+        return Response(_encode(entry["body"]), status_code=entry["status"], headers=entry["headers"])
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay OpenAI/Gemini/Supabase calls.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--cassette", required=True, help="JSONL file to append to (record) or serve from (replay).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--latency", choices=["original", "zero"], default="original", help="Replay timing.")
+    parser.add_argument("--openai-upstream", default=UPSTREAMS["openai"])
+    parser.add_argument("--gemini-upstream", default=UPSTREAMS["gemini"])
+    parser.add_argument("--supabase-upstream", default=UPSTREAMS["supabase"], help="Default: SUPABASE_URL.")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.cassette)), exist_ok=True)
+    cassette = Cassette(args.cassette)
+    if args.mode == "record":
+        upstreams = {"openai": args.openai_upstream, "gemini": args.gemini_upstream, "supabase": args.supabase_upstream}
+        app = create_record_app(cassette, upstreams)
+    else:
+        if not len(cassette):
+            parser.error(f"{args.cassette} has no recorded calls")
+        app = create_replay_app(cassette, args.latency)
+    print(f"{args.mode.capitalize()}ing {args.cassette} ({len(cassette)} recorded calls) on http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
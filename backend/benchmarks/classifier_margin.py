@@ -0,0 +1,117 @@
+"""
+Margin sweep for the embedding classifiers: how CLASSIFIER_MIN_MARGIN trades
+LLM calls for accuracy.
+
+Every labeled example is held out in turn and classified against centroids
+built from the label descriptions and the remaining examples (leave-one-out).
+For each candidate margin the report shows the share of examples the
+embeddings would decide alone, and how many of those they get right; the
+rest would go to the LLM. The suggested margin is the smallest one whose
+embedding-decided accuracy reaches --target.
+
+Usage (from the backend folder):
+    python -m benchmarks.classifier_margin
+    python -m benchmarks.classifier_margin --sets conversation,digest --target 0.95 --json margins.json
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.ConversationAnalysisAgent import AVAILABLE_TOOLS, EXAMPLES as CONVERSATION_EXAMPLES
+from utils.EmbeddingClassifier import EmbeddingClassifier
+from utils.EmbeddingFormats import decode_float32
+from utils.IncrementalConversationAnalyzer import digest_examples
+from utils.OpenAIModel import OpenAIModel
+from utils.ToolsSelectionAgent import EXAMPLES as TOOL_EXAMPLES
+
+MARGINS = [0.0, 0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.08, 0.1, 0.15]
+
+
+def example_sets(names: List[str]) -> Dict[str, Tuple[Dict[str, str], Dict[str, List[str]]]]:
+    """Labels (with descriptions) and labeled examples of each classifier the backend builds."""
+    sets = {}
+    if "conversation" in names:
+        sets["conversation"] = (AVAILABLE_TOOLS, CONVERSATION_EXAMPLES)
+    if "digest" in names:
+        sets["digest"] = (AVAILABLE_TOOLS, digest_examples())
+    if "tools" in names:
+        from utils.DisputeResolutionPipeline import DisputeResolutionPipeline
+
+        sets["tools"] = (DisputeResolutionPipeline(model="gpt-4o").available_tools, TOOL_EXAMPLES)
+    return sets
+
+
+def leave_one_out(labels: Dict[str, str], examples: Dict[str, List[str]], embed, dimensions: int) -> List[Tuple[bool, float]]:
+    """
+    Classify every example against centroids built without it.
+    :return: (correct, top-two margin) per example.
+    """
+    outcomes = []
+    for label, texts in examples.items():
+        for index, text in enumerate(texts):
+            rest = {name: [t for i, t in enumerate(values) if name != label or i != index] for name, values in examples.items()}
+            classifier = EmbeddingClassifier("margin_sweep", labels, rest, embed=embed, min_margin=0.0, dimensions=dimensions)
+            result = classifier.classify(text)
+            outcomes.append((result.label == label, result.margin))
+    return outcomes
+
+
+def sweep(outcomes: List[Tuple[bool, float]], margins: List[float]) -> List[Dict]:
+    rows = []
+    for margin in margins:
+        decided = [correct for correct, value in outcomes if value >= margin]
+        rows.append({
+            "margin": margin,
+            "embedding_share": len(decided) / len(outcomes),
+            "embedding_accuracy": sum(decided) / len(decided) if decided else None,
+        })
+    return rows
+
+
+def suggested_margin(rows: List[Dict], target: float) -> Optional[float]:
+    for row in rows:
+        if row["embedding_accuracy"] is not None and row["embedding_accuracy"] >= target:
+            return row["margin"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the embedding classifiers' top-two margin threshold.")
+    parser.add_argument("--sets", default="conversation,digest,tools",
+                        help="Comma-separated example sets: conversation, digest (incremental analysis), tools.")
+    parser.add_argument("--target", type=float, default=1.0, help="Accuracy required of embedding-decided examples.")
+    parser.add_argument("--dimensions", type=int, default=int(os.getenv("CLASSIFIER_DIMENSIONS", "256")))
+    parser.add_argument("--json", dest="json_path", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    sets = example_sets([name.strip() for name in args.sets.split(",") if name.strip()])
+    # Embed every description and example once, in batches; the folds only look them up
+    texts = sorted({text for labels, examples in sets.values()
+                    for text in [f"{label}: {description}" for label, description in labels.items()]
+                    + [t for values in examples.values() for t in values]})
+    vectors = dict(zip(texts, OpenAIModel().create_embeddings_base64(texts, args.dimensions)))
+    embed = lambda text: decode_float32(vectors[text])
+
+    report = {}
+    for name, (labels, examples) in sets.items():
+        rows = sweep(leave_one_out(labels, examples, embed, args.dimensions), MARGINS)
+        report[name] = {"rows": rows, "suggested_margin": suggested_margin(rows, args.target)}
+        print(f"\n{name} ({sum(len(values) for values in examples.values())} examples)")
+        print(f"{'margin':>8} {'by embeddings':>14} {'accuracy':>9}")
+        for row in rows:
+            accuracy = "-" if row["embedding_accuracy"] is None else f"{row['embedding_accuracy']:.0%}"
+            print(f"{row['margin']:>8.2f} {row['embedding_share']:>14.0%} {accuracy:>9}")
+        print(f"suggested CLASSIFIER_MIN_MARGIN for {args.target:.0%} accuracy: {report[name]['suggested_margin']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Accuracy/latency evaluation of the dispute pipeline.
+
+Builds a labeled evaluation set from the statements in backend/data/
+(genuine buyer/seller pairs, the forged buyer receipt, and unrelated
+documents uploaded instead of a receipt) crossed with varied conversation
+chains, then runs each `process_dispute` variant over it. Side by side it
+reports tool-selection accuracy, escalation precision/recall, latency and
+token usage, so an optimization that changes outcomes shows up next to the
+time it saves.
+
+Every variant gets its own LLM provider, with the response cache off by
+default so earlier variants do not answer for later ones. OCR is warmed once
+up front: with the shared cache enabled, every variant then reads the same
+OCR text and latency differences come from the stages after OCR.
+
+Usage (from the backend folder):
+    python -m benchmarks.dispute_eval
+    python -m benchmarks.dispute_eval --variants default,no_rules,no_cascade --repeat 3 --json eval.json
+
+Offline and reproducible, against recorded provider answers (see benchmarks/cassettes.py):
+    OPENAI_BASE_URL=http://127.0.0.1:9102/v1 GEMINI_API_ENDPOINT=http://127.0.0.1:9102 python -m benchmarks.dispute_eval
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.DisputeResolutionPipeline import DisputeResolutionPipeline
+from utils.LLMProvider import LLMProvider, create_llm_provider
+from utils.ModelCascade import ModelCascade
+from utils.OCRScanner import OCRScanner
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+
+
+@dataclass
+class EvalCase:
+    case_id: str
+    conversation_chain: str
+    buyer_pdf: str
+    seller_pdf: str
+    expected_tool: str
+    expected_escalate: bool
+
+
+# (name, buyer proof, seller proof, expected tool, expected escalation)
+PROOF_PAIRS = [
+    ("genuine", "GXBank Transaction buyer.pdf", "GXBank Transaction seller.pdf", "allGood", False),
+    ("forged_buyer", "GXBank Transaction buyer fake.pdf", "GXBank Transaction seller.pdf", "notifyAndEscalate", True),
+    ("buyer_wrong_document", "COURSE PLANNING.pdf", "GXBank Transaction seller.pdf", "getBuyerBankStatement", False),
+    ("seller_wrong_document", "GXBank Transaction buyer.pdf", "COURSE PLANNING.pdf", "getSellerBankStatement", False),
+]
+
+# Chats in the format the frontend sends. The label comes from the proofs, so
+# every chat must leave the expected tool unchanged.
+CONVERSATIONS = {
+    "cooperative": [
+        {"user": "Buyer", "text": "Paid RM1.00 by QR transfer, please release the item."},
+        {"user": "Seller", "text": "Let me check, I'll release once I see it."},
+    ],
+    "seller_denies": [
+        {"user": "Buyer", "text": "I sent RM1.00 yesterday night but you have not released the item."},
+        {"user": "Seller", "text": "I don't see any payment from you in my account."},
+        {"user": "Buyer", "text": "Here is my receipt, the transaction ID is 3e5ee129ed634d0682f467e12498c831."},
+        {"user": "Seller", "text": "That receipt could be edited. Upload your proof to the platform."},
+    ],
+    "buyer_pressure": [
+        {"user": "Buyer", "text": "Release now!!! I already transferred, stop wasting my time or I report you."},
+        {"user": "Seller", "text": "Please be patient, I am checking with my bank."},
+        {"user": "Buyer", "text": "Bank transfer is instant la, check properly."},
+    ],
+    "mixed_language": [
+        {"user": "Buyer", "text": "Bro I dah transfer RM1.00 to Lim Jack Sheng, 08 Feb 10.38pm."},
+        {"user": "Seller", "text": "Ok wait ya, nanti I check my GXBank app."},
+        {"user": "Seller", "text": "Hmm not sure if masuk already."},
+    ],
+    "long_thread": [
+        {"user": "Buyer" if i % 2 == 0 else "Seller",
+         "text": f"Message {i}: " + ("Did the RM1.00 reach you?" if i % 2 == 0 else "Still checking my statement.")}
+        for i in range(40)
+    ],
+}
+
+
+def build_eval_set() -> List[EvalCase]:
+    """Every proof pair with every conversation chain."""
+    cases = []
+    for pair, buyer_pdf, seller_pdf, tool, escalate in PROOF_PAIRS:
+        for chat_name, chat in CONVERSATIONS.items():
+            cases.append(EvalCase(
+                case_id=f"{pair}/{chat_name}",
+                conversation_chain=json.dumps(chat),
+                buyer_pdf=os.path.join(DATA_DIR, buyer_pdf),
+                seller_pdf=os.path.join(DATA_DIR, seller_pdf),
+                expected_tool=tool,
+                expected_escalate=escalate,
+            ))
+    return cases
+
+
+# Pipeline configurations to compare; each gets a fresh LLM provider
+VARIANTS: Dict[str, Callable[[LLMProvider, str], DisputeResolutionPipeline]] = {
+    "default": lambda llm, model: DisputeResolutionPipeline(model=model, llm=llm),
+    "no_rules": lambda llm, model: DisputeResolutionPipeline(model=model, llm=llm, rule_check=False),
+    "no_cascade": lambda llm, model: DisputeResolutionPipeline(model=model, llm=llm, cascade=ModelCascade([model])),
+    "no_analysis": lambda llm, model: DisputeResolutionPipeline(model=model, llm=llm, analyze_conversation=False),
+    "mini_only": lambda llm, model: DisputeResolutionPipeline(model="gpt-4o-mini", llm=llm,
+                                                              cascade=ModelCascade(["gpt-4o-mini"])),
+}
+
+
+def run_case(pipeline: DisputeResolutionPipeline, case: EvalCase) -> Dict:
+    start = time.perf_counter()
+    row = {"case": case.case_id, "expected_tool": case.expected_tool, "expected_escalate": case.expected_escalate}
+    try:
+        result = pipeline.process_dispute(case.conversation_chain, case.buyer_pdf, case.seller_pdf)
+        row.update(selected_tool=result["selected_tool"], escalate=result["escalate"], decided_by=result["decided_by"],
+                   model=result["model"], partial=result["partial"], error=None)
+    except Exception as e:
+        row.update(selected_tool=None, escalate=None, decided_by=None, model=None, partial=False,
+                   error=f"{type(e).__name__}: {e}")
+    row["latency_s"] = time.perf_counter() - start
+    row["correct"] = row["selected_tool"] == case.expected_tool
+    return row
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(rows: List[Dict], usage: Dict[str, Dict[str, float]]) -> Dict:
+    """Accuracy, escalation precision/recall, latency and token totals of one variant."""
+    predicted = [row for row in rows if row["escalate"]]
+    expected = [row for row in rows if row["expected_escalate"]]
+    true_positives = sum(1 for row in predicted if row["expected_escalate"])
+    latencies = [row["latency_s"] for row in rows]
+    prompt_tokens = sum(model_usage["prompt_tokens"] for model_usage in usage.values())
+    completion_tokens = sum(model_usage["completion_tokens"] for model_usage in usage.values())
+    return {
+        "cases": len(rows),
+        "accuracy": sum(row["correct"] for row in rows) / len(rows),
+        "escalation_precision": true_positives / len(predicted) if predicted else None,
+        "escalation_recall": true_positives / len(expected) if expected else None,
+        "errors": sum(1 for row in rows if row["error"]),
+        "partial": sum(1 for row in rows if row["partial"]),
+        "latency_mean_s": statistics.mean(latencies),
+        "latency_p50_s": _percentile(latencies, 0.5),
+        "latency_p95_s": _percentile(latencies, 0.95),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_case": (prompt_tokens + completion_tokens) / len(rows),
+        "decided_by": dict(Counter(row["decided_by"] or "-" for row in rows)),
+        "llm_usage": usage,
+    }
+
+
+def evaluate(variant: str, cases: List[EvalCase], model: str, provider: str, cache: bool, concurrency: int) -> Dict:
+    llm = create_llm_provider(provider)
+    if not cache:
+        llm.cache = None
+    pipeline = VARIANTS[variant](llm, model)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        rows = list(executor.map(lambda case: run_case(pipeline, case), cases))
+    return {"summary": summarize(rows, llm.usage()), "rows": rows}
+
+
+def warm_ocr(cases: List[EvalCase]):
+    """OCR every distinct proof once so all variants start from the same cached text."""
+    scanner = OCRScanner()
+    if scanner.cache is None:
+        print("Shared cache disabled: OCR runs (and is timed) in every variant.")
+        return
+    paths = sorted({path for case in cases for path in (case.buyer_pdf, case.seller_pdf)})
+    start = time.perf_counter()
+    for path in paths:
+        try:
+            scanner.convert_pdf_to_markdown(path)
+        except Exception as e:
+            print(f"OCR warmup of {os.path.basename(path)} failed: {e}")
+    print(f"Warmed OCR for {len(paths)} documents in {time.perf_counter() - start:.1f}s")
+
+
+def print_report(report: Dict[str, Dict]):
+    def fmt(value, pattern):
+        return "-" if value is None else pattern.format(value)
+
+    print(f"\n{'variant':<14} {'accuracy':>8} {'esc prec':>8} {'esc rec':>8} {'mean s':>7} {'p50 s':>7} {'p95 s':>7} "
+          f"{'tokens/case':>11} {'errors':>6}  decided by")
+    for variant, result in report.items():
+        s = result["summary"]
+        decided = ", ".join(f"{source}={count}" for source, count in s["decided_by"].items())
+        print(f"{variant:<14} {s['accuracy']:>8.1%} {fmt(s['escalation_precision'], '{:.1%}'):>8} "
+              f"{fmt(s['escalation_recall'], '{:.1%}'):>8} {s['latency_mean_s']:>7.2f} {s['latency_p50_s']:>7.2f} "
+              f"{s['latency_p95_s']:>7.2f} {s['tokens_per_case']:>11.0f} {s['errors']:>6}  {decided}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dispute pipeline variants on a labeled evaluation set.")
+    parser.add_argument("--variants", default="default,no_rules,no_cascade",
+                        help=f"Comma-separated variants: {', '.join(VARIANTS)}.")
+    parser.add_argument("--model", default="gpt-4o", help="Final model of the resolution cascade.")
+    parser.add_argument("--provider", help="LLM backend for every variant (default: LLM_PROVIDER).")
+    parser.add_argument("--cache", action="store_true", help="Keep the temperature-0 response cache on.")
+    parser.add_argument("--repeat", type=int, default=1, help="Run the evaluation set this many times per variant.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Cases run at once (1 gives the cleanest latencies).")
+    parser.add_argument("--cases", help="Only run cases whose id contains this text, e.g. 'forged'.")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Skip the OCR warmup.")
+    parser.add_argument("--json", dest="json_path", help="Write summaries and per-case rows to this file.")
+    args = parser.parse_args()
+
+    variants = [variant.strip() for variant in args.variants.split(",") if variant.strip()]
+    unknown = [variant for variant in variants if variant not in VARIANTS]
+    if unknown:
+        parser.error(f"Unknown variants {unknown}; choose from {list(VARIANTS)}")
+    cases = [case for case in build_eval_set() if not args.cases or args.cases in case.case_id] * args.repeat
+    if not cases:
+        parser.error("No cases selected")
+
+    print(f"{len(cases)} cases x {len(variants)} variants")
+    if args.warmup:
+        warm_ocr(cases)
+
+    report = {}
+    for variant in variants:
+        print(f"Running {variant}...")
+        report[variant] = evaluate(variant, cases, args.model, args.provider, args.cache, args.concurrency)
+        for row in report[variant]["rows"]:
+            if not row["correct"]:
+                print(f"  {row['case']}: expected {row['expected_tool']}, got {row['selected_tool']}"
+                      + (f" ({row['error']})" if row["error"] else ""))
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"model": args.model, "variants": report}, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
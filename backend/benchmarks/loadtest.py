@@ -0,0 +1,310 @@
+"""
+Load-test harness for the backend endpoints.
+
+Drives /fraud_detection_firewall, /analyze_conversation, /embed, /ocrscanner
+and /resolve_dispute with payloads built from the PDFs in backend/data/ and
+sample chats, ramping closed-loop concurrency step by step. For every endpoint
+it reports throughput, p50/p95/p99 latency, error rate and the saturation point
+(the concurrency after which throughput stops growing or p95 latency blows up).
+
+Usage (from the backend folder):
+    # Start local provider stand-ins and the backend, then ramp each endpoint separately
+    python -m benchmarks.loadtest --spawn --openai-latency-ms 400 --gemini-latency-ms 1200
+
+    # Realistic weighted mix against an already running server
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --mix --concurrency 1,4,16,64 --step-seconds 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+
+# Buyer/seller proof pairs from backend/data/
+DISPUTE_CASES = [
+    ("GXBank Transaction buyer.pdf", "GXBank Transaction seller.pdf"),
+    ("GXBank Transaction buyer fake.pdf", "GXBank Transaction seller.pdf"),
+]
+OCR_DOCUMENTS = [
+    "GXBank Transaction buyer.pdf",
+    "GXBank Transaction seller.pdf",
+    "GXBank Transaction buyer fake.pdf",
+]
+
+# Chats in the format the frontend sends: a JSON list of {user, text}
+SAMPLE_CHATS = [
+    [
+        {"user": "Buyer", "text": "I sent RM1.00 by QR transfer yesterday but you have not released the item."},
+        {"user": "Seller", "text": "I don't see any payment from you in my account."},
+        {"user": "Buyer", "text": "Here is my receipt, the transaction ID is 3e5ee129ed634d0682f467e12498c831."},
+        {"user": "Seller", "text": "Let me check my statement again."},
+    ],
+    [
+        {"user": "Buyer", "text": "Paid already, please send the code."},
+        {"user": "Seller", "text": "Received, thanks! Sending now."},
+    ],
+    [
+        {"user": "Buyer", "text": "The item never arrived and you stopped replying. I want a refund."},
+        {"user": "Seller", "text": "It is out of stock, sorry."},
+        {"user": "Buyer", "text": "Then refund me the RM2.00 I paid."},
+    ],
+]
+FIREWALL_MESSAGES = [
+    "Hi, is the item still available?",
+    "I have paid, please check.",
+    "Contact me on WhatsApp, this chat is not secure.",
+    "Act fast! Limited time offer!",
+    "Can you send me your login details so I can verify the payment?",
+    "Thanks, received the item.",
+]
+
+ENDPOINTS = ["fraud_detection_firewall", "analyze_conversation", "embed", "ocrscanner", "resolve_dispute"]
+# Weighted mix approximating real traffic: chat messages dominate, disputes are rare
+DEFAULT_MIX = {"fraud_detection_firewall": 50, "analyze_conversation": 15, "embed": 20, "ocrscanner": 10, "resolve_dispute": 5}
+
+
+class RequestFactory:
+    """Builds randomized requests per endpoint from the sample data."""
+
+    def __init__(self, unique: bool = True):
+        # Unique payloads keep caches and idempotent replay from hiding the real work
+        self.unique = unique
+        self.pdfs = {}
+        for name in set(OCR_DOCUMENTS) | {name for pair in DISPUTE_CASES for name in pair}:
+            with open(os.path.join(DATA_DIR, name), "rb") as f:
+                self.pdfs[name] = f.read()
+
+    def _nonce(self) -> str:
+        return f" [{uuid.uuid4().hex[:8]}]" if self.unique else ""
+
+    def _pdf(self, name: str) -> bytes:
+        # Bytes after %%EOF are ignored by PDF readers but change the OCR cache key
+        pdf = self.pdfs[name]
+        return pdf + f"\n%{self._nonce().strip()}\n".encode() if self.unique else pdf
+
+    def _chat(self) -> str:
+        chat = [dict(message) for message in random.choice(SAMPLE_CHATS)]
+        chat[-1]["text"] += self._nonce()
+        return json.dumps(chat)
+
+    def build(self, endpoint: str) -> Dict:
+        if endpoint == "fraud_detection_firewall":
+            return {"json": {"text": random.choice(FIREWALL_MESSAGES) + self._nonce(), "warning_count": 0}}
+        if endpoint == "analyze_conversation":
+            return {"json": {"context": self._chat()}}
+        if endpoint == "embed":
+            return {"json": {"text": random.choice(FIREWALL_MESSAGES) + self._nonce()}}
+        if endpoint == "ocrscanner":
+            name = random.choice(OCR_DOCUMENTS)
+            return {"files": {"file": (name, self._pdf(name), "application/pdf")}}
+        if endpoint == "resolve_dispute":
+            buyer, seller = random.choice(DISPUTE_CASES)
+            return {
+                "data": {"conversation_chain": self._chat()},
+                "files": {
+                    "pdf_file_buyer": (buyer, self._pdf(buyer), "application/pdf"),
+                    "pdf_file_seller": (seller, self._pdf(seller), "application/pdf"),
+                },
+            }
+        raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+async def run_step(client: httpx.AsyncClient, factory: RequestFactory, mix: Dict[str, float],
+                   concurrency: int, duration: float) -> List[Tuple[str, float, bool]]:
+    """Run `concurrency` closed-loop workers for `duration` seconds; return (endpoint, latency, ok) samples."""
+    samples: List[Tuple[str, float, bool]] = []
+    endpoints, weights = zip(*mix.items())
+    stop_at = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            endpoint = random.choices(endpoints, weights)[0]
+            request = factory.build(endpoint)
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"/{endpoint}", **request)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.append((endpoint, time.perf_counter() - start, ok))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def summarize(samples: List[Tuple[str, float, bool]], duration: float) -> Dict[str, Dict]:
+    summary = {}
+    for endpoint in sorted({sample[0] for sample in samples}):
+        latencies = sorted(latency for name, latency, _ in samples if name == endpoint)
+        errors = sum(1 for name, _, ok in samples if name == endpoint and not ok)
+        summary[endpoint] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "error_rate": errors / len(latencies),
+            "throughput_rps": (len(latencies) - errors) / duration,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    return summary
+
+
+def find_saturation(steps: List[Dict], endpoint: str, min_gain: float = 0.10, latency_factor: float = 2.0) -> Optional[int]:
+    """
+    Return the highest concurrency that still paid off: the next step either
+    raised throughput by less than `min_gain` or pushed p95 above
+    `latency_factor` times the lowest-concurrency p95. None if never saturated.
+    """
+    points = [(step["concurrency"], step["endpoints"][endpoint]) for step in steps if endpoint in step["endpoints"]]
+    if not points:
+        return None
+    baseline_p95 = points[0][1]["p95_ms"]
+    for (concurrency, stats), (_, next_stats) in zip(points, points[1:]):
+        gain = (next_stats["throughput_rps"] - stats["throughput_rps"]) / max(stats["throughput_rps"], 1e-9)
+        if gain < min_gain or next_stats["p95_ms"] > latency_factor * baseline_p95:
+            return concurrency
+    return None
+
+
+async def ramp(url: str, mix: Dict[str, float], levels: List[int], step_seconds: float, unique: bool, timeout: float) -> List[Dict]:
+    factory = RequestFactory(unique=unique)
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    steps = []
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        for concurrency in levels:
+            samples = await run_step(client, factory, mix, concurrency, step_seconds)
+            steps.append({"concurrency": concurrency, "endpoints": summarize(samples, step_seconds)})
+            print_step(steps[-1])
+    return steps
+
+
+def print_step(step: Dict):
+    for endpoint, stats in step["endpoints"].items():
+        print(f"  c={step['concurrency']:<4} {endpoint:<26} {stats['throughput_rps']:>8.2f} rps "
+              f"p50 {stats['p50_ms']:>8.1f}  p95 {stats['p95_ms']:>8.1f}  p99 {stats['p99_ms']:>8.1f} ms  "
+              f"errors {stats['error_rate']:.1%}")
+
+
+def wait_until_ready(url: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def spawn_stack(args, cache_dir: str) -> List[subprocess.Popen]:
+    """
+    Start the mock providers (or a cassette replay) and a backend wired to them.
+    The backend's SharedCache lives in `cache_dir`, so every run starts cold.
+    """
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    if args.replay:
+        command = [sys.executable, "-m", "benchmarks.cassettes", "replay", "--cassette", args.replay,
+                   "--port", str(args.mock_port), "--latency", args.replay_latency]
+    else:
+        command = [sys.executable, "-m", "benchmarks.mock_providers", "--port", str(args.mock_port),
+                   "--openai-latency-ms", str(args.openai_latency_ms), "--gemini-latency-ms", str(args.gemini_latency_ms),
+                   "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate)]
+    mock = subprocess.Popen(command, cwd=BACKEND_DIR)
+    wait_until_ready(f"{mock_url}/stats")
+
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"{mock_url}/v1",
+        GEMINI_API_ENDPOINT=mock_url,
+        SUPABASE_URL=mock_url,
+        OPENAI_API_KEY="mock",
+        GEMINI_API_KEY="mock",
+        SHARED_CACHE_PATH=os.path.join(cache_dir, "shared_cache.sqlite3"),
+    )
+    port = args.url.rsplit(":", 1)[-1].strip("/")
+    command = [sys.executable, "main.py", "--port", port]
+    if args.workers > 1:
+        command += ["--prod", "--workers", str(args.workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", port, "--log-level", "warning"]
+    backend = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    wait_until_ready(f"{args.url}/metrics")
+    return [backend, mock]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the backend's throughput ceiling per endpoint.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints to test.")
+    parser.add_argument("--mix", action="store_true", help="Ramp a weighted mix of all endpoints instead of each one alone.")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated concurrency levels.")
+    parser.add_argument("--step-seconds", type=float, default=15)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--no-unique", dest="unique", action="store_false", help="Repeat identical payloads (measures cache hits).")
+    parser.add_argument("--json", dest="json_path", help="Write all steps and saturation points to this file.")
+    parser.add_argument("--spawn", action="store_true", help="Start mock providers and the backend locally.")
+    parser.add_argument("--workers", type=int, default=1, help="Backend workers when spawning (>1 uses --prod).")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--gemini-latency-ms", type=float, default=1200)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--replay", help="Serve providers from this cassette instead of the mocks (see benchmarks/cassettes.py).")
+    parser.add_argument("--replay-latency", choices=["original", "zero"], default="original")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    endpoints = [endpoint.strip("/ ") for endpoint in args.endpoints.split(",")]
+    cache_dir = tempfile.mkdtemp(prefix="loadtest_cache_")
+    processes = spawn_stack(args, cache_dir) if args.spawn else []
+    report = {"url": args.url, "levels": levels, "runs": {}, "saturation": {}}
+    try:
+        if args.mix:
+            mix = {endpoint: DEFAULT_MIX.get(endpoint, 1) for endpoint in endpoints}
+            print(f"Ramping weighted mix {mix}")
+            steps = asyncio.run(ramp(args.url, mix, levels, args.step_seconds, args.unique, args.timeout))
+            report["runs"]["mix"] = steps
+            report["saturation"] = {endpoint: find_saturation(steps, endpoint) for endpoint in endpoints}
+        else:
+            for endpoint in endpoints:
+                print(f"Ramping /{endpoint}")
+                steps = asyncio.run(ramp(args.url, {endpoint: 1}, levels, args.step_seconds, args.unique, args.timeout))
+                report["runs"][endpoint] = steps
+                report["saturation"][endpoint] = find_saturation(steps, endpoint)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print("\nSaturation points (concurrency beyond which throughput stops scaling):")
+    for endpoint, level in report["saturation"].items():
+        print(f"  /{endpoint:<26} {level if level is not None else f'not reached (>{levels[-1]})'}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
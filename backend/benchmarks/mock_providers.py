@@ -0,0 +1,222 @@
+"""
+Local stand-ins for the OpenAI and Gemini APIs, with configurable latency and
+error rates, so the backend can be load-tested without network access or cost.
+
+Serves:
+  POST /v1/chat/completions                      (OpenAI chat)
+  POST /v1/embeddings                            (OpenAI embeddings, float or base64)
+  POST /v1/audio/transcriptions                  (OpenAI Whisper)
+  POST /v1beta/models/{model}:generateContent    (Gemini REST, used by OCRScanner)
+
+Usage (from the backend folder):
+    python -m benchmarks.mock_providers --port 9100 --openai-latency-ms 400 --gemini-latency-ms 1200 --error-rate 0.01
+
+Then start the backend with:
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 GEMINI_API_ENDPOINT=http://127.0.0.1:9100 \\
+    OPENAI_API_KEY=mock GEMINI_API_KEY=mock python main.py
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# OCR text in the layout of the GXBank receipts in backend/data/
+GXBANK_RECEIPT = """-RM1.00
+
+QR transfer to **Lim Jack Sheng** is successful
+
+08 Feb 2025, 10:38 PM
+
+Recipient reference
+Transfer
+
+Transaction ID
+3e5ee129ed634d0682f467e12498c831
+"""
+
+
+@dataclass
+class LatencyProfile:
+    latency_ms: float
+    jitter_ms: float
+    error_rate: float
+
+    async def delay(self):
+        latency = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(latency)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def _error_response(provider: str) -> JSONResponse:
+    status = random.choice([429, 500, 503])
+    return JSONResponse(status_code=status, content={"error": {"message": f"Mock {provider} error", "code": status}})
+
+
+def _receipt_fields(sender, recipient) -> dict:
+    return {"transaction_id": "3e5ee129ed634d0682f467e12498c831", "amount": "RM1.00", "date": "08 Feb 2025, 10:38 PM",
+            "sender": sender, "recipient": recipient, "reference": "Transfer"}
+
+
+def _chat_answer(messages, response_format=None) -> str:
+    """Pick a plausible deterministic answer from the prompt the backend sent."""
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    if "Payment Fraud Analyst" in prompt or "payment fraud analyst" in prompt:
+        summary = ("Both proofs show the same transaction ID, amount and date, and the conversation raises no conflicting details. "
+                   "The transfer is consistent and complete.")
+        if response_format and response_format.get("type") == "json_schema":
+            return json.dumps({
+                "summary": summary, "selected_tool": "allGood", "escalate": False, "confidence": 0.9,
+                "proof_buyer": _receipt_fields("Sim Sze Yu", "Lim Jack Sheng"),
+                "proof_seller": _receipt_fields("Sim Sze Yu", "Lim Jack Sheng"),
+            })
+        return summary + "\nselected_tool: allGood"
+    tool = None
+    if "conversation analysis" in prompt:
+        tool = "refundBuyer" if "refund" in prompt.lower() else "neutralIssue"
+    elif "tool selection" in prompt:
+        tool = "allGood"
+    if tool is None:
+        return "OK"
+    if response_format and response_format.get("type") == "json_schema":
+        return json.dumps({"selected_tool": tool})
+    return tool
+
+
+def _logprobs(text: str, logprob: float = -0.01) -> dict:
+    """Fake per-token logprobs (4 characters per token) in the OpenAI response shape."""
+    return {"content": [{"token": text[i:i + 4], "logprob": logprob, "bytes": None, "top_logprobs": []}
+                        for i in range(0, len(text), 4)]}
+
+
+async def _stream_chunks(model: str, content: str, logprobs: bool = False, piece: int = 8, delay: float = 0.01):
+    """Yield `content` as OpenAI chat.completion.chunk SSE events."""
+    base = {"id": "chatcmpl-mock-stream", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+    for start in range(0, len(content), piece):
+        delta = {"content": content[start:start + piece]}
+        choice = {"index": 0, "delta": delta, "finish_reason": None}
+        if logprobs:
+            choice["logprobs"] = _logprobs(delta["content"])
+        yield f"data: {json.dumps({**base, 'choices': [choice]})}\n\n"
+        await asyncio.sleep(delay)
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def _embedding(text: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype("<f4")
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(openai_profile: LatencyProfile, gemini_profile: LatencyProfile) -> FastAPI:
+    app = FastAPI(title="Mock providers")
+    state = {"requests": 0, "errors": 0, "started": time.time()}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        await openai_profile.delay()
+        if openai_profile.should_fail():
+            state["errors"] += 1
+            return _error_response("openai")
+        content = _chat_answer(body.get("messages", []), body.get("response_format"))
+        if body.get("stream"):
+            return StreamingResponse(_stream_chunks(body.get("model", "mock"), content, bool(body.get("logprobs"))),
+                                     media_type="text/event-stream")
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-mock-{state['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop",
+                         "logprobs": _logprobs(content) if body.get("logprobs") else None}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        await openai_profile.delay()
+        if openai_profile.should_fail():
+            state["errors"] += 1
+            return _error_response("openai")
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or 3072
+        data = []
+        for index, text in enumerate(inputs):
+            vector = _embedding(str(text), dimensions)
+            encoded = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": encoded})
+        tokens = sum(len(str(text)) for text in inputs) // 4
+        return {"object": "list", "data": data, "model": body.get("model", "mock"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        await request.body()
+        state["requests"] += 1
+        await openai_profile.delay()
+        if openai_profile.should_fail():
+            state["errors"] += 1
+            return _error_response("openai")
+        return {"text": "I paid for the item yesterday but the seller has not released it."}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate_content(model_action: str, request: Request):
+        await request.body()
+        state["requests"] += 1
+        await gemini_profile.delay()
+        if gemini_profile.should_fail():
+            state["errors"] += 1
+            return _error_response("gemini")
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": GXBANK_RECEIPT}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": 1290, "candidatesTokenCount": 60, "totalTokenCount": 1350},
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {**state, "uptime_s": time.time() - state["started"]}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local OpenAI/Gemini stand-ins.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--gemini-latency-ms", type=float, default=1200)
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Standard deviation of the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/5xx.")
+    args = parser.parse_args()
+
+    app = create_app(
+        LatencyProfile(args.openai_latency_ms, args.jitter_ms, args.error_rate),
+        LatencyProfile(args.gemini_latency_ms, args.jitter_ms, args.error_rate),
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
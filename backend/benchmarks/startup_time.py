@@ -0,0 +1,112 @@
+"""
+Startup-time benchmark: measures the import cost of the server and of each
+backend module in a fresh interpreter using `python -X importtime`.
+
+Usage (from the backend folder):
+    python -m benchmarks.startup_time
+    python -m benchmarks.startup_time --repeat 5 --json startup.json --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules tracked individually, heaviest entry point first
+MODULES = [
+    "main",
+    "utils.DisputeResolutionPipeline",
+    "utils.OCRScanner",
+    "utils.FraudDetection",
+    "utils.MarkitdownTool",
+    "utils.OpenAIModel",
+    "utils.ToolsSelectionAgent",
+    "utils.ConversationAnalysisAgent",
+    "utils.ProviderClients",
+]
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def measure_import(module: str) -> Dict:
+    """
+    Import `module` in a fresh interpreter and parse the `-X importtime` report.
+    :return: Total cumulative import time in ms and the slowest top-level dependencies.
+    """
+    env = dict(os.environ, WARMUP_ON_STARTUP="0")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    total_us = 0
+    top_level: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, name = int(match.group(2)), match.group(3)
+        if name == module:
+            total_us = cumulative_us
+        # Attribute cost to top-level packages, excluding the package being measured
+        root = name.split(".")[0]
+        if root != module.split(".")[0]:
+            top_level[root] = max(top_level.get(root, 0), cumulative_us)
+
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "slowest_dependencies_ms": {name: us / 1000 for name, us in slowest},
+    }
+
+
+def run(modules: List[str], repeat: int) -> List[Dict]:
+    results = []
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        median_ms = statistics.median(run["total_ms"] for run in runs)
+        results.append({
+            "module": module,
+            "median_ms": round(median_ms, 1),
+            "min_ms": round(min(run["total_ms"] for run in runs), 1),
+            "slowest_dependencies_ms": runs[-1]["slowest_dependencies_ms"],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Track import cost per backend module.")
+    parser.add_argument("modules", nargs="*", default=MODULES, help="Modules to measure (default: all tracked modules).")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module; the median is reported.")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this JSON file.")
+    parser.add_argument("--budget-ms", type=float, help="Exit non-zero if importing `main` takes longer than this.")
+    args = parser.parse_args()
+
+    results = run(args.modules, args.repeat)
+
+    print(f"{'module':<38} {'median ms':>10} {'min ms':>8}  slowest dependencies")
+    for result in results:
+        deps = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result["slowest_dependencies_ms"].items())
+        print(f"{result['module']:<38} {result['median_ms']:>10.1f} {result['min_ms']:>8.1f}  {deps}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.budget_ms is not None:
+        main_result = next((r for r in results if r["module"] == "main"), None)
+        if main_result and main_result["median_ms"] > args.budget_ms:
+            print(f"Import of main took {main_result['median_ms']:.1f} ms, over the {args.budget_ms:.0f} ms budget.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
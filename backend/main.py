@@ -1,7 +1,18 @@
 import os
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse, ORJSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Union
 from dotenv import load_dotenv
 import uvicorn
 
@@ -16,8 +27,125 @@ from utils.FraudDetection import FraudDetector
 from utils.OCRScanner import OCRScanner
 from utils.DisputeResolutionPipeline import DisputeResolutionPipeline
 from utils.ConversationAnalysisAgent import ConversationAnalysisAgent
+from utils.IncrementalConversationAnalyzer import IncrementalConversationAnalyzer
+from utils.SpeculativeAnalyzer import SpeculativeAnalyzer
+from utils.PromptCompactor import PromptCompactor
+from utils.ProviderClients import get_provider_clients
+from utils.Metrics import metrics, MetricsRegistry
+from utils.RequestProfiler import RequestProfiler, span
+from utils.SharedCache import content_hash, get_shared_cache
+from utils.IdempotencyStore import IdempotencyStore, IdempotencyConflict
+from utils.EmbeddingFormats import negotiate_embedding_format, decode_float32, to_float16_bytes, FLOAT16_MEDIA_TYPE
 
-app = FastAPI()
+# -------------------------------
+# Shared components, built on first use or during lifespan warmup.
+# Heavy SDKs (OpenAI, Gemini, PyMuPDF, semantic-router, markitdown) load here
+# rather than when this module is imported.
+# -------------------------------
+
+@lru_cache(maxsize=None)
+def get_tool_agent() -> ToolsSelectionAgent:
+    return ToolsSelectionAgent()
+
+@lru_cache(maxsize=None)
+def get_openai_model() -> OpenAIModel:
+    return OpenAIModel()
+
+@lru_cache(maxsize=None)
+def get_conversation_agent() -> ConversationAnalysisAgent:
+    return ConversationAnalysisAgent()
+
+@lru_cache(maxsize=None)
+def get_conversation_analyzer() -> IncrementalConversationAnalyzer:
+    return IncrementalConversationAnalyzer(get_conversation_agent())
+
+@lru_cache(maxsize=None)
+def get_speculative_analyzer() -> Optional[SpeculativeAnalyzer]:
+    if os.getenv("SPECULATIVE_ANALYSIS", "1") != "1":
+        return None
+    return SpeculativeAnalyzer(get_conversation_analyzer())
+
+@lru_cache(maxsize=None)
+def get_fraud_detector() -> FraudDetector:
+    # Route utterances are embedded once here instead of on every request
+    return FraudDetector()
+
+@lru_cache(maxsize=None)
+def get_markitdown_converter() -> MarkItDownConverter:
+    return MarkItDownConverter()
+
+@lru_cache(maxsize=None)
+def get_ocr_scanner() -> OCRScanner:
+    return OCRScanner()
+
+@lru_cache(maxsize=None)
+def get_dispute_pipeline() -> DisputeResolutionPipeline:
+    # gpt-4o is the last tier; cheaper models from DISPUTE_CASCADE_MODELS are tried first
+    return DisputeResolutionPipeline(model="gpt-4o", tools_agent=get_tool_agent(), ocr_scanner=get_ocr_scanner(),
+                                     conversation_agent=get_conversation_agent())
+
+def warmup():
+    """
+    Build every shared component ahead of the first request. A component that
+    cannot be built (e.g. a missing API key) is reported and retried lazily.
+    """
+    for factory in (get_tool_agent, get_openai_model, get_conversation_agent,
+                    get_markitdown_converter, get_ocr_scanner, get_fraud_detector,
+                    get_dispute_pipeline, get_conversation_analyzer):
+        try:
+            factory()
+        except Exception as e:
+            print(f"Warmup of {factory.__name__} failed: {e}")
+    # Load the tokenizer used for dispute prompt compaction (falls back to an estimate if unavailable)
+    PromptCompactor(model="gpt-4o").count_tokens("")
+    # Embed the classifiers' examples (served from the shared cache after the first start)
+    try:
+        classifiers = [get_conversation_agent().classifier, get_conversation_analyzer().classifier]
+        if get_tool_agent().use_classifier:
+            classifiers.append(get_tool_agent().classifier_for(get_dispute_pipeline().available_tools))
+        for classifier in classifiers:
+            if classifier is not None:
+                classifier.prepare()
+    except Exception as e:
+        print(f"Warmup of the embedding classifiers failed: {e}")
+
+# Each worker process keeps its own metrics; they are published to the SharedCache
+# under the worker's pid so /metrics can report the sum over all workers.
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+
+def publish_metrics():
+    cache = get_shared_cache()
+    if cache is not None:
+        # Snapshots of workers that stopped publishing (exited or restarted) expire
+        cache.set("metrics", str(os.getpid()), metrics.snapshot(), ttl=3 * METRICS_PUBLISH_INTERVAL)
+
+async def publish_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+        try:
+            await run_in_threadpool(publish_metrics)
+        except Exception as e:
+            print(f"Publishing metrics failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("WARMUP_ON_STARTUP", "1") == "1":
+        warmup()
+    cache = get_shared_cache()
+    if cache is not None:
+        # Afterwards every SHARED_CACHE_PURGE_EVERY writes
+        try:
+            removed = await run_in_threadpool(cache.purge)
+            print(f"Shared cache purge removed {removed} entries")
+        except Exception as e:
+            print(f"Shared cache purge failed: {e}")
+    publisher = asyncio.create_task(publish_metrics_periodically())
+    yield
+    publisher.cancel()
+    # Release pooled provider connections on shutdown
+    get_provider_clients().close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS (adjust allowed origins as needed)
 app.add_middleware(
@@ -28,17 +156,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Instantiate the imported classes
-tool_agent = ToolsSelectionAgent()
-openai_model = OpenAIModel()
-agent = ConversationAnalysisAgent()
+# Route paths used as the endpoint label, filled on the first request
+_metric_endpoints = set()
+profiler = RequestProfiler()
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Record per-endpoint latency and in-flight requests. Unknown paths are
+    grouped under "other" to keep label cardinality bounded.
+    Requests sent with `X-Profile: 1` (or `?profile=1`) and a valid
+    `X-Profile-Token` are profiled; the artifact id is returned in `X-Profile-Id`.
+    """
+    if not _metric_endpoints:
+        _metric_endpoints.update(route.path for route in app.routes)
+    path = request.url.path
+    endpoint = path if path in _metric_endpoints else "other"
+
+    profile = None
+    if RequestProfiler.is_requested(request.headers, request.query_params):
+        if not profiler.is_authorized(request.headers.get("x-profile-token")):
+            return JSONResponse(status_code=403, content={"detail": "Profiling not allowed for this caller."})
+        profile = profiler.start(f"{request.method} {path}")
+
+    metrics.http_requests_in_flight.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    status = 500
+
+    def finish():
+        # Runs once the body has been sent, so streamed responses are measured to their last event
+        if profile is not None:
+            profiler.finish(profile)
+        metrics.http_request_duration.observe(
+            time.perf_counter() - start, endpoint=endpoint, method=request.method, status=status
+        )
+        metrics.http_requests_in_flight.dec(endpoint=endpoint)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish()
+        raise
+    finally:
+        if profile is not None:
+            profiler.detach(profile)
+    status = response.status_code
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+        response.headers["X-Profile-Url"] = f"/profiles/{profile.id}"
+
+    body_iterator = response.body_iterator
+
+    async def body_then_finish():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish()
+
+    response.body_iterator = body_then_finish()
+    return response
 
 # -------------------------------
 # Pydantic Models for Requests and Responses
 # -------------------------------
 
+# Texts accepted by one /embed call
+EMBED_MAX_INPUTS = int(os.getenv("EMBED_MAX_INPUTS", "2048"))
+
 class EmbeddingRequest(BaseModel):
-    text: str
+    text: Union[str, List[str]]  # one text, or a list embedded in batched, concurrent requests
+    dimensions: Optional[int] = Field(default=None, gt=0)  # shortened vector, e.g. 256 or 1024
+    format: Optional[str] = None  # "json", "base64" (float32) or "float16"; defaults to the Accept header
 
 class ToolSelectionRequest(BaseModel):
     context: str
@@ -58,22 +247,108 @@ class DisputeResolutionResponse(BaseModel):
     resolution: str
     selected_tool: str
     escalate: bool
+    proof_fields: Optional[Dict[str, Dict[str, Optional[str]]]] = None  # Fields read from each proof
+    conversation_analysis: Optional[str] = None
+    decided_by: Optional[str] = None  # "rules" when the proofs settled it without the LLM
+    prompt_tokens: Optional[Dict[str, int]] = None  # Before/after/saved by prompt compaction
+    model: Optional[str] = None  # Cascade tier that resolved the dispute
+    confidence: Optional[float] = None
+    stage_timings: Dict[str, Dict[str, Any]] = {}  # Start offset, duration and status per stage
+    partial: bool = False  # True when the deadline ran out before every stage finished
+    timed_out_stage: Optional[str] = None
 
 # -------------------------------
 # FastAPI Endpoints
 # -------------------------------
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Endpoint exposing latency histograms, provider calls, cache hit ratios and
+    in-flight gauges in the Prometheus text format, summed over all worker
+    processes (published every METRICS_PUBLISH_INTERVAL seconds through the
+    SharedCache). Without the SharedCache only the answering worker is reported.
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+    # This worker's own numbers are always current; the others' are at most one interval old
+    await run_in_threadpool(publish_metrics)
+    snapshots = await run_in_threadpool(cache.values, "metrics")
+    body = f"# workers {len(snapshots)}\n" + MetricsRegistry.combined(snapshots).render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request):
+    """
+    Endpoint to download a saved request profile (span breakdown and collapsed stacks).
+    """
+    if not profiler.is_authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Profiling not allowed for this caller.")
+    path = profiler.artifact_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+
 @app.post("/embed")
-async def embed_text(request: EmbeddingRequest):
+async def embed_text(request: EmbeddingRequest, http_request: Request):
     """
-    Endpoint to create an embedding for the provided text.
+    Endpoint to create an embedding for the provided text, or one per text of a list.
+    The response format is negotiated from `format` or the Accept header:
+      - json (default): {"embedding": [floats], "dimensions": n}, serialized with orjson
+      - base64 (Accept: application/x-embedding-base64): {"embedding": "<base64 float32>", ...}
+      - float16 (Accept: application/x-embedding-float16): raw little-endian float16 bytes
+    For a list, "embedding" becomes "embeddings" (in input order) and float16 vectors are
+    concatenated, with their count in the X-Embedding-Count header. Empty or
+    whitespace-only texts are rejected with 422 before anything is embedded.
     """
     try:
-        embedding = openai_model.create_embedding(request.text)
-        return {"embedding": embedding}
+        embedding_format = negotiate_embedding_format(request.format, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    texts = [request.text] if isinstance(request.text, str) else request.text
+    if not texts:
+        raise HTTPException(status_code=400, detail="No text to embed.")
+    if len(texts) > EMBED_MAX_INPUTS:
+        raise HTTPException(status_code=413, detail=f"At most {EMBED_MAX_INPUTS} texts per request.")
+    blank = [index for index, text in enumerate(texts) if not text.strip()]
+    if blank:
+        # Rejected up front: the provider would fail the whole batch over one empty input
+        raise HTTPException(status_code=422, detail=f"Texts must not be empty (positions {blank[:10]}).")
+
+    try:
+        embeddings_base64 = await run_in_threadpool(
+            get_openai_model().create_embeddings_base64, texts, request.dimensions
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if isinstance(request.text, str):
+        embedding_base64 = embeddings_base64[0]
+        vector = decode_float32(embedding_base64)
+        if embedding_format == "base64":
+            return ORJSONResponse({"embedding": embedding_base64, "encoding": "float32-base64", "dimensions": len(vector)})
+        if embedding_format == "float16":
+            return Response(
+                content=to_float16_bytes(embedding_base64),
+                media_type=FLOAT16_MEDIA_TYPE,
+                headers={"X-Embedding-Dimensions": str(len(vector)), "X-Embedding-Dtype": "float16"},
+            )
+        return ORJSONResponse({"embedding": vector, "dimensions": len(vector)})
+
+    dimensions = len(decode_float32(embeddings_base64[0]))
+    if embedding_format == "base64":
+        return ORJSONResponse({"embeddings": embeddings_base64, "encoding": "float32-base64", "dimensions": dimensions})
+    if embedding_format == "float16":
+        return Response(
+            content=b"".join(to_float16_bytes(embedding) for embedding in embeddings_base64),
+            media_type=FLOAT16_MEDIA_TYPE,
+            headers={"X-Embedding-Dimensions": str(dimensions), "X-Embedding-Count": str(len(embeddings_base64)),
+                     "X-Embedding-Dtype": "float16"},
+        )
+    return ORJSONResponse({"embeddings": [decode_float32(embedding) for embedding in embeddings_base64],
+                           "dimensions": dimensions})
+
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     """
@@ -86,7 +361,7 @@ async def transcribe_audio(file: UploadFile = File(...)):
             content = await file.read()
             f.write(content)
         
-        transcription = openai_model.transcribe_audio(file_location)
+        transcription = get_openai_model().transcribe_audio(file_location)
         os.remove(file_location)  # Clean up the temporary file
         return {"transcription": transcription}
     except Exception as e:
@@ -104,9 +379,8 @@ async def convert_pdf(file: UploadFile = File(...)):
             content = await file.read()
             f.write(content)
         
-        # Instantiate the converter and perform the conversion
-        converter = MarkItDownConverter()
-        markdown_text = converter.convert_pdf_to_markdown(temp_file)
+        # Perform the conversion with the shared converter
+        markdown_text = get_markitdown_converter().convert_pdf_to_markdown(temp_file)
         
         # Clean up the temporary file
         os.remove(temp_file)
@@ -127,13 +401,13 @@ async def ocrscanner(file: UploadFile = File(...)):
     temp_file = f"temp_{file.filename}"
     try:
         # Save the uploaded PDF file temporarily
-        with open(temp_file, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        with span("upload_read"):
+            with open(temp_file, "wb") as f:
+                content = await file.read()
+                f.write(content)
         
-        # Instantiate OCRScanner and perform the conversion
-        scanner = OCRScanner()
-        markdown_text = scanner.convert_pdf_to_markdown(temp_file)
+        # Perform the conversion with the shared OCRScanner
+        markdown_text = get_ocr_scanner().convert_pdf_to_markdown(temp_file)
         
         # Clean up the temporary file
         os.remove(temp_file)
@@ -163,7 +437,7 @@ async def analyze_text(request: FraudDetectionRequest):
     Endpoint for fraud detection analysis
     """
     try:
-        message, new_count, escalate = FraudDetector().analyze_text(
+        message, new_count, escalate = get_fraud_detector().analyze_text(
             text=request.text,
             warning_count=request.warning_count
         )
@@ -183,10 +457,34 @@ async def analyze_text(request: FraudDetectionRequest):
 # Request Model
 class ConversationAnalysisRequest(BaseModel):
     context: str
+    # Set to analyze incrementally: only messages not seen in earlier calls with the same id are processed
+    conversation_id: Optional[str] = None
 
 # Response Model
 class ConversationAnalysisResponse(BaseModel):
     selected_tool: str
+    margin: Optional[float] = None  # Top-two similarity margin of the embedding classifier
+    decided_by: Optional[str] = None  # "embedding", or "llm" when the margin was too small
+    summary: Optional[str] = None  # Running summary of the older messages (incremental analysis only)
+    version: Optional[int] = None  # Bumped each time new messages were folded in
+    message_count: Optional[int] = None
+    speculation: Optional[str] = None  # "hit", "joined" or "miss" when background analysis is enabled
+
+class ConversationMessageRequest(BaseModel):
+    conversation_id: str
+    context: str  # The whole chat including the new message, as sent to /analyze_conversation
+
+@app.post("/conversation_message", status_code=202)
+async def conversation_message(request: ConversationMessageRequest):
+    """
+    Called after each chat message: analyzes the conversation in the background once
+    it goes idle, so a later /analyze_conversation of the same chat returns immediately.
+    """
+    speculative = get_speculative_analyzer()
+    if speculative is None:
+        return {"scheduled": False}
+    version = speculative.message_arrived(request.conversation_id, request.context)
+    return {"scheduled": True, "version": version, "idle_ms": round(speculative.idle_seconds * 1000)}
 
 @app.post("/analyze_conversation", response_model=ConversationAnalysisResponse)
 async def analyze_conversation(request: ConversationAnalysisRequest):
@@ -194,8 +492,17 @@ async def analyze_conversation(request: ConversationAnalysisRequest):
     Endpoint to analyze a conversation and select the appropriate tool.
     """
     try:
-        selected_tool = agent.analyze_conversation(request.context)
-        return {"selected_tool": selected_tool}
+        if request.conversation_id:
+            speculative, outcome = get_speculative_analyzer(), None
+            if speculative is not None:
+                state, outcome = await speculative.analyze(request.conversation_id, request.context)
+            else:
+                state = await run_in_threadpool(get_conversation_analyzer().analyze, request.conversation_id, request.context)
+            return {"selected_tool": state.label, "margin": state.margin, "decided_by": state.decided_by,
+                    "summary": state.summary, "version": state.version, "message_count": state.message_count,
+                    "speculation": outcome}
+        result = await run_in_threadpool(get_conversation_agent().analyze_conversation_scored, request.context)
+        return {"selected_tool": result.label, "margin": result.margin, "decided_by": result.decided_by}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -205,57 +512,182 @@ async def select_tool(request: ToolSelectionRequest):
     Endpoint to select the most appropriate tool based on the provided context.
     """
     try:
-        selected_tool = tool_agent.select_tool(request.context, request.available_tools)
-        return {"selected_tool": selected_tool}
+        result = await run_in_threadpool(get_tool_agent().select_tool_scored, request.context, request.available_tools)
+        return {"selected_tool": result.label, "margin": result.margin, "decided_by": result.decided_by}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Completed dispute results, replayed to retries with the same idempotency key
+dispute_results = IdempotencyStore("dispute_result")
+
+def run_dispute_pipeline(conversation_chain: str, pdf_buyer: bytes, pdf_seller: bytes, on_event=None) -> dict:
+    """
+    Write the uploaded proofs to unique temporary files and run the pipeline
+    on them. Runs in the threadpool so the event loop stays free.
+    `on_event` receives the pipeline's progress events (see `process_dispute`).
+    """
+    temp_files = []
+    try:
+        for content in (pdf_buyer, pdf_seller):
+            fd, temp_file = tempfile.mkstemp(prefix="temp_", suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            temp_files.append(temp_file)
+
+        # Process the dispute with the shared pipeline
+        result = get_dispute_pipeline().process_dispute(conversation_chain, temp_files[0], temp_files[1], on_event=on_event)
+        return {
+            "resolution": result["resolution"],
+            "selected_tool": result["selected_tool"],
+            "escalate": result.get("escalate", False),
+            "proof_fields": result.get("proof_fields"),
+            "conversation_analysis": result.get("conversation_analysis"),
+            "decided_by": result.get("decided_by"),
+            "prompt_tokens": result.get("prompt_tokens"),
+            "model": result.get("model"),
+            "confidence": result.get("confidence"),
+            "stage_timings": result.get("stage_timings", {}),
+            "partial": result.get("partial", False),
+            "timed_out_stage": result.get("timed_out_stage"),
+        }
+    finally:
+        # Clean up the temporary files
+        for temp_file in temp_files:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
 @app.post("/resolve_dispute", response_model=DisputeResolutionResponse)
 async def resolve_dispute_endpoint(
+    response: Response,
     conversation_chain: str = Form(...),
     pdf_file_buyer: UploadFile = File(...),
-    pdf_file_seller: UploadFile = File(...)
+    pdf_file_seller: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(default=None),
 ):
     """
     Endpoint to process the dispute using DisputeResolutionPipeline.
+    Retries are deduplicated: the `Idempotency-Key` header (default: a hash of
+    the conversation chain and both PDFs) attaches an identical in-flight
+    request to the running computation and replays a completed result.
     """
-    temp_file1 = f"temp_{pdf_file_buyer.filename}"
-    temp_file2 = f"temp_{pdf_file_seller.filename}"
+    with span("upload_read"):
+        content1 = await pdf_file_buyer.read()
+        content2 = await pdf_file_seller.read()
+
+    fingerprint = content_hash(conversation_chain, content_hash(content1), content_hash(content2))
+    key = idempotency_key or fingerprint
     try:
-        # Save the uploaded PDF files temporarily
-        with open(temp_file1, "wb") as f1:
-            content1 = await pdf_file_buyer.read()
-            f1.write(content1)
-        
-        with open(temp_file2, "wb") as f2:
-            content2 = await pdf_file_seller.read()
-            f2.write(content2)
-        
-        # Instantiate the DisputeResolutionPipeline
-        pipeline = DisputeResolutionPipeline(model="gpt-4o")
-        
-        # Process the dispute
-        result = pipeline.process_dispute(conversation_chain, temp_file1, temp_file2)
-        
-        # Clean up the temporary files
-        os.remove(temp_file1)
-        os.remove(temp_file2)
-        
-        return DisputeResolutionResponse(
-            resolution=result["resolution"],
-            selected_tool=result["selected_tool"],
-            escalate=result.get("escalate", False)
+        result, status = await dispute_results.run(
+            key, fingerprint,
+            lambda: run_in_threadpool(run_dispute_pipeline, conversation_chain, content1, content2),
+            # A deadline-limited partial result should be recomputed on retry, not replayed
+            should_store=lambda result: not result["partial"],
         )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        # Clean up the temporary files if they exist
-        if os.path.exists(temp_file1):
-            os.remove(temp_file1)
-        if os.path.exists(temp_file2):
-            os.remove(temp_file2)
         raise HTTPException(status_code=500, detail=str(e))
 
+    response.headers["Idempotency-Key"] = key
+    response.headers["X-Idempotency-Status"] = status
+    return DisputeResolutionResponse(**result)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/resolve_dispute/stream")
+async def resolve_dispute_stream_endpoint(
+    conversation_chain: str = Form(...),
+    pdf_file_buyer: UploadFile = File(...),
+    pdf_file_seller: UploadFile = File(...),
+):
+    """
+    Streaming variant of /resolve_dispute, as Server-Sent Events:
+      - `stage`: a pipeline stage finished ({"stage", "start_ms", "duration_ms", "status"})
+      - `token`: the next piece of the resolution summary as the model writes it ({"text"})
+      - `result`: the final DisputeResolutionResponse, including selected_tool and escalate
+      - `error`: the pipeline failed ({"detail"})
+    Disputes settled by the rule-based proof check send no tokens, only the result.
+    """
+    with span("upload_read"):
+        content1 = await pdf_file_buyer.read()
+        content2 = await pdf_file_seller.read()
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: str, data: dict):
+        # Called from pipeline threads
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    async def run():
+        try:
+            result = await run_in_threadpool(run_dispute_pipeline, conversation_chain, content1, content2, on_event)
+            await events.put(("result", DisputeResolutionResponse(**result).model_dump()))
+        except Exception as e:
+            await events.put(("error", {"detail": str(e)}))
+
+    async def stream():
+        task = asyncio.create_task(run())
+        while True:
+            event, data = await events.get()
+            yield _sse(event, data)
+            if event in ("result", "error"):
+                break
+        await task
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # -------------------------------
 # To run the FastAPI server:
+#   python main.py                          # development, single worker with reload
+#   python main.py --prod --workers 4       # production, pre-warmed multi-worker
+def run_production_server(host: str, port: int, workers: int):
+    """
+    Run gunicorn with uvicorn workers. Shared read-only state (clients, fraud
+    route embeddings) is built once here, before forking, so the workers share
+    it copy-on-write; OCR and embedding caches live in the on-disk SharedCache.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    warmup()
+    # Connections opened during warmup must not be inherited by the workers
+    get_provider_clients().drop_connections()
+
+    ProductionServer(app, {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "keepalive": 75,
+        "graceful_timeout": 30,
+        "timeout": int(os.getenv("WORKER_TIMEOUT", "300")),
+    }).run()
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Run the dispute resolution API.")
+    parser.add_argument("--prod", action="store_true", help="Production mode: multiple pre-warmed workers, no reload.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count())))
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    if args.prod:
+        run_production_server(args.host, args.port, args.workers)
+    else:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
 # -------------------------------
\ No newline at end of file
@@ -1,14 +1,64 @@
-import openai
 import os
-from dotenv import load_dotenv
-from typing import Dict
+import time
+from typing import Dict, Optional
+from .LLMProvider import LLMProvider, get_llm_provider
+from .EmbeddingClassifier import EmbeddingClassifier, Classification
+from .PromptCompactor import PromptCompactor
+from .ToolChoice import tool_choice_format, validated_tool
+
+AVAILABLE_TOOLS = {
+    "refundBuyer": "The buyer has paid but the seller has not provided the agreed-upon value. A refund is required.",
+    "transactionIssues": "There are issues with the transaction itself, such as payment failures or incorrect amounts.",
+    "neutralIssue": "No dispute has been identified in the conversation. The issue is neutral or resolved."
+}
+
+# Labeled example conversations, averaged into each label's centroid
+EXAMPLES = {
+    "refundBuyer": [
+        "Buyer: I paid yesterday but the seller never released the item.\nBuyer: Please refund me.",
+        "Buyer: The seller blocked me after I transferred the money, I want my money back.",
+        "Seller: Sorry, it's out of stock.\nBuyer: Then return my payment.",
+        "Buyer: Transferred RM50 three days ago and still no code.\nBuyer: Seller stopped replying, refund please.",
+        "Buyer: The item never arrived and I want a refund.",
+    ],
+    "transactionIssues": [
+        "Buyer: I sent RM100 but the app shows only RM10 was deducted.\nSeller: I only received RM10.",
+        "Buyer: My transfer failed but the money was deducted from my account.",
+        "Seller: You underpaid, the price was RM20 and I got RM15.",
+        "Buyer: I was charged twice for the same order.",
+        "Seller: The payment hasn't reached my bank.\nBuyer: My bank says it's still processing.",
+    ],
+    "neutralIssue": [
+        "Buyer: Paid already.\nSeller: Received, thanks! Sending now.",
+        "Buyer: Is this still available?\nSeller: Yes, you can place the order.",
+        "Seller: Got your payment, item released.\nBuyer: Thanks, received.",
+        "Buyer: What time will you be online?\nSeller: Around 8pm.",
+        "Buyer: Thanks for the quick trade, will buy again.",
+    ],
+}
+
+# Conversations are cut to their first and most recent messages before embedding
+EMBEDDING_MAX_TOKENS = 2000
+# Chosen when the model's answer names no available tool
+DEFAULT_TOOL = "neutralIssue"
 
 class ConversationAnalysisAgent:
-    def __init__(self, model: str = "gpt-4o-mini"):
-        load_dotenv()
+    def __init__(self, model: str = "gpt-4o-mini", llm: Optional[LLMProvider] = None,
+                 classifier: Optional[EmbeddingClassifier] = None, use_classifier: Optional[bool] = None):
+        """
+        :param model: Model asked when the classifier is not confident (or disabled).
+        :param llm: LLM provider (default: the shared one).
+        :param classifier: Embedding classifier over AVAILABLE_TOOLS (default: built from EXAMPLES).
+        :param use_classifier: Try the classifier before the LLM (default: EMBEDDING_CLASSIFIER, on).
+        """
         self.model = model
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.api_key
+        # Shared provider (LLM_PROVIDER); its temperature-0 answers are served from the response cache
+        self.llm = llm or get_llm_provider()
+        if use_classifier is None:
+            use_classifier = os.getenv("EMBEDDING_CLASSIFIER", "1") == "1"
+        self.classifier = (classifier or EmbeddingClassifier("conversation_analysis", AVAILABLE_TOOLS, EXAMPLES)) \
+            if use_classifier else None
+        self.compactor = PromptCompactor()
 
     def analyze_conversation(self, conversation_chain: str) -> str:
         """
@@ -16,35 +66,49 @@ class ConversationAnalysisAgent:
         :param conversation_chain: The entire conversation chain as a string.
         :return: The name of the selected tool.
         """
-        available_tools = {
-            "refundBuyer": "The buyer has paid but the seller has not provided the agreed-upon value. A refund is required.",
-            "transactionIssues": "There are issues with the transaction itself, such as payment failures or incorrect amounts.",
-            "neutralIssue": "No dispute has been identified in the conversation. The issue is neutral or resolved."
-        }
+        return self.analyze_conversation_scored(conversation_chain).label
 
+    def analyze_conversation_scored(self, conversation_chain: str,
+                                    classifier: Optional[EmbeddingClassifier] = None) -> Classification:
+        """
+        Like `analyze_conversation`, also reporting the classifier margin and
+        whether the embedding classifier or the LLM decided.
+        :param classifier: Used instead of the agent's own when the text is not a raw chat
+                           (e.g. a conversation digest), so it is compared with examples of its kind.
+        """
+        if self.classifier is None:
+            start = time.perf_counter()
+            label = self._ask_llm(conversation_chain)
+            return Classification(label=label, margin=None, decided_by="llm", latency_ms=(time.perf_counter() - start) * 1000)
+        text = self.compactor.compact_conversation(conversation_chain, EMBEDDING_MAX_TOKENS)
+        return (classifier or self.classifier).classify(text, fallback=lambda: self._ask_llm(conversation_chain))
+
+    def _ask_llm(self, conversation_chain: str) -> str:
         prompt = f"""
         You are an intelligent assistant that analyzes conversations between buyers and sellers.
         Based on the conversation, you will determine which tool to use to resolve the issue.
 
         Available Tools:
-        {available_tools}
+        {AVAILABLE_TOOLS}
 
         Conversation Chain:
         {conversation_chain}
 
-        Analyze the conversation and return ONLY the name of the most suitable tool.
+        Analyze the conversation and select the most suitable tool.
         """
 
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=[
+        # The answer is constrained to AVAILABLE_TOOLS and validated once, never re-asked
+        answer = self.llm.complete(
+            [
                 {"role": "system", "content": "You are a conversation analysis assistant."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0
+            model=self.model,
+            temperature=0,
+            response_format=tool_choice_format(AVAILABLE_TOOLS),
         )
 
-        tool_name = response.choices[0].message.content.strip()
+        tool_name, _ = validated_tool(answer.content, AVAILABLE_TOOLS, default=DEFAULT_TOOL, agent="conversation_analysis")
         return tool_name
 
 # Example usage:
@@ -60,5 +124,5 @@ if __name__ == "__main__":
     Buyer: I need a refund then.
     """
 
-    selected_tool = agent.analyze_conversation(conversation_chain)
-    print(f"Selected Tool: {selected_tool}")
\ No newline at end of file
+    result = agent.analyze_conversation_scored(conversation_chain)
+    print(f"Selected Tool: {result.label} (margin {result.margin}, decided by {result.decided_by})")
\ No newline at end of file
@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from typing import Any, Callable, Dict, List, Optional
+from .Metrics import metrics
+
+# Stage calls run here so a slow call can be abandoned once its budget is spent
+_executor: Optional[ThreadPoolExecutor] = None
+# Calls hedged inside a stage (`Deadline.hedge`) run on their own pool: a stage waiting
+# on them must never wait for a slot of the pool it is itself occupying
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("STAGE_EXECUTOR_WORKERS", "32")), thread_name_prefix="stage"
+                )
+    return _executor
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("HEDGE_EXECUTOR_WORKERS", "32")), thread_name_prefix="hedge"
+                )
+    return _hedge_executor
+
+
+class StageTimeout(Exception):
+    """Raised when a stage does not finish within its budget."""
+
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Stage '{stage}' did not finish within its {budget:.1f}s budget.")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    """
+    End-to-end time budget for one request, split into per-stage budgets.
+
+    Each stage gets min(its own budget, time left overall). A stage with a
+    hedge delay gets a duplicate request to the same provider once the first
+    one has been running that long; whichever answers first wins. Calls that
+    lose or run past the budget are abandoned and finish in the background,
+    bounded by the provider client timeout. A stage made of several provider
+    calls (the model cascade) opts out and hedges each call with `hedge`.
+    """
+
+    def __init__(self, total: float, stage_budgets: Optional[Dict[str, float]] = None,
+                 hedge_after: Optional[Dict[str, float]] = None):
+        self.total = total
+        self.stage_budgets = stage_budgets or {}
+        self.hedge_after = hedge_after or {}
+        self.started = time.monotonic()
+        self.completed_stages: List[str] = []
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        """
+        Build the default dispute deadline. Budgets are in seconds, e.g.
+        DISPUTE_DEADLINE=90, DISPUTE_BUDGET_OCR=45, DISPUTE_HEDGE_RESOLVE=12.
+        A stage such as "ocr_buyer" falls back to the budget of its prefix ("ocr").
+        """
+        env = lambda name, default: float(os.getenv(name, default))
+        return cls(
+            total=env("DISPUTE_DEADLINE", "90"),
+            stage_budgets={
+                "ocr": env("DISPUTE_BUDGET_OCR", "45"),
+                "resolve": env("DISPUTE_BUDGET_RESOLVE", "35"),
+                "select_tool": env("DISPUTE_BUDGET_SELECT_TOOL", "10"),
+                "analyze": env("DISPUTE_BUDGET_ANALYZE", "10"),
+            },
+            hedge_after={
+                "resolve": env("DISPUTE_HEDGE_RESOLVE", "12"),
+                "select_tool": env("DISPUTE_HEDGE_SELECT_TOOL", "3"),
+            },
+        )
+
+    def remaining(self) -> float:
+        return self.total - (time.monotonic() - self.started)
+
+    @staticmethod
+    def _lookup(settings: Dict[str, float], stage: str) -> Optional[float]:
+        if stage in settings:
+            return settings[stage]
+        return settings.get(stage.split("_", 1)[0])
+
+    def budget_for(self, stage: str) -> float:
+        budget = self._lookup(self.stage_budgets, stage)
+        return min(budget if budget is not None else self.total, self.remaining())
+
+    def run(self, stage: str, fn: Callable[..., Any], *args, hedge: bool = True, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` as `stage` within its budget, hedging if configured.
+        :param hedge: False for stages that hedge their own provider calls (see `hedge`).
+        :raises StageTimeout: When the budget runs out before any attempt succeeds.
+        """
+        budget = self.budget_for(stage)
+        if budget <= 0:
+            metrics.stage_timeouts.inc(stage=stage)
+            raise StageTimeout(stage, 0.0)
+        stage_deadline = time.monotonic() + budget
+        executor = _get_executor()
+
+        def submit() -> Future:
+            # Copy the context so profiling spans from the worker thread are kept
+            return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+        attempts = [submit()]
+        hedge_after = self._lookup(self.hedge_after, stage) if hedge else None
+        if hedge_after is not None and hedge_after < budget:
+            done, _ = wait(attempts, timeout=hedge_after)
+            if not done:
+                attempts.append(submit())
+
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, stage_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if len(attempts) > 1:
+                        metrics.hedged_requests.inc(stage=stage, winner="hedge" if future is attempts[1] else "primary")
+                    self.completed_stages.append(stage)
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            if isinstance(error, StageTimeout):
+                # Raised by a `hedge` inside the stage that ran out of budget just before this wait did
+                metrics.stage_timeouts.inc(stage=stage)
+            raise error
+        metrics.stage_timeouts.inc(stage=stage)
+        raise StageTimeout(stage, budget)
+
+    def hedge(self, stage: str, fn: Callable[[int], Any], timeout: float,
+              preferred: Optional[Callable[[], Optional[int]]] = None) -> Any:
+        """
+        Run `fn(0)` and, if it has not finished after the stage's hedge delay, a duplicate
+        `fn(1)`; the first attempt to succeed wins. Meant for one provider call inside a
+        stage that `run` already bounds (with hedge=False), e.g. one cascade tier.
+        Attempts run on a pool of their own, not the stage pool.
+        :param timeout: What is left of the enclosing stage's budget.
+        :param preferred: Returns the attempt that must win unless it fails (e.g. the one
+                          whose output is already being streamed), or None. While it names
+                          an attempt, no hedge is started.
+        :raises StageTimeout: When `timeout` runs out first; the attempts are abandoned.
+        """
+        if timeout <= 0:
+            raise StageTimeout(stage, 0.0)
+        give_up = time.monotonic() + timeout
+        executor = _get_hedge_executor()
+        submit = lambda index: executor.submit(copy_context().run, fn, index)
+        attempts = [submit(0)]
+        hedge_after = self._lookup(self.hedge_after, stage)
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(attempts, timeout=hedge_after)
+            if not done and (preferred is None or preferred() is None):
+                attempts.append(submit(1))
+
+        results: Dict[int, Any] = {}
+        error: Optional[BaseException] = None
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, give_up - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise StageTimeout(stage, timeout)
+            for future in done:
+                if future.exception() is None:
+                    results[attempts.index(future)] = future.result()
+                else:
+                    error = future.exception()
+            owner = preferred() if preferred is not None else None
+            if owner is not None and owner < len(attempts) and not attempts[owner].done():
+                continue  # The preferred attempt is still running
+            if results:
+                winner = owner if owner in results else min(results)
+                if len(attempts) > 1:
+                    metrics.hedged_requests.inc(stage=stage, winner="hedge" if winner == 1 else "primary")
+                return results[winner]
+        raise error
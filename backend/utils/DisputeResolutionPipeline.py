@@ -1,31 +1,192 @@
-from dotenv import load_dotenv
-import openai
-from typing import Dict
-import os
+import re
+import json
+import math
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
 from .ToolsSelectionAgent import ToolsSelectionAgent
+from .ConversationAnalysisAgent import ConversationAnalysisAgent
 from .OCRScanner import OCRScanner
+from .ProofConsistencyChecker import ProofConsistencyChecker
+from .PromptCompactor import PromptCompactor, CompactedPrompt
+from .LLMProvider import LLMProvider, get_llm_provider
+from .Deadline import Deadline, StageTimeout
+from .StageGraph import StageGraph
+from .JsonFieldStreamer import JsonFieldStreamer
+from .ModelCascade import ModelCascade, get_model_cascade
+
+# -------------------------
+# Structured resolution output
+# -------------------------
+class ProofFields(BaseModel):
+    """Transaction fields the model read from one proof of transfer (None when absent)."""
+    transaction_id: Optional[str]
+    amount: Optional[str]
+    date: Optional[str]
+    sender: Optional[str]
+    recipient: Optional[str]
+    reference: Optional[str]
+
+
+class DisputeResolution(BaseModel):
+    summary: str
+    selected_tool: str
+    escalate: bool
+    confidence: float = Field(ge=0, le=1)
+    proof_buyer: ProofFields
+    proof_seller: ProofFields
+
+
+def _nullable_string() -> Dict[str, Any]:
+    return {"type": ["string", "null"]}
+
+
+def resolution_schema(tool_names) -> Dict[str, Any]:
+    """
+    JSON schema for `DisputeResolution`, in the strict form OpenAI structured
+    outputs require (every field required, no extra properties).
+    :param tool_names: Allowed values for `selected_tool`.
+    """
+    proof = {
+        "type": "object",
+        "properties": {field: _nullable_string() for field in ProofFields.model_fields},
+        "required": list(ProofFields.model_fields),
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "selected_tool": {"type": "string", "enum": list(tool_names)},
+            "escalate": {"type": "boolean"},
+            "confidence": {"type": "number"},
+            "proof_buyer": proof,
+            "proof_seller": proof,
+        },
+        "required": ["summary", "selected_tool", "escalate", "confidence", "proof_buyer", "proof_seller"],
+        "additionalProperties": False,
+    }
+
+
+_SELECTED_TOOL_VALUE = re.compile(r'"selected_tool"\s*:\s*"([^"]*)"')
+
+
+def tool_logprob_confidence(tokens: List[Tuple[str, float]]) -> Optional[float]:
+    """
+    Probability the model gave to the `selected_tool` value it wrote.
+    :param tokens: (token, logprob) pairs of the answer, in order.
+    :return: exp of the summed logprobs of the tokens spelling the value, or None if not found.
+    """
+    text, spans = "", []
+    for token, logprob in tokens:
+        spans.append((len(text), len(text) + len(token), logprob))
+        text += token
+    match = _SELECTED_TOOL_VALUE.search(text)
+    if match is None:
+        return None
+    start, end = match.span(1)
+    return math.exp(sum(logprob for token_start, token_end, logprob in spans if token_start < end and token_end > start))
+
+
+# -------------------------
+# Streaming the resolution summary
+# -------------------------
+class _SummaryStream:
+    """
+    Forwards the resolution summary of a dispute as "token" events while the cascade runs.
+    Each tier starts with one "tier" event; within a tier only the attempt that streams
+    first (the call or its hedge) is forwarded, and a late piece from an earlier tier is dropped.
+    """
+
+    def __init__(self, on_event: Callable[[str, Dict[str, Any]], None]):
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self._tier = 0
+        self._owner: Optional[int] = None
+        self._streamer = JsonFieldStreamer("summary")
+
+    def start_tier(self, model: str):
+        with self._lock:
+            self._tier += 1
+            self._owner = None
+            self._streamer = JsonFieldStreamer("summary")
+        # Clients reset the streamed text when a new tier starts
+        self.on_event("tier", {"model": model})
+
+    def owner(self) -> Optional[int]:
+        """The attempt of the current tier being forwarded, or None before any streamed."""
+        return self._owner
+
+    def for_attempt(self, index: int) -> Callable[[str], None]:
+        """`on_token` callback for attempt `index` of the current tier."""
+        tier = self._tier
+
+        def forward(piece: str):
+            with self._lock:
+                if tier != self._tier:
+                    return
+                if self._owner is None:
+                    self._owner = index
+                if self._owner != index:
+                    return
+                text = self._streamer.feed(piece)
+            if text:
+                self.on_event("token", {"text": text})
+        return forward
+
+    def settle(self, winner: int, model: str, content: str):
+        """
+        Make sure the client saw the winning attempt's summary. Only needed when the
+        streamed attempt failed and its hedge answered instead: the tier is restarted
+        with the winner's summary in one piece.
+        """
+        with self._lock:
+            if self._owner in (None, winner):
+                self._owner = winner
+                return
+            self._owner = winner
+            self._tier += 1
+        self.on_event("tier", {"model": model})
+        text = JsonFieldStreamer("summary").feed(content)
+        if text:
+            self.on_event("token", {"text": text})
+
 
 # -------------------------
 # Pipeline Class
 # -------------------------
 class DisputeResolutionPipeline:
-    def __init__(self, model: str = "gpt-4o"):
+    def __init__(self, model: str = "gpt-4o", llm: Optional[LLMProvider] = None,
+                 analyze_conversation: bool = True, rule_check: bool = True,
+                 cascade: Optional[ModelCascade] = None, tools_agent: Optional[ToolsSelectionAgent] = None,
+                 ocr_scanner: Optional[OCRScanner] = None, conversation_agent: Optional[ConversationAnalysisAgent] = None):
         """
         Initializes the dispute resolution pipeline with:
-         - An LLM callable for dispute resolution.
+         - An LLMProvider (default: LLM_PROVIDER) for dispute resolution, tried through a ModelCascade that starts with cheaper
+           models (DISPUTE_CASCADE_MODELS) and ends with `model`.
          - A ToolsSelectionAgent for selecting follow-up tools.
          - An OCRScanner to convert PDF proofs to Markdown.
+         - A ConversationAnalysisAgent run alongside OCR (disable with `analyze_conversation=False`).
+         - A ProofConsistencyChecker that settles clear-cut cases without the LLM (disable with `rule_check=False`).
+         - A PromptCompactor that fits the proofs and conversation into PROMPT_TOKEN_BUDGET tokens.
          - A dictionary of available tools.
+        Pass `tools_agent`, `ocr_scanner` or `conversation_agent` to share already built
+        (and warmed up) components instead of creating new ones. The pipeline keeps no
+        per-dispute state, so one instance can serve concurrent requests.
         """
-        # Load environment variables and set up OpenAI API
-        load_dotenv()
+        # Share the LLM provider (and its cache and usage counters) with the sub-agents
         self.model = model
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.api_key
+        self.llm = llm or get_llm_provider()
 
         # Initialize other components
-        self.tools_agent = ToolsSelectionAgent(model=model)
-        self.ocr_scanner = OCRScanner()
+        self.cascade = cascade or get_model_cascade(model)
+        # Tool selection is a small classification task: keep the agent's own (mini) model
+        self.tools_agent = tools_agent or ToolsSelectionAgent(llm=self.llm)
+        self.ocr_scanner = ocr_scanner or OCRScanner()
+        self.conversation_agent = (conversation_agent or ConversationAnalysisAgent(llm=self.llm)) if analyze_conversation else None
+        self.proof_checker = ProofConsistencyChecker() if rule_check else None
+        self.prompt_compactor = PromptCompactor(model=model)
         self.available_tools = {
             "getBuyerBankStatement": "The buyer does not upload a valid bank statement and the buyer info is not enough and need to fetch and store the buyer's bank statement as a PDF again.",
             "getSellerBankStatement": "The buyer does not upload a valid bank statement and the seller info is not enough and need to fetch and store the seller's bank statement as a PDF again.",
@@ -33,7 +194,8 @@ class DisputeResolutionPipeline:
             "allGood": "Both parties are all good and the transaction is completed successfully.",
         }
 
-    def resolve_dispute(self, conversation_chain: str, proof_buyer: str, proof_seller: str) -> str:
+    def resolve_dispute(self, conversation_chain: str, proof_buyer: str, proof_seller: str,
+                        on_token: Optional[Callable[[str], None]] = None, model: Optional[str] = None) -> str:
         """
         Resolves a P2P dispute by analyzing proofs of transaction and determines if an additional action (via a tool) is needed.
 
@@ -41,10 +203,26 @@ class DisputeResolutionPipeline:
             conversation_chain: All the input of the conversation between the two sides.
             proof_buyer: The text content from OCR analysis of the Buyer's proof of transaction.
             proof_seller: The text content from OCR analysis of the Seller's proof of transaction.
+            on_token: If given, the answer is streamed and every piece is passed to it as it arrives.
+            model: Model to use instead of the pipeline's `model`.
 
         Returns:
-            A string containing a concise resolution in two sentences and a tool selection line.
+            The raw model output: a JSON object matching `resolution_schema`,
+            to be read with `parse_resolution`.
+        """
+        return self.resolve_dispute_scored(conversation_chain, proof_buyer, proof_seller, on_token, model)[0]
+
+    def resolve_dispute_scored(self, conversation_chain: str, proof_buyer: str, proof_seller: str,
+                               on_token: Optional[Callable[[str], None]] = None,
+                               model: Optional[str] = None) -> Tuple[str, Optional[float]]:
+        """
+        Like `resolve_dispute`, also returning the model's confidence in its tool choice.
+        For models other than the pipeline's final `model` the confidence is read from the
+        token logprobs of `selected_tool`; otherwise it is None (use the self-reported one).
+        :return: (raw model output, logprob confidence or None)
         """
+        model = model or self.model
+        logprobs = model != self.model
 
         prompt_template = """
     You are an Experienced Payment Fraud Analyst investigating suspicious transactions for a Peer-to-Peer (P2P) platform. Your goal is to efficiently resolve disputes by validating proofs of transfer and identifying fraudulent activity.
@@ -86,10 +264,12 @@ class DisputeResolutionPipeline:
         - **allGood:** Use this if both proofs are valid and consistent, and the transaction is completed successfully.
 
     4. **Output Requirements:**
-        - Summarize your analysis and resolution in **two sentences**.
-        - End your response with a new line that specifies the selected tool in the exact format:
-        selected_tool: <tool>
-        where `<tool>` is one of: getBuyerBankStatement, getSellerBankStatement, notifyAndEscalate, or allGood.
+        Respond with a single JSON object containing:
+        - "summary": your analysis and resolution in **two sentences**.
+        - "selected_tool": one of getBuyerBankStatement, getSellerBankStatement, notifyAndEscalate, or allGood.
+        - "escalate": true if the case needs human intervention, otherwise false.
+        - "confidence": how certain you are of the selected tool, from 0 (guessing) to 1 (certain).
+        - "proof_buyer" / "proof_seller": the transaction_id, amount, date, sender, recipient and reference read from each proof (null when missing).
 
     5. **Fraud Monitoring:**
         - Be alert to any signs of fraud, such as altered dates/times/amounts, mismatched sender/recipient info, inconsistent formatting, or any other suspicious anomalies.
@@ -103,45 +283,222 @@ class DisputeResolutionPipeline:
             proof_seller=proof_seller
         )
 
-        # Call the LLM to generate the resolution
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=[
+        response = self.llm.complete(
+            [
                 {"role": "system", "content": "You are an experienced payment fraud analyst."},
                 {"role": "user", "content": prompt}
             ],
+            model=model,
             temperature=0.7,
-            max_tokens=500
+            max_tokens=700,
+            # Return the tool choice in the same call instead of a second tool-selection round trip
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "dispute_resolution",
+                    "strict": True,
+                    "schema": resolution_schema(self.available_tools),
+                },
+            },
+            logprobs=logprobs,
+            on_token=on_token,
+        )
+        return response.content.strip(), tool_logprob_confidence(response.logprobs) if logprobs else None
+
+    def _cascade_resolve(self, prompt: CompactedPrompt, deadline: Deadline, stream: Optional["_SummaryStream"]) -> Dict[str, Any]:
+        """
+        Resolve through the model cascade. A cheaper model's answer is kept only if it
+        parses, names an available tool and both its self-reported and logprob
+        confidence reach the cascade threshold. Each tier's call is hedged on its own,
+        so a slow tier gets a duplicate rather than the whole cascade being run twice.
+        :param stream: Forwards the streamed summary of each tier, or None.
+        :return: {"content", "model", "confidence"}
+        """
+        def call(model: str, index: int) -> Dict[str, Any]:
+            on_token = stream.for_attempt(index) if stream is not None else None
+            content, logprob_confidence = self.resolve_dispute_scored(
+                prompt.conversation_chain, prompt.proof_buyer, prompt.proof_seller, on_token=on_token, model=model)
+            return {"content": content, "logprob_confidence": logprob_confidence, "attempt": index}
+
+        # Same budget as the stage itself gets from `deadline.run`
+        stage_deadline = time.monotonic() + deadline.budget_for("resolve_dispute")
+
+        def attempt(model: str) -> Dict[str, Any]:
+            # Once the stage has given up, no further (more expensive) tier is started
+            remaining = min(stage_deadline - time.monotonic(), deadline.remaining())
+            if remaining <= 0:
+                raise StageTimeout("resolve_dispute", 0.0)
+            if stream is not None:
+                stream.start_tier(model)
+            # The attempt already streaming to the client must also supply the tier's answer
+            result = deadline.hedge("resolve_dispute", lambda index: call(model, index), timeout=remaining,
+                                    preferred=stream.owner if stream is not None else None)
+            if stream is not None:
+                stream.settle(result["attempt"], model, result["content"])
+            content, logprob_confidence = result["content"], result["logprob_confidence"]
+            parsed = self.parse_resolution(content)
+            confidence = None
+            if parsed is not None:
+                confidence = parsed.confidence if logprob_confidence is None else min(parsed.confidence, logprob_confidence)
+            return {"content": content, "model": model, "confidence": confidence}
+
+        answer, _ = self.cascade.run(
+            attempt, accept=lambda answer: answer["confidence"] is not None and answer["confidence"] >= self.cascade.threshold
         )
-        resolution = response.choices[0].message.content.strip()
+        return answer
+
+    def parse_resolution(self, content: str) -> Optional[DisputeResolution]:
+        """
+        Validate the structured output of `resolve_dispute`.
+        :param content: Raw model output.
+        :return: The parsed resolution, or None when it is not valid JSON, does not
+                 match the schema, or names a tool that is not available.
+        """
+        try:
+            resolution = DisputeResolution.model_validate_json(content)
+        except ValidationError:
+            return None
+        if resolution.selected_tool not in self.available_tools:
+            return None
         return resolution
 
-    def process_dispute(self, conversation_chain: str, pdf_file1: str, pdf_file2: str) -> Dict[str, str]:
+    def process_dispute(self, conversation_chain: str, pdf_file1: str, pdf_file2: str,
+                        deadline: Optional[Deadline] = None,
+                        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, str]:
         """
         Processes the dispute end-to-end:
-         1. Uses OCRScanner to convert the two PDF proofs into Markdown.
-         2. Calls the LLM to resolve the dispute based on the conversation chain and OCR results.
-         3. Determines whether human intervention is needed.
-         4. Uses the ToolsSelectionAgent to select the most appropriate follow-up tool based on the dispute resolution context.
+         1. Uses OCRScanner to convert the two PDF proofs into Markdown, both at once,
+            while the ConversationAnalysisAgent categorizes the conversation.
+         2. Cross-checks the transaction fields of both proofs; if they match (or clearly conflict)
+            the dispute is decided by rules and no LLM call is made.
+         3. Otherwise compacts the OCR text and conversation to the token budget and calls the LLM to resolve the dispute based on the conversation chain and OCR results,
+            returning the summary, selected tool, escalation flag and proof fields in one structured answer.
+         4. Only if that answer cannot be parsed, uses the ToolsSelectionAgent to select the tool from the raw text.
+
+        Every stage runs within its share of `deadline` (default: `Deadline.from_env()`),
+        and slow LLM calls are hedged (per cascade tier for the resolution). If the budget runs out, a partial result is
+        returned that escalates the case and names the stage that timed out.
+
+        With `on_event`, progress is reported while the dispute is processed:
+        ("stage", {"stage", "start_ms", "duration_ms", "status"}) as each stage
+        ends, ("tier", {"model"}) when a cascade tier starts answering, and
+        ("token", {"text"}) for each piece of that tier's resolution summary
+        while the model streams it.
 
         Returns:
             A dictionary containing:
-              - "resolution": The dispute resolution string generated by the LLM.
-              - "selected_tool": The tool selected by the ToolsSelectionAgent.
+              - "resolution": The dispute resolution summary generated by the LLM.
+              - "selected_tool": The follow-up tool to run.
+              - "escalate": Whether the case needs human intervention.
+              - "proof_fields": Fields extracted from each proof ({"buyer": ..., "seller": ...}), or None.
+              - "conversation_analysis": The ConversationAnalysisAgent's tool, or None.
+              - "decided_by": "rules", "llm", or "llm_fallback" (separate tool-selection call).
+              - "prompt_tokens": Tokens before/after compaction and saved, or None if no prompt was sent.
+              - "model" / "confidence": The cascade tier that resolved the dispute and its confidence (None for rules).
+              - "partial" / "timed_out_stage" / "completed_stages": Deadline outcome.
+              - "stage_timings": Start offset, duration and status of every stage.
         """
-        # Convert PDF proofs to Markdown text using OCR
-        proof_1 = self.ocr_scanner.convert_pdf_to_markdown(pdf_file1)
-        proof_2 = self.ocr_scanner.convert_pdf_to_markdown(pdf_file2)
+        deadline = deadline or Deadline.from_env()
+        # Stages start as soon as their inputs are ready: both OCR jobs and the
+        # conversation analysis run concurrently, resolution waits for the OCR
+        graph = StageGraph(deadline, on_stage=(lambda name, timing: on_event("stage", {"stage": name, **timing}))
+                           if on_event is not None else None)
+        graph.add("ocr_buyer", lambda: self.ocr_scanner.convert_pdf_to_markdown(pdf_file1))
+        graph.add("ocr_seller", lambda: self.ocr_scanner.convert_pdf_to_markdown(pdf_file2))
+        if self.conversation_agent is not None:
+            graph.add("analyze_conversation", lambda: self.conversation_agent.analyze_conversation(conversation_chain),
+                      optional=True)
+        compact = lambda proof_1, proof_2, *verdict: self.prompt_compactor.compact(conversation_chain, proof_1, proof_2)
+        if self.proof_checker is not None:
+            graph.add("check_proofs", self.proof_checker.check, after=("ocr_buyer", "ocr_seller"))
+            # Only prepare and send the LLM prompt when the rule-based check is not conclusive
+            graph.add("compact_prompt", compact, after=("ocr_buyer", "ocr_seller", "check_proofs"),
+                      when=lambda proof_1, proof_2, verdict: not verdict.conclusive)
+        else:
+            graph.add("compact_prompt", compact, after=("ocr_buyer", "ocr_seller"))
+        # One stream for the whole cascade; the tier calls inside it are hedged, not the stage
+        stream = _SummaryStream(on_event) if on_event is not None else None
+        graph.add("resolve_dispute", lambda prompt: self._cascade_resolve(prompt, deadline, stream),
+                  after=("compact_prompt",), when=lambda prompt: prompt is not None, hedge=False)
+        try:
+            results = graph.run()
+            verdict = results.get("check_proofs")
+            answer = results["resolve_dispute"] or {}
+            resolution = answer.get("content")
+
+            parsed = None
+            if verdict is None or not verdict.conclusive:
+                parsed = self.parse_resolution(resolution)
+                if parsed is None:
+                    # Fall back to a separate tool-selection call on the unstructured answer
+                    selected_tool = graph.run_stage("select_tool", self.tools_agent.select_tool, resolution, self.available_tools)
+        except StageTimeout as timeout:
+            return self._partial_result(timeout, deadline, graph)
 
-        # Generate dispute resolution via the LLM
-        resolution = self.resolve_dispute(conversation_chain, proof_1, proof_2)
+        if verdict is not None and verdict.conclusive:
+            decided_by = "rules"
+            resolution = verdict.summary()
+            selected_tool = verdict.selected_tool
+            escalate = selected_tool == "notifyAndEscalate"
+            proof_fields = {"buyer": verdict.buyer.proof_fields(), "seller": verdict.seller.proof_fields()}
+        elif parsed is not None:
+            decided_by = "llm"
+            resolution = parsed.summary
+            selected_tool = parsed.selected_tool
+            escalate = parsed.escalate or selected_tool == "notifyAndEscalate"
+            proof_fields = {"buyer": parsed.proof_buyer.model_dump(), "seller": parsed.proof_seller.model_dump()}
+        else:
+            decided_by = "llm_fallback"
+            escalate = selected_tool == "notifyAndEscalate"
+            proof_fields = None
 
-        # Use resolution as context for tool selection
-        selected_tool = self.tools_agent.select_tool(resolution, self.available_tools)
+        return {
+            "resolution": resolution,
+            "selected_tool": selected_tool,
+            "escalate": escalate,
+            "proof_fields": proof_fields,
+            "conversation_analysis": results.get("analyze_conversation"),
+            "decided_by": decided_by,
+            "prompt_tokens": self._prompt_tokens(results.get("compact_prompt")),
+            "model": answer.get("model"),
+            "confidence": answer.get("confidence"),
+            "partial": False,
+            "timed_out_stage": None,
+            "completed_stages": deadline.completed_stages,
+            "stage_timings": graph.timings,
+        }
 
+    @staticmethod
+    def _prompt_tokens(prompt: Optional[CompactedPrompt]) -> Optional[Dict[str, int]]:
+        if prompt is None:
+            return None
+        return {"before": prompt.tokens_before, "after": prompt.tokens_after, "saved": prompt.tokens_saved}
+
+    def _partial_result(self, timeout: StageTimeout, deadline: Deadline, graph: StageGraph) -> Dict[str, str]:
+        """
+        Build the result returned when a stage runs out of time: whatever was
+        resolved so far, escalated to a human.
+        """
+        resolution = (graph.results.get("resolve_dispute") or {}).get("content")
+        if not resolution:
+            resolution = (
+                "The automated review could not finish within its time budget, "
+                f"so the case has been escalated for human review (timed out at: {timeout.stage})."
+            )
         return {
             "resolution": resolution,
-            "selected_tool": selected_tool
+            "selected_tool": "notifyAndEscalate",
+            "escalate": True,
+            "proof_fields": None,
+            "conversation_analysis": graph.results.get("analyze_conversation"),
+            "decided_by": None,
+            "prompt_tokens": self._prompt_tokens(graph.results.get("compact_prompt")),
+            "model": None,
+            "confidence": None,
+            "partial": True,
+            "timed_out_stage": timeout.stage,
+            "completed_stages": deadline.completed_stages,
+            "stage_timings": graph.timings,
         }
 
 # -------------------------
@@ -169,4 +526,10 @@ User 2: That's strange; I don't see it on my end.
     print("Dispute Resolution:")
     print(result["resolution"])
     print("\nSelected Tool:")
-    print(result["selected_tool"])
\ No newline at end of file
+    print(result["selected_tool"])
+    print(f"(decided by: {result['decided_by']}, prompt tokens: {result['prompt_tokens']})")
+    print("\nStage Timings (ms):")
+    for stage, timing in result["stage_timings"].items():
+        print(f"  {stage}: starts at {timing['start_ms']}, takes {timing['duration_ms']} ({timing['status']})")
+    print("\nProof Fields:")
+    print(json.dumps(result["proof_fields"], indent=2))
\ No newline at end of file
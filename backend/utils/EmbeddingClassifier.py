@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+from .Metrics import metrics
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+@dataclass
+class Classification:
+    """A label with how clearly it won: `margin` is the top-1 minus top-2 cosine similarity."""
+    label: str
+    margin: Optional[float]
+    decided_by: str  # "embedding", or "llm" when the margin was too small (or embeddings failed)
+    scores: Dict[str, float] = field(default_factory=dict)
+    latency_ms: float = 0.0
+
+
+class EmbeddingClassifier:
+    """
+    Nearest-centroid classifier over embeddings.
+
+    Each label's centroid is the mean of the normalized embeddings of its
+    description and labeled examples. A text gets the label with the highest
+    cosine similarity; if the best two are closer than `min_margin`, the
+    decision is handed to a fallback (an LLM call) instead.
+
+    The default margin of 0.04 is a conservative starting point, not a measured
+    optimum: cosine similarities of text-embedding-3 vectors for short texts on
+    one topic fall in a narrow band, so a few hundredths already separate a clear
+    winner from a near tie, and a tie costs only an LLM call. Re-derive it for the
+    current examples and embedding model with `python -m benchmarks.classifier_margin`,
+    which reports per margin how many held-out examples the embeddings decide and
+    how accurately.
+    """
+
+    def __init__(self, name: str, labels: Dict[str, str], examples: Optional[Dict[str, Sequence[str]]] = None,
+                 embed: Optional[Callable[[str], "np.ndarray"]] = None, min_margin: Optional[float] = None,
+                 dimensions: Optional[int] = None):
+        """
+        :param name: Metric label, e.g. "conversation_analysis".
+        :param labels: Label names mapped to their descriptions.
+        :param examples: Labeled example texts per label (labels without examples use the description only).
+        :param embed: Text -> vector function (default: OpenAI embeddings through OpenAIModel, cached).
+        :param min_margin: Smallest top-two margin decided without the fallback (default: CLASSIFIER_MIN_MARGIN or 0.04).
+        :param dimensions: Embedding size requested from OpenAI (default: CLASSIFIER_DIMENSIONS or 256).
+        """
+        if not labels:
+            raise ValueError("A classifier needs at least one label.")
+        self.name = name
+        self.labels = dict(labels)
+        self.examples = {label: list(texts) for label, texts in (examples or {}).items() if label in self.labels}
+        self.min_margin = min_margin if min_margin is not None else float(os.getenv("CLASSIFIER_MIN_MARGIN", "0.04"))
+        self.dimensions = dimensions or int(os.getenv("CLASSIFIER_DIMENSIONS", "256"))
+        self._embed = embed
+        self._lock = threading.Lock()
+        self._names: List[str] = []
+        self._centroids = None
+
+    def embed(self, text: str):
+        if self._embed is None:
+            from .OpenAIModel import OpenAIModel
+
+            model = OpenAIModel()
+            self._embed = lambda value: model.create_embedding_array(value, self.dimensions)
+        return self._embed(text)
+
+    def prepare(self) -> Tuple[List[str], "np.ndarray"]:
+        """
+        Embed every description and example once (concurrently) and average them per label.
+        Runs on the first classification unless called earlier, e.g. at startup.
+        :return: Label names and their centroids, row by row.
+        """
+        import numpy as np
+
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    texts = [(label, text) for label, description in self.labels.items()
+                             for text in [f"{label}: {description}", *self.examples.get(label, [])]]
+                    with ThreadPoolExecutor(max_workers=8) as executor:
+                        vectors = list(executor.map(lambda item: self._normalize(self.embed(item[1])), texts))
+                    names = list(self.labels)
+                    centroids = np.stack([
+                        self._normalize(np.mean([vector for (label, _), vector in zip(texts, vectors) if label == name], axis=0))
+                        for name in names
+                    ])
+                    self._names, self._centroids = names, centroids
+        return self._names, self._centroids
+
+    @staticmethod
+    def _normalize(vector):
+        import numpy as np
+
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Cosine similarity of `text` to every label's centroid."""
+        names, centroids = self.prepare()
+        similarities = centroids @ self._normalize(self.embed(text))
+        return {name: float(score) for name, score in zip(names, similarities)}
+
+    def classify(self, text: str, fallback: Optional[Callable[[], str]] = None) -> Classification:
+        """
+        Label `text`, deferring to `fallback` when the margin is below `min_margin`
+        or the embedding cannot be computed.
+        :param text: Text to embed and classify.
+        :param fallback: Produces the label another way (e.g. an LLM call).
+        :return: The label, its margin, and which path decided it.
+        """
+        start = time.perf_counter()
+        try:
+            scores = self.scores(text)
+        except Exception as e:
+            if fallback is None:
+                raise
+            print(f"{self.name} classifier unavailable, using the fallback: {e}")
+            scores = None
+
+        if scores is None:
+            classification = Classification(label=fallback(), margin=None, decided_by="llm")
+        else:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            margin = ranked[0][1] - ranked[1][1] if len(ranked) > 1 else 1.0
+            if margin < self.min_margin and fallback is not None:
+                classification = Classification(label=fallback(), margin=margin, decided_by="llm", scores=scores)
+            else:
+                classification = Classification(label=ranked[0][0], margin=margin, decided_by="embedding", scores=scores)
+        classification.latency_ms = (time.perf_counter() - start) * 1000
+        metrics.classifier_decisions.inc(classifier=self.name, source=classification.decided_by)
+        return classification
+
+
+# Example usage:
+if __name__ == "__main__":
+    import hashlib
+    import numpy as np
+
+    def toy_embed(text: str):
+        # Bag of hashed words, enough to show the mechanics without an API key
+        vector = np.zeros(64, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.strip(".,!?:").encode()).hexdigest(), 16) % 64] += 1
+        return vector
+
+    classifier = EmbeddingClassifier(
+        "example",
+        labels={"refundBuyer": "The buyer paid but did not get the item and wants a refund.",
+                "neutralIssue": "No dispute, the trade went fine."},
+        examples={"refundBuyer": ["I paid but never received it, refund me"], "neutralIssue": ["Thanks, received, all good"]},
+        embed=toy_embed, min_margin=0.05,
+    )
+    result = classifier.classify("Seller never sent the item, I want my money back", fallback=lambda: "neutralIssue")
+    print(result.label, round(result.margin, 3), result.decided_by, f"{result.latency_ms:.2f} ms")
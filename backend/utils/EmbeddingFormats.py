@@ -0,0 +1,46 @@
+import base64
+from typing import Optional
+
+# Wire formats supported by /embed
+EMBEDDING_FORMATS = ("json", "base64", "float16")
+
+# Accept header media types mapped to a wire format
+BASE64_MEDIA_TYPE = "application/x-embedding-base64"
+FLOAT16_MEDIA_TYPE = "application/x-embedding-float16"
+_ACCEPT_FORMATS = {
+    BASE64_MEDIA_TYPE: "base64",
+    FLOAT16_MEDIA_TYPE: "float16",
+    "application/octet-stream": "float16",
+    "application/json": "json",
+}
+
+
+def negotiate_embedding_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """
+    Pick the response format: an explicit `format` wins, otherwise the first
+    supported media type in the Accept header, otherwise JSON.
+    :param requested: The `format` field of the request, if any.
+    :param accept: The raw Accept header.
+    :return: One of EMBEDDING_FORMATS.
+    """
+    if requested:
+        if requested not in EMBEDDING_FORMATS:
+            raise ValueError(f"Unsupported embedding format '{requested}'. Use one of: {', '.join(EMBEDDING_FORMATS)}.")
+        return requested
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";", 1)[0].strip().lower()
+        if media_type in _ACCEPT_FORMATS:
+            return _ACCEPT_FORMATS[media_type]
+    return "json"
+
+
+def decode_float32(embedding_base64: str):
+    """Decode a base64 little-endian float32 vector (as returned by OpenAI) into a numpy array."""
+    import numpy as np
+
+    return np.frombuffer(base64.b64decode(embedding_base64), dtype="<f4")
+
+
+def to_float16_bytes(embedding_base64: str) -> bytes:
+    """Convert a base64 float32 vector into raw little-endian float16 bytes (half the size)."""
+    return decode_float32(embedding_base64).astype("<f2").tobytes()
@@ -1,30 +1,31 @@
-from semantic_router import Route
-from semantic_router.layer import RouteLayer
-from semantic_router.encoders import OpenAIEncoder
 import os
 from dotenv import load_dotenv
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
+from .ProviderClients import get_provider_clients
 
-# Load environment variables
-load_dotenv()
+if TYPE_CHECKING:
+    from semantic_router.layer import RouteLayer
 
 # Configuration
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SCORE_THRESHOLD = 0.7
 MAX_WARNINGS = 1
 
-# Validate environment variables
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable not set")
-
 
 class FraudDetector:
     def __init__(self):
         """Initialize fraud detection routes and semantic router layer"""
+        # Validate configuration when the detector is built rather than at import time
+        load_dotenv()
+        if not os.getenv("OPENAI_API_KEY"):
+            raise ValueError("OPENAI_API_KEY environment variable not set")
         self.route_layer = self._initialize_route_layer()
 
-    def _initialize_route_layer(self) -> RouteLayer:
+    def _initialize_route_layer(self) -> "RouteLayer":
         """Configure the semantic routing layer with fraud detection rules"""
+        from semantic_router import Route
+        from semantic_router.layer import RouteLayer
+        from semantic_router.encoders import OpenAIEncoder
+
         routes = [
             Route(
                 name="off_platform",
@@ -60,8 +61,12 @@ class FraudDetector:
             ),
         ]
 
+        encoder = OpenAIEncoder(score_threshold=SCORE_THRESHOLD)
+        # Route embeddings go through the shared pooled OpenAI client
+        encoder.client = get_provider_clients().openai()
+
         return RouteLayer(
-            encoder=OpenAIEncoder(score_threshold=SCORE_THRESHOLD),
+            encoder=encoder,
             routes=routes
         )
 
@@ -0,0 +1,88 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .SharedCache import SharedCache, get_shared_cache
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused with a different request payload."""
+
+
+class IdempotencyStore:
+    """
+    Deduplicates expensive requests by idempotency key.
+
+    - A completed result is stored in the SharedCache and replayed to any
+      later request with the same key, from any worker.
+    - An identical request arriving while the first is still running attaches
+      to the running computation instead of starting a second one. Within a
+      worker it awaits the same task; across workers it waits on an in-flight
+      marker in the SharedCache and then reads the stored result.
+    """
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None, lock_ttl: float = 600.0,
+                 poll_interval: float = 0.5, cache: Optional[SharedCache] = None):
+        self.namespace = namespace
+        self.ttl = ttl or float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.cache = cache if cache is not None else get_shared_cache()
+        self._in_flight: Dict[str, Tuple[asyncio.Task, str]] = {}
+
+    def _stored(self, key: str, fingerprint: str, count: bool = True) -> Optional[Any]:
+        """The stored result for `key` (blocking SQLite read: call it off the event loop)."""
+        if self.cache is None:
+            return None
+        stored = self.cache.get(self.namespace, key) if count else self.cache.peek(self.namespace, key)
+        if stored is None:
+            return None
+        if stored["fingerprint"] != fingerprint:
+            raise IdempotencyConflict(f"Idempotency key '{key}' was already used with a different request.")
+        return stored["result"]
+
+    async def _compute_and_store(self, key: str, fingerprint: str, compute: Callable[[], Awaitable[Any]],
+                                 should_store: Callable[[Any], bool]) -> Any:
+        lock_namespace = f"{self.namespace}:in_flight"
+        # SQLite calls may wait on other workers' write locks, so they run off the event loop.
+        # Another worker may be running the same request; wait for its result
+        while self.cache is not None and not await asyncio.to_thread(
+                self.cache.add, lock_namespace, key, os.getpid(), ttl=self.lock_ttl):
+            await asyncio.sleep(self.poll_interval)
+            stored = await asyncio.to_thread(self._stored, key, fingerprint, False)
+            if stored is not None:
+                return stored
+        try:
+            result = await compute()
+            if self.cache is not None and should_store(result):
+                await asyncio.to_thread(
+                    self.cache.set, self.namespace, key, {"fingerprint": fingerprint, "result": result}, ttl=self.ttl)
+            return result
+        finally:
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.delete, lock_namespace, key)
+
+    async def run(self, key: str, fingerprint: str, compute: Callable[[], Awaitable[Any]],
+                  should_store: Callable[[Any], bool] = lambda result: True) -> Tuple[Any, str]:
+        """
+        Return the result for `key`, computing it at most once.
+        :param key: The idempotency key (client supplied or derived from the payload).
+        :param fingerprint: Hash of the request payload, to reject key reuse with other content.
+        :param compute: Coroutine factory producing a JSON-serializable result.
+        :param should_store: Whether a result may be replayed later (e.g. not partial ones).
+        :return: (result, status) where status is "replayed", "joined" or "computed".
+        """
+        stored = await asyncio.to_thread(self._stored, key, fingerprint)
+        if stored is not None:
+            return stored, "replayed"
+
+        if key in self._in_flight:
+            task, running_fingerprint = self._in_flight[key]
+            if running_fingerprint != fingerprint:
+                raise IdempotencyConflict(f"Idempotency key '{key}' is in use by a different request.")
+            return await asyncio.shield(task), "joined"
+
+        task = asyncio.ensure_future(self._compute_and_store(key, fingerprint, compute, should_store))
+        self._in_flight[key] = (task, fingerprint)
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded so a client disconnect does not cancel work other callers attached to
+        return await asyncio.shield(task), "computed"
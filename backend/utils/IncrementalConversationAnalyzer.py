@@ -0,0 +1,301 @@
+import os
+import re
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Callable, Dict, List, Optional
+from .ConversationAnalysisAgent import AVAILABLE_TOOLS, EXAMPLES, ConversationAnalysisAgent
+from .EmbeddingClassifier import EmbeddingClassifier
+from .PromptCompactor import PromptCompactor
+from .SharedCache import SharedCache, content_hash, get_shared_cache
+
+# Most recent messages kept verbatim next to the running summary
+RECENT_MESSAGES = 6
+SUMMARY_MAX_TOKENS = 200
+# Conversations share this many locks (by hash of their id), so the lock table stays fixed in size
+LOCK_STRIPES = 64
+# Attempts to save a state another worker keeps updating concurrently before overwriting it
+SAVE_ATTEMPTS = 3
+
+_FACT_PATTERNS = {
+    "amounts": re.compile(r"\bRM\s?\d+(?:[.,]\d{1,2})?", re.I),
+    "transaction_ids": re.compile(r"\b[0-9a-f]{16,}\b", re.I),
+    "dates": re.compile(r"\b\d{1,2} (?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{4}\b", re.I),
+}
+# Dispute signals raised by a single message; they stay raised for the rest of the conversation
+_SIGNALS = {
+    "payment_claimed": re.compile(r"\b(?:i (?:have |had |already )?(?:paid|transferred)|sent (?:the |you )?(?:payment|money)|paid already|dah transfer)\b", re.I),
+    "payment_not_seen": re.compile(r"\b(?:not|never|haven't|didn't|don't|no)\b.{0,20}\b(?:received|receive|see|get|got)\b.{0,20}\b(?:payment|money|transfer)", re.I),
+    "item_not_received": re.compile(r"\b(?:not|never|haven't|didn't)\b.{0,20}\b(?:released|received|arrived|delivered|sent)\b.{0,20}\b(?:item|code|product|order)", re.I),
+    "refund_requested": re.compile(r"\brefund|money back|return my (?:payment|money)\b", re.I),
+    "amount_dispute": re.compile(r"\b(?:underpaid|overpaid|wrong amount|charged twice|deducted twice)\b", re.I),
+}
+
+
+@dataclass
+class ConversationState:
+    """Rolling analysis of one conversation, updated as its messages arrive."""
+    conversation_id: str
+    summary: str = ""
+    facts: Dict[str, List[str]] = field(default_factory=lambda: {name: [] for name in _FACT_PATTERNS})
+    signals: List[str] = field(default_factory=list)
+    recent: List[str] = field(default_factory=list)
+    label: Optional[str] = None
+    margin: Optional[float] = None
+    decided_by: Optional[str] = None
+    message_count: int = 0
+    # Hash of the first `message_count` messages, to recognize a re-sent chat as a continuation
+    history_hash: str = ""
+    version: int = 0
+    updated_at: float = 0.0
+
+    def digest(self) -> str:
+        """The bounded text classified instead of the whole history."""
+        lines = []
+        if self.summary:
+            lines.append(f"Summary: {self.summary}")
+        facts = "; ".join(f"{name}: {', '.join(values)}" for name, values in self.facts.items() if values)
+        if facts:
+            lines.append(f"Facts: {facts}")
+        if self.signals:
+            lines.append(f"Signals: {', '.join(self.signals)}")
+        return "\n".join(lines + self.recent)
+
+    def extract(self, lines: List[str]):
+        """Add the facts and dispute signals found in `lines`."""
+        for line in lines:
+            for name, pattern in _FACT_PATTERNS.items():
+                for value in pattern.findall(line):
+                    if value not in self.facts[name]:
+                        self.facts[name].append(value)
+            for signal, pattern in _SIGNALS.items():
+                if signal not in self.signals and pattern.search(line):
+                    self.signals.append(signal)
+
+
+def digest_examples() -> Dict[str, List[str]]:
+    """
+    The labeled example chats rendered as digests ("Facts:" and "Signals:" lines
+    followed by the messages), the form `IncrementalConversationAnalyzer` classifies.
+    """
+    examples: Dict[str, List[str]] = {}
+    for label, chats in EXAMPLES.items():
+        for chat in chats:
+            lines = PromptCompactor._conversation_lines(chat)
+            state = ConversationState(conversation_id="example", recent=lines[-RECENT_MESSAGES:])
+            state.extract(lines)
+            examples.setdefault(label, []).append(state.digest())
+    return examples
+
+
+class IncrementalConversationAnalyzer:
+    """
+    Keeps a per-conversation state (running summary, extracted facts, dispute
+    signals, the latest few messages and the current label) and folds in only
+    the messages it has not seen yet. Each analysis summarizes the new messages
+    into the previous summary and classifies the bounded digest, so its cost
+    depends on what arrived since the last call, not on the length of the chat.
+
+    States live in the SharedCache (shared by all workers), or in memory when
+    it is disabled. Calls for one conversation are serialized within a process;
+    across workers, a state is only saved if nobody else saved it meanwhile,
+    otherwise the analysis is redone on top of the newer state.
+    """
+
+    namespace = "conversation_state"
+
+    def __init__(self, agent: Optional[ConversationAnalysisAgent] = None, cache: Optional[SharedCache] = None,
+                 ttl: Optional[float] = None, max_local_states: int = 1024):
+        """
+        :param agent: Classifies the digest (default: a new ConversationAnalysisAgent) and provides the LLM for summaries.
+                      Unless its classifier is disabled, digests are compared with `digest_examples()`
+                      rather than the agent's raw chat examples.
+        :param cache: Where states are kept (default: the SharedCache; in memory if that is disabled).
+        :param ttl: Seconds a state is kept after its last update (default: CONVERSATION_STATE_TTL or 1 day).
+        """
+        self.agent = agent or ConversationAnalysisAgent()
+        self.cache = cache if cache is not None else get_shared_cache()
+        self.classifier = None
+        if self.agent.classifier is not None:
+            self.classifier = EmbeddingClassifier(
+                "conversation_digest", AVAILABLE_TOOLS, digest_examples(),
+                min_margin=self.agent.classifier.min_margin, dimensions=self.agent.classifier.dimensions)
+        self.ttl = ttl or float(os.getenv("CONVERSATION_STATE_TTL", str(24 * 3600)))
+        self.compactor = PromptCompactor()
+        self.max_local_states = max_local_states
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    # -------------------------
+    # State storage
+    # -------------------------
+    def _load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        if self.cache is not None:
+            return self.cache.peek(self.namespace, conversation_id)
+        return self._local.get(conversation_id)
+
+    @staticmethod
+    def _state(stored: Optional[Dict[str, Any]]) -> Optional[ConversationState]:
+        if not stored:
+            return None
+        # Fields of older releases are dropped; the state is then rebuilt from the chat (no history_hash)
+        names = {item.name for item in fields(ConversationState)}
+        # A copy: updating the state must not change `stored`, the value a save compares against
+        return ConversationState(**{name: copy.deepcopy(value) for name, value in stored.items() if name in names})
+
+    def get_state(self, conversation_id: str) -> Optional[ConversationState]:
+        return self._state(self._load(conversation_id))
+
+    def _save(self, state: ConversationState, expected: Optional[Dict[str, Any]]) -> bool:
+        """
+        Store `state` unless the stored state changed since it was read as `expected`.
+        The per-process lock only orders this worker's calls; with the SharedCache,
+        workers update a conversation with an atomic compare-and-set instead.
+        :return: False if another worker saved the conversation first.
+        """
+        if self.cache is not None:
+            return self.cache.compare_and_set(self.namespace, state.conversation_id, expected, asdict(state), ttl=self.ttl)
+        self._local[state.conversation_id] = asdict(state)
+        self._local.move_to_end(state.conversation_id)
+        while len(self._local) > self.max_local_states:
+            self._local.popitem(last=False)
+        return True
+
+    def reset(self, conversation_id: str):
+        if self.cache is not None:
+            self.cache.delete(self.namespace, conversation_id)
+        self._local.pop(conversation_id, None)
+
+    def _lock(self, conversation_id: str) -> threading.Lock:
+        return self._locks[hash(conversation_id) % LOCK_STRIPES]
+
+    # -------------------------
+    # Incremental update
+    # -------------------------
+    @staticmethod
+    def _history_hash(lines: List[str]) -> str:
+        return content_hash(*lines)[:32]
+
+    def new_messages(self, state: ConversationState, lines: List[str]) -> Optional[List[str]]:
+        """
+        The messages of the chat `lines` that `state` has not folded in yet, or None
+        when the chat does not continue the one `state` was built from (e.g. it was edited).
+        """
+        if state.message_count and (len(lines) < state.message_count
+                                    or self._history_hash(lines[:state.message_count]) != state.history_hash):
+            return None
+        return lines[state.message_count:]
+
+    def covers(self, state: Optional[ConversationState], conversation_chain: str) -> bool:
+        """Whether `state` is labeled and built from exactly the messages of `conversation_chain`."""
+        lines = PromptCompactor._conversation_lines(conversation_chain)
+        return (state is not None and state.label is not None and state.message_count == len(lines)
+                and state.history_hash == self._history_hash(lines))
+
+    def analyze(self, conversation_id: str, conversation_chain: str,
+                cancelled: Optional[Callable[[], bool]] = None) -> ConversationState:
+        """
+        Fold the unseen messages of `conversation_chain` (the full chat, as the
+        frontend sends it) into the conversation's state and re-label it.
+        :param conversation_id: Identifies the conversation across calls.
+        :param conversation_chain: The whole chat (JSON list of {user, text}, or plain lines).
+        :param cancelled: Returns True once newer messages made this call stale; the state is then
+                          left as it was, and the newer call folds in these messages too.
+        :return: The updated state; unchanged (and not re-labelled) if there was nothing new or the call was cancelled.
+        """
+        lines = PromptCompactor._conversation_lines(conversation_chain)
+        with self._lock(conversation_id):
+            for attempt in range(SAVE_ATTEMPTS):
+                stored = self._load(conversation_id)
+                state = self._state(stored) or ConversationState(conversation_id=conversation_id)
+                new = self.new_messages(state, lines)
+                if new is None:
+                    # Not a continuation: rebuild from the whole chat
+                    state = ConversationState(conversation_id=conversation_id, version=state.version)
+                    new = lines
+                if not new and state.label is not None:
+                    return state
+                if not self._update(state, new, self._history_hash(lines), cancelled):
+                    return self._state(stored) or ConversationState(conversation_id=conversation_id)
+                if self._save(state, stored):
+                    return state
+                if attempt == SAVE_ATTEMPTS - 1:
+                    # Computed from the whole chat this request sent, so overwriting loses nothing it knew of
+                    self.cache.set(self.namespace, conversation_id, asdict(state), ttl=self.ttl)
+                    return state
+                print(f"Conversation {conversation_id} was updated by another worker, analyzing again")
+
+    def _update(self, state: ConversationState, lines: List[str], history_hash: str,
+                cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Fold `lines` into `state` and re-label it.
+        :return: False if the call was cancelled; `state` is then partly updated and must not be saved.
+        """
+        stale = lambda: cancelled is not None and cancelled()
+        if stale():
+            return False
+        state.extract(lines)
+
+        # Messages pushed out of the recent window are the ones folded into the summary
+        window = state.recent + lines
+        state.recent = window[-RECENT_MESSAGES:]
+        leaving = window[:-RECENT_MESSAGES]
+        if leaving:
+            state.summary = self._summarize(state.summary, leaving)
+
+        # Messages count as seen only once the state is labeled with them
+        if stale():
+            return False
+        classification = self.agent.analyze_conversation_scored(state.digest(), classifier=self.classifier)
+        state.label, state.margin, state.decided_by = classification.label, classification.margin, classification.decided_by
+        state.message_count += len(lines)
+        state.history_hash = history_hash
+        state.version += 1
+        state.updated_at = time.time()
+        return True
+
+    def _summarize(self, summary: str, lines: List[str]) -> str:
+        """Merge messages into the running summary with one short LLM call; on failure keep their gist verbatim."""
+        prompt = f"""
+        Update the running summary of a dispute chat between a buyer and a seller.
+        Keep who paid what, what each side claims, and any unresolved issue. At most 80 words.
+
+        Current summary:
+        {summary or "(empty)"}
+
+        New messages:
+        {chr(10).join(lines)}
+
+        Return only the updated summary.
+        """
+        try:
+            answer = self.agent.llm.complete(
+                [{"role": "system", "content": "You are a conversation summarization assistant."},
+                 {"role": "user", "content": prompt}],
+                model=self.agent.model,
+                temperature=0,
+                max_tokens=SUMMARY_MAX_TOKENS,
+            )
+            return answer.content.strip()
+        except Exception as e:
+            print(f"Summary update failed, keeping the messages instead: {e}")
+            merged = " ".join(filter(None, [summary] + lines))
+            return self.compactor.truncate(merged, SUMMARY_MAX_TOKENS, keep_end=True)
+
+
+# Example usage:
+if __name__ == "__main__":
+    analyzer = IncrementalConversationAnalyzer(cache=None)
+    chat = [
+        {"user": "Buyer", "text": "I paid RM1.00 yesterday, please release the code."},
+        {"user": "Seller", "text": "I don't see any payment from you yet."},
+    ]
+    state = analyzer.analyze("demo", json.dumps(chat))
+    print(state.version, state.label, state.signals)
+
+    chat.append({"user": "Buyer", "text": "Still nothing after two days. I want a refund."})
+    state = analyzer.analyze("demo", json.dumps(chat))
+    print(state.version, state.label, state.signals, state.message_count)
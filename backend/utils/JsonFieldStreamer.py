@@ -0,0 +1,63 @@
+import re
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+class JsonFieldStreamer:
+    """
+    Pulls the value of one string field out of JSON that arrives in pieces,
+    e.g. the "summary" of a structured model answer while it is being
+    streamed, so the text can be shown before the whole object is complete.
+    """
+
+    def __init__(self, field: str):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._seen = ""
+        self._pending = ""
+        self.state = "seeking"  # "seeking" the field, inside its "value", or "done"
+
+    def feed(self, chunk: str) -> str:
+        """
+        Add the next piece of JSON.
+        :return: The newly decoded part of the field's value ("" if none yet).
+        """
+        if self.state == "done":
+            return ""
+        if self.state == "seeking":
+            self._seen += chunk
+            match = self._start.search(self._seen)
+            if match is None:
+                return ""
+            chunk, self._seen, self.state = self._seen[match.end():], "", "value"
+
+        text, self._pending = self._pending + chunk, ""
+        decoded = []
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == "\\":
+                # Escape sequences may be split across chunks; keep the tail for the next call
+                if i + 1 >= len(text) or (text[i + 1] == "u" and i + 6 > len(text)):
+                    self._pending = text[i:]
+                    break
+                if text[i + 1] == "u":
+                    decoded.append(chr(int(text[i + 2:i + 6], 16)))
+                    i += 6
+                else:
+                    decoded.append(_ESCAPES.get(text[i + 1], text[i + 1]))
+                    i += 2
+                continue
+            if char == '"':
+                self.state = "done"
+                break
+            decoded.append(char)
+            i += 1
+        return "".join(decoded)
+
+
+# Example usage:
+if __name__ == "__main__":
+    streamer = JsonFieldStreamer("summary")
+    answer = '{"summary": "Both proofs match.\\nThe \\"transfer\\" is complete.", "selected_tool": "allGood"}'
+    for start in range(0, len(answer), 7):
+        print(repr(streamer.feed(answer[start:start + 7])))
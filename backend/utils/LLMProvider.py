@@ -0,0 +1,388 @@
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from .Metrics import metrics
+from .ProviderClients import get_provider_clients
+from .ResponseCache import ResponseCache, get_response_cache
+from .ProofConsistencyChecker import ProofConsistencyChecker
+
+if TYPE_CHECKING:
+    import httpx
+    import openai
+
+Messages = List[Dict[str, str]]
+
+
+@dataclass
+class LLMResponse:
+    """One chat completion, whichever backend produced it."""
+    content: str
+    model: str
+    finish_reason: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # (token, logprob) pairs, only filled when requested with `logprobs=True`
+    logprobs: List[Tuple[str, float]] = field(default_factory=list)
+    cached: bool = False
+    latency_s: float = 0.0
+
+
+def _parse_completion(data: Dict[str, Any], model: str) -> LLMResponse:
+    """Read an OpenAI-shaped chat.completion payload."""
+    choice = data["choices"][0]
+    usage = data.get("usage") or {}
+    return LLMResponse(
+        content=choice["message"].get("content") or "",
+        model=model,
+        finish_reason=choice.get("finish_reason"),
+        prompt_tokens=usage.get("prompt_tokens") or 0,
+        completion_tokens=usage.get("completion_tokens") or 0,
+        logprobs=[(item["token"], item["logprob"]) for item in ((choice.get("logprobs") or {}).get("content") or [])],
+    )
+
+
+class _StreamAccumulator:
+    """Collects OpenAI-shaped chat.completion.chunk payloads into one `LLMResponse`."""
+
+    def __init__(self, model: str, on_token: Callable[[str], None]):
+        self.response = LLMResponse(content="", model=model)
+        self.on_token = on_token
+        self._parts: List[str] = []
+
+    def add(self, chunk: Dict[str, Any]):
+        usage = chunk.get("usage")
+        if usage:
+            self.response.prompt_tokens = usage.get("prompt_tokens") or 0
+            self.response.completion_tokens = usage.get("completion_tokens") or 0
+        for choice in chunk.get("choices") or []:
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                self._parts.append(text)
+                self.on_token(text)
+            if choice.get("logprobs") and choice["logprobs"].get("content"):
+                self.response.logprobs.extend((item["token"], item["logprob"]) for item in choice["logprobs"]["content"])
+            if choice.get("finish_reason"):
+                self.response.finish_reason = choice["finish_reason"]
+
+    def result(self) -> LLMResponse:
+        self.response.content = "".join(self._parts)
+        return self.response
+
+
+class LLMProvider:
+    """
+    Common interface for chat-completion backends.
+
+    Subclasses implement `_complete`; this class adds the response cache for
+    temperature-0 calls, usage accounting per model, an async variant and
+    batching. Streaming is requested by passing `on_token`.
+    """
+
+    name = "llm"
+
+    def __init__(self, cache: Optional[ResponseCache] = None, timeout: Optional[float] = None, max_workers: int = 8):
+        """
+        :param cache: Cache for deterministic (temperature 0) answers; None disables caching.
+        :param timeout: Default per-call timeout in seconds (None: the backend's default).
+        :param max_workers: Parallel calls made by `complete_batch`.
+        """
+        self.cache = cache
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._usage: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"calls": 0, "cached": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0})
+        self._usage_lock = threading.Lock()
+
+    def complete(self, messages: Messages, model: str, temperature: float = 0.0, max_tokens: Optional[int] = None,
+                 response_format: Optional[Dict[str, Any]] = None, logprobs: bool = False,
+                 on_token: Optional[Callable[[str], None]] = None, timeout: Optional[float] = None) -> LLMResponse:
+        """
+        Run one chat completion.
+        :param messages: Chat messages ({"role", "content"}).
+        :param model: Model name.
+        :param temperature: Sampling temperature; 0 makes the answer cacheable.
+        :param max_tokens: Cap on the answer length.
+        :param response_format: OpenAI response_format (e.g. a strict json_schema).
+        :param logprobs: Also return the logprob of every answer token.
+        :param on_token: If given, the answer is streamed and each piece passed to it as it arrives.
+        :param timeout: Seconds before the call is abandoned (default: the provider's timeout).
+        :return: The answer with its usage.
+        """
+        params: Dict[str, Any] = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        if response_format is not None:
+            params["response_format"] = response_format
+        if logprobs:
+            params["logprobs"] = True
+
+        key = None
+        if self.cache is not None and on_token is None and self.cache.cacheable(params):
+            key = self.cache.key(params)
+            content = self.cache.get(key)
+            metrics.record_cache(self.cache.namespace, content is not None)
+            if content is not None:
+                response = LLMResponse(content=content, model=model, finish_reason="stop", cached=True)
+                self._record(response)
+                return response
+        elif self.cache is not None:
+            self.cache.bypass()
+
+        start = time.perf_counter()
+        try:
+            response = self._complete(params, on_token, timeout or self.timeout)
+        except Exception:
+            with self._usage_lock:
+                self._usage[model]["errors"] += 1
+            raise
+        response.latency_s = time.perf_counter() - start
+        self._record(response)
+        # Truncated answers are not worth replaying
+        if key is not None and response.finish_reason == "stop":
+            self.cache.set(key, response.content)
+        return response
+
+    def _complete(self, params: Dict[str, Any], on_token: Optional[Callable[[str], None]],
+                  timeout: Optional[float]) -> LLMResponse:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: Messages, model: str, **options) -> LLMResponse:
+        """`complete` without blocking the event loop."""
+        return await asyncio.to_thread(self.complete, messages, model, **options)
+
+    def complete_batch(self, requests: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[LLMResponse]:
+        """
+        Run several completions concurrently.
+        :param requests: Keyword arguments for `complete`, one dict per call.
+        :return: The responses, in the order of `requests`.
+        """
+        if not requests:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers or self.max_workers, len(requests))) as executor:
+            return list(executor.map(lambda request: self.complete(**request), requests))
+
+    def _record(self, response: LLMResponse):
+        with self._usage_lock:
+            usage = self._usage[response.model]
+            usage["calls"] += 1
+            usage["cached"] += response.cached
+            usage["prompt_tokens"] += response.prompt_tokens
+            usage["completion_tokens"] += response.completion_tokens
+            usage["latency_s"] += response.latency_s
+        if not response.cached:
+            metrics.llm_tokens.inc(response.prompt_tokens, provider=self.name, model=response.model, kind="prompt")
+            metrics.llm_tokens.inc(response.completion_tokens, provider=self.name, model=response.model, kind="completion")
+
+    def usage(self) -> Dict[str, Dict[str, float]]:
+        """Calls, cache hits, errors, tokens and total latency per model since start-up."""
+        with self._usage_lock:
+            return {model: dict(usage) for model, usage in self._usage.items()}
+
+
+class OpenAIProvider(LLMProvider):
+    """Chat completions through the shared, pooled OpenAI client."""
+
+    name = "openai"
+
+    def __init__(self, client: Optional["openai.OpenAI"] = None, cache: Optional[ResponseCache] = None,
+                 timeout: Optional[float] = None, max_workers: int = 8):
+        super().__init__(cache=cache, timeout=timeout, max_workers=max_workers)
+        self.client = client or get_provider_clients().openai()
+
+    def _complete(self, params, on_token, timeout):
+        options = {"timeout": timeout} if timeout else {}
+        if on_token is None:
+            response = self.client.chat.completions.create(**params, **options)
+            return _parse_completion(response.model_dump(), params["model"])
+
+        stream = _StreamAccumulator(params["model"], on_token)
+        for chunk in self.client.chat.completions.create(stream=True, stream_options={"include_usage": True},
+                                                         **params, **options):
+            stream.add(chunk.model_dump())
+        return stream.result()
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Chat completions from any server speaking the OpenAI HTTP API (vLLM,
+    llama.cpp, Ollama, ...), called with plain HTTP so no SDK is needed.
+    """
+
+    name = "openai_compatible"
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None,
+                 http: Optional["httpx.Client"] = None, cache: Optional[ResponseCache] = None,
+                 timeout: Optional[float] = None, max_workers: int = 8):
+        """
+        :param base_url: API root, e.g. "http://127.0.0.1:8080/v1" (default: LLM_BASE_URL).
+        :param api_key: Bearer token, if the server wants one (default: LLM_API_KEY).
+        :param model: Model the server serves; replaces the requested model name (default: LLM_MODEL).
+        :param http: httpx client (default: the shared pooled one).
+        """
+        super().__init__(cache=cache, timeout=timeout, max_workers=max_workers)
+        self.base_url = (base_url or os.getenv("LLM_BASE_URL", "http://127.0.0.1:8080/v1")).rstrip("/")
+        self.api_key = api_key or os.getenv("LLM_API_KEY")
+        self.model = model or os.getenv("LLM_MODEL")
+        self.http = http or get_provider_clients().http()
+
+    def _complete(self, params, on_token, timeout):
+        import httpx
+
+        body = dict(params, model=self.model or params["model"])
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        options = {"timeout": timeout if timeout else httpx.USE_CLIENT_DEFAULT}
+        url = f"{self.base_url}/chat/completions"
+        if on_token is None:
+            response = self.http.post(url, json=body, headers=headers, **options)
+            response.raise_for_status()
+            return _parse_completion(response.json(), params["model"])
+
+        stream = _StreamAccumulator(params["model"], on_token)
+        with self.http.stream("POST", url, json=dict(body, stream=True), headers=headers, **options) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                stream.add(json.loads(payload))
+        return stream.result()
+
+
+class RuleBasedProvider(LLMProvider):
+    """
+    Deterministic stand-in for tests and benchmarks: answers the prompts this
+    backend sends with keyword rules and the ProofConsistencyChecker, with no
+    network access. Prompts it does not recognise raise ValueError.
+    """
+
+    name = "rules"
+
+    # (system message marker, section of the prompt holding the input, [(pattern, answer)], default answer)
+    TASKS = [
+        ("conversation analysis", r"Conversation Chain:(.*?)Analyze the conversation", [
+            (r"refund|money back|not (?:yet )?(?:received|delivered|released)|never (?:arrived|received)", "refundBuyer"),
+            (r"wrong amount|underpaid|overpaid|payment (?:failed|declined)|deducted twice|charged twice", "transactionIssues"),
+        ], "neutralIssue"),
+        ("tool selection", r"Context:(.*)", [
+            (r"escalat|conflict|fraud|forg|tamper|altered|mismatch", "notifyAndEscalate"),
+            (r"buyer.{0,80}(?:invalid|missing|insufficient|unreadable)", "getBuyerBankStatement"),
+            (r"seller.{0,80}(?:invalid|missing|insufficient|unreadable)", "getSellerBankStatement"),
+            (r"consistent|complete|successful|match", "allGood"),
+        ], "notifyAndEscalate"),
+    ]
+
+    def __init__(self, checker: Optional[ProofConsistencyChecker] = None, chunk_size: int = 16):
+        super().__init__(cache=None)
+        self.checker = checker or ProofConsistencyChecker()
+        self.chunk_size = chunk_size
+
+    def _complete(self, params, on_token, timeout):
+        messages = params["messages"]
+        response_format = params.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = self._structured_answer(messages, response_format["json_schema"])
+        else:
+            content = self._text_answer(messages)
+
+        if on_token is not None:
+            for start in range(0, len(content), self.chunk_size):
+                on_token(content[start:start + self.chunk_size])
+        prompt_length = sum(len(str(message.get("content", ""))) for message in messages)
+        return LLMResponse(
+            content=content, model=params["model"], finish_reason="stop",
+            prompt_tokens=prompt_length // 4, completion_tokens=len(content) // 4,
+            # Certain of every token: the confidence is the self-reported one
+            logprobs=[(content, 0.0)] if params.get("logprobs") else [],
+        )
+
+    def _text_answer(self, messages: Messages) -> str:
+        system = " ".join(message["content"] for message in messages if message["role"] == "system").lower()
+        prompt = messages[-1]["content"]
+        for marker, section, rules, default in self.TASKS:
+            if marker not in system:
+                continue
+            match = re.search(section, prompt, re.S)
+            text = match.group(1) if match else prompt
+            # A tool named in the input wins over keyword rules (e.g. a resolution that names its tool)
+            for tool in re.findall(r"'(\w+)':", prompt):
+                if re.search(rf"\b{tool}\b", text):
+                    return tool
+            for pattern, answer in rules:
+                if re.search(pattern, text, re.I | re.S):
+                    return answer
+            return default
+        raise ValueError(f"RuleBasedProvider has no rule for system prompt: {system[:80]!r}")
+
+    def _structured_answer(self, messages: Messages, json_schema: Dict[str, Any]) -> str:
+        if json_schema.get("name") == "tool_choice":
+            return json.dumps({"selected_tool": self._text_answer(messages)})
+        if json_schema.get("name") != "dispute_resolution":
+            raise ValueError(f"RuleBasedProvider has no rule for schema {json_schema.get('name')!r}")
+        prompt = messages[-1]["content"]
+        buyer = re.search(r"Proof of Transfer \(Buyer\):(.*?)\* Proof of Transfer \(Seller\):", prompt, re.S)
+        seller = re.search(r"Proof of Transfer \(Seller\):(.*?)Follow these steps", prompt, re.S)
+        verdict = self.checker.check(buyer.group(1) if buyer else "", seller.group(1) if seller else "")
+        tools = json_schema["schema"]["properties"]["selected_tool"].get("enum") or []
+        selected_tool = verdict.selected_tool or "notifyAndEscalate"
+        if tools and selected_tool not in tools:
+            selected_tool = tools[0]
+        return json.dumps({
+            "summary": verdict.summary(),
+            "selected_tool": selected_tool,
+            "escalate": selected_tool == "notifyAndEscalate",
+            "confidence": 0.95 if verdict.conclusive else 0.5,
+            "proof_buyer": verdict.buyer.proof_fields(),
+            "proof_seller": verdict.seller.proof_fields(),
+        })
+
+
+_llm_provider: Optional[LLMProvider] = None
+_llm_provider_lock = threading.Lock()
+
+
+def create_llm_provider(kind: Optional[str] = None) -> LLMProvider:
+    """
+    Build the backend named by `kind` (default: LLM_PROVIDER): "openai",
+    "openai_compatible" (LLM_BASE_URL / LLM_MODEL / LLM_API_KEY) or "rules".
+    """
+    kind = (kind or os.getenv("LLM_PROVIDER", "openai")).lower()
+    timeout = float(os.environ["LLM_TIMEOUT"]) if os.getenv("LLM_TIMEOUT") else None
+    if kind == "openai":
+        return OpenAIProvider(cache=get_response_cache(), timeout=timeout)
+    if kind == "openai_compatible":
+        return OpenAICompatibleProvider(cache=get_response_cache(), timeout=timeout)
+    if kind == "rules":
+        return RuleBasedProvider()
+    raise ValueError(f"Unknown LLM_PROVIDER {kind!r}; use openai, openai_compatible or rules.")
+
+
+def get_llm_provider() -> LLMProvider:
+    """Return the process-wide LLM provider, so every agent shares its cache and usage counters."""
+    global _llm_provider
+    if _llm_provider is None:
+        with _llm_provider_lock:
+            if _llm_provider is None:
+                _llm_provider = create_llm_provider()
+    return _llm_provider
+
+
+# Example usage:
+if __name__ == "__main__":
+    llm = RuleBasedProvider()
+    messages = [
+        {"role": "system", "content": "You are a conversation analysis assistant."},
+        {"role": "user", "content": "Conversation Chain:\nBuyer: I paid but the item was never delivered, I want a refund.\n"
+                                    "Analyze the conversation and return ONLY the name of the most suitable tool."},
+    ]
+    print(llm.complete(messages, "gpt-4o-mini").content)
+    print([response.content for response in llm.complete_batch([{"messages": messages, "model": "gpt-4o-mini"}] * 3)])
+    print(llm.usage())
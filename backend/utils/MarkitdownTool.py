@@ -1,7 +1,8 @@
-from markitdown import MarkItDown
-
 class MarkItDownConverter:
     def __init__(self):
+        # Imported here so the server does not load markitdown until it is used
+        from markitdown import MarkItDown
+
         # Initialize the MarkItDown converter
         self.converter = MarkItDown()
 
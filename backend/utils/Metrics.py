@@ -0,0 +1,252 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+from .RequestProfiler import record_span, sampled_thread
+
+# Latency buckets in seconds, from fast cache hits up to slow multi-page OCR runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def snapshot(self) -> List[list]:
+        return [[list(key), value] for key, value in self.items()]
+
+    def merge(self, snapshot: List[list]):
+        with self._lock:
+            for key, value in snapshot:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), list(counts), self._sums[key]] for key, counts in self._counts.items()]
+
+    def merge(self, snapshot: List[list]):
+        with self._lock:
+            for key, counts, total in snapshot:
+                key = tuple(key)
+                current = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+                for index, count in enumerate(counts[:len(current)]):
+                    current[index] += count
+                self._sums[key] = self._sums.get(key, 0.0) + total
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            snapshot = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text format.
+    Recording is a dict update under a per-metric lock, cheap enough to keep on in production.
+    """
+
+    def __init__(self):
+        self.http_request_duration = Histogram(
+            "http_request_duration_seconds", "Latency of HTTP requests per endpoint.", ("endpoint", "method", "status"))
+        self.http_requests_in_flight = Gauge(
+            "http_requests_in_flight", "HTTP requests currently being served.", ("endpoint",))
+        self.stage_duration = Histogram(
+            "pipeline_stage_duration_seconds", "Latency of pipeline stages.", ("stage",))
+        self.stages_in_flight = Gauge(
+            "pipeline_stages_in_flight", "Pipeline stages currently running.", ("stage",))
+        self.provider_requests = Counter(
+            "provider_requests_total", "Calls made to external providers.", ("provider", "operation"))
+        self.provider_errors = Counter(
+            "provider_errors_total", "Failed calls to external providers.", ("provider", "operation"))
+        self.provider_duration = Histogram(
+            "provider_request_duration_seconds", "Latency of external provider calls.", ("provider", "operation"))
+        self.hedged_requests = Counter(
+            "hedged_requests_total", "Requests that got a hedged duplicate, by which attempt won.", ("stage", "winner"))
+        self.stage_timeouts = Counter(
+            "stage_timeouts_total", "Stages abandoned after exceeding their deadline budget.", ("stage",))
+        self.prompt_tokens_saved = Counter(
+            "prompt_tokens_saved_total", "Prompt tokens removed by compaction before calling the model.", ("prompt",))
+        self.cascade_resolutions = Counter(
+            "cascade_resolutions_total", "Disputes resolved per model tier of the cascade.", ("model",))
+        self.cascade_escalations = Counter(
+            "cascade_escalations_total", "Answers from a cascade tier rejected and passed to the next tier.", ("model",))
+        self.cascade_latency_saved = Gauge(
+            "cascade_latency_saved_seconds", "Estimated latency saved by cheaper cascade tiers vs. the final model.", ("final_model",))
+        self.llm_tokens = Counter(
+            "llm_tokens_total", "Tokens used by LLM calls (cache hits excluded).", ("provider", "model", "kind"))
+        self.classifier_decisions = Counter(
+            "classifier_decisions_total", "Labels decided by the embedding classifier or handed to the LLM.", ("classifier", "source"))
+        self.speculative_analyses = Counter(
+            "speculative_analyses_total", "Background conversation analyses by outcome (hit, joined, miss, cancelled, failed).", ("outcome",))
+        self.tool_choices = Counter(
+            "tool_choices_total", "LLM tool answers by how they were validated (exact, normalized or default).", ("agent", "result"))
+        self.cache_requests = Counter(
+            "cache_requests_total", "Cache lookups by result (hit or miss).", ("cache", "result"))
+
+    def _metrics(self) -> List[_Metric]:
+        return [value for value in vars(self).values() if isinstance(value, _Metric)]
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time a pipeline stage and track it as in flight while it runs."""
+        self.stages_in_flight.inc(stage=stage)
+        start = time.perf_counter()
+        try:
+            # The stage's thread is sampled by a profiled request only while the stage runs
+            with sampled_thread():
+                yield
+        finally:
+            end = time.perf_counter()
+            self.stage_duration.observe(end - start, stage=stage)
+            self.stages_in_flight.dec(stage=stage)
+            # Also shows up in the span breakdown of a profiled request
+            record_span(stage, start, end)
+
+    @contextmanager
+    def provider_call(self, provider: str, operation: str):
+        """Count, time and record failures of a call to an external provider."""
+        self.provider_requests.inc(provider=provider, operation=operation)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.provider_errors.inc(provider=provider, operation=operation)
+            raise
+        finally:
+            self.provider_duration.observe(time.perf_counter() - start, provider=provider, operation=operation)
+
+    def record_cache(self, cache: str, hit: bool):
+        self.cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+    def _render_cache_hit_ratio(self) -> List[str]:
+        totals: Dict[str, List[float]] = {}
+        for (cache, result), value in self.cache_requests.items():
+            hits_and_total = totals.setdefault(cache, [0.0, 0.0])
+            if result == "hit":
+                hits_and_total[0] += value
+            hits_and_total[1] += value
+        lines = ["# HELP cache_hit_ratio Fraction of cache lookups served from the cache.", "# TYPE cache_hit_ratio gauge"]
+        for cache, (hits, total) in totals.items():
+            lines.append(f'cache_hit_ratio{{cache="{_escape(cache)}"}} {hits / total if total else 0.0}')
+        return lines
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        """JSON-serializable copy of every metric's values, for publishing to other processes."""
+        return {metric.name: metric.snapshot() for metric in self._metrics()}
+
+    @classmethod
+    def combined(cls, snapshots: Iterable[Dict[str, List[list]]]) -> "MetricsRegistry":
+        """A registry holding the sum of several snapshots (one per worker process)."""
+        registry = cls()
+        for snapshot in snapshots:
+            for metric in registry._metrics():
+                metric.merge(snapshot.get(metric.name, []))
+        return registry
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics():
+            lines.extend(metric.render())
+        lines.extend(self._render_cache_hit_ratio())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the app and every pipeline component
+metrics = MetricsRegistry()
@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Sequence, Tuple
+from .Deadline import StageTimeout
+from .Metrics import metrics
+
+
+class ModelCascade:
+    """
+    Tries models from cheapest to strongest and stops at the first answer
+    that is accepted (valid and confident enough); the last model's answer
+    is always used.
+
+    Keeps per-model counts of the cases each tier resolved, and estimates
+    the latency saved against sending every case to the last model, using
+    the observed average latency of that model.
+    """
+
+    def __init__(self, models: Sequence[str], threshold: float = 0.8):
+        """
+        :param models: Model names, cheapest first; the last one is the fallback.
+        :param threshold: Minimum confidence for an earlier tier's answer to be accepted.
+        """
+        if not models:
+            raise ValueError("A cascade needs at least one model.")
+        self.models = list(models)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._resolved = {model: 0 for model in self.models}
+        self._attempts = {model: 0 for model in self.models}
+        self._attempt_seconds = {model: 0.0 for model in self.models}
+        # Cases an earlier tier settled, and the total time they took
+        self._early_cases = 0
+        self._early_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, final_model: str = "gpt-4o") -> "ModelCascade":
+        """
+        Build the cascade ending in `final_model`. Cheaper tiers come from
+        DISPUTE_CASCADE_MODELS (comma-separated, default "gpt-4o-mini"; empty
+        disables the cascade) and the threshold from DISPUTE_CONFIDENCE_THRESHOLD.
+        """
+        cheaper = [model.strip() for model in os.getenv("DISPUTE_CASCADE_MODELS", "gpt-4o-mini").split(",") if model.strip()]
+        models = [model for model in cheaper if model != final_model] + [final_model]
+        return cls(models, threshold=float(os.getenv("DISPUTE_CONFIDENCE_THRESHOLD", "0.8")))
+
+    def run(self, attempt: Callable[[str], Any], accept: Callable[[Any], bool]) -> Tuple[Any, str]:
+        """
+        Run `attempt(model)` tier by tier.
+        :param attempt: Produces an answer with the given model.
+        :param accept: Whether an answer from a non-final tier is good enough to stop.
+        :return: (answer, model that produced it)
+        """
+        start = time.perf_counter()
+        for model in self.models[:-1]:
+            attempt_start = time.perf_counter()
+            try:
+                answer = attempt(model)
+                accepted = accept(answer)
+            except StageTimeout:
+                # Out of time: escalating would only spend more on an answer nobody waits for
+                raise
+            except Exception as e:
+                # A failing cheaper tier is not fatal: the next tier gets the case
+                print(f"Cascade tier {model} failed, escalating: {e}")
+                accepted = False
+            self._record_attempt(model, time.perf_counter() - attempt_start)
+            if accepted:
+                self._record_resolution(model, time.perf_counter() - start, early=True)
+                return answer, model
+            metrics.cascade_escalations.inc(model=model)
+
+        final = self.models[-1]
+        attempt_start = time.perf_counter()
+        try:
+            answer = attempt(final)
+        finally:
+            self._record_attempt(final, time.perf_counter() - attempt_start)
+        self._record_resolution(final, time.perf_counter() - start, early=False)
+        return answer, final
+
+    def _record_attempt(self, model: str, seconds: float):
+        with self._lock:
+            self._attempts[model] += 1
+            self._attempt_seconds[model] += seconds
+
+    def _record_resolution(self, model: str, seconds: float, early: bool):
+        metrics.cascade_resolutions.inc(model=model)
+        with self._lock:
+            self._resolved[model] += 1
+            if early:
+                self._early_cases += 1
+                self._early_seconds += seconds
+        metrics.cascade_latency_saved.set(self.stats()["latency_saved_s"], final_model=self.models[-1])
+
+    def stats(self) -> Dict[str, Any]:
+        """Share of cases each tier resolved, average latency per tier, and estimated latency saved."""
+        with self._lock:
+            total = sum(self._resolved.values())
+            final = self.models[-1]
+            final_average = self._attempt_seconds[final] / self._attempts[final] if self._attempts[final] else None
+            saved = (self._early_cases * final_average - self._early_seconds) if final_average is not None else 0.0
+            return {
+                "cases": total,
+                "threshold": self.threshold,
+                "tiers": [
+                    {
+                        "model": model,
+                        "resolved": self._resolved[model],
+                        "resolved_share": self._resolved[model] / total if total else 0.0,
+                        "attempts": self._attempts[model],
+                        "average_latency_s": self._attempt_seconds[model] / self._attempts[model] if self._attempts[model] else None,
+                    }
+                    for model in self.models
+                ],
+                "latency_saved_s": saved,
+            }
+
+
+_cascades: Dict[Tuple[str, ...], ModelCascade] = {}
+_cascades_lock = threading.Lock()
+
+
+def get_model_cascade(final_model: str = "gpt-4o") -> ModelCascade:
+    """Return the process-wide cascade ending in `final_model`, so its stats span all requests."""
+    cascade = ModelCascade.from_env(final_model)
+    key = tuple(cascade.models)
+    with _cascades_lock:
+        return _cascades.setdefault(key, cascade)
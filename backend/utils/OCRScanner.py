@@ -1,21 +1,20 @@
-import os
 import io
 from pathlib import Path
-from dotenv import load_dotenv
-import google.generativeai as genai
-import fitz  # PyMuPDF
-from PIL import Image
+from typing import TYPE_CHECKING, Optional
+from .ProviderClients import get_provider_clients
+from .Metrics import metrics
+from .SharedCache import SharedCache, get_shared_cache, content_hash
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 class OCRScanner:
-    def __init__(self):
-        # Load GEMINI_API_KEY from environment
-        load_dotenv()
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found. Please set GEMINI_API_KEY in your environment or .env file.")
-        # Configure Gemini and initialize the model (using gemini-2.0-flash as an example)
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
+    def __init__(self, model_name: str = "gemini-2.0-flash", model: Optional["genai.GenerativeModel"] = None,
+                 cache: Optional[SharedCache] = None):
+        # Reuse the process-wide Gemini model (configured once, GEMINI_API_KEY checked there)
+        self.model = model or get_provider_clients().gemini_model(model_name)
+        # OCR results are shared by every worker, keyed on the PDF content
+        self.cache = cache if cache is not None else get_shared_cache()
 
     def convert_pdf_to_markdown(self, pdf_path: str) -> str:
         """
@@ -26,33 +25,48 @@ class OCRScanner:
         :param pdf_path: Path to the PDF file.
         :return: The converted Markdown text.
         """
+        # PyMuPDF and Pillow are only needed once a PDF is actually scanned
+        import fitz  # PyMuPDF
+        from PIL import Image
+
         # Ensure the file exists and is a PDF
         path = Path(pdf_path).expanduser().resolve()
         if not path.exists() or path.suffix.lower() != ".pdf":
             raise ValueError(f"File {pdf_path} either does not exist or is not a PDF.")
 
+        pdf_bytes = path.read_bytes()
+        cache_key = content_hash(self.model.model_name, pdf_bytes)
+        if self.cache is not None:
+            cached = self.cache.get("ocr", cache_key)
+            if cached is not None:
+                return cached
+
         # Open the PDF document using PyMuPDF
-        doc = fitz.open(str(path))
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
         markdown_output = "# OCR Results\n\n"
 
         for i in range(len(doc)):
-            page = doc.load_page(i)
-            # Render the page to an image (PNG format) at 300 dpi
-            pix = page.get_pixmap(dpi=300)
-            png_bytes = pix.tobytes("png")
-            
-            # Convert PNG bytes to a PIL Image
-            image = Image.open(io.BytesIO(png_bytes))
+            with metrics.stage("rasterize_page"):
+                page = doc.load_page(i)
+                # Render the page to an image (PNG format) at 300 dpi
+                pix = page.get_pixmap(dpi=300)
+                png_bytes = pix.tobytes("png")
+                
+                # Convert PNG bytes to a PIL Image
+                image = Image.open(io.BytesIO(png_bytes))
             
             # Use Gemini to perform OCR on the image.
             # The prompt instructs Gemini to extract the text in Markdown format.
-            response = self.model.generate_content([
-                "Please perform OCR on this image and return only the extracted text in Markdown format. ",
-                image
-            ])
+            with metrics.stage("ocr_page"), metrics.provider_call("gemini", "generate_content"):
+                response = self.model.generate_content([
+                    "Please perform OCR on this image and return only the extracted text in Markdown format. ",
+                    image
+                ])
 
             markdown_output += f"## Page {i+1}\n\n{response.text}\n\n"
 
+        if self.cache is not None:
+            self.cache.set("ocr", cache_key, markdown_output)
         return markdown_output
 
 # Sample usage
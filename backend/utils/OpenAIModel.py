@@ -1,32 +1,142 @@
-from typing import Optional
-import openai
 import os
-from dotenv import load_dotenv
+import base64
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from .ProviderClients import get_provider_clients
+from .SharedCache import SharedCache, get_shared_cache, content_hash
+from .EmbeddingFormats import decode_float32
+from .PromptCompactor import PromptCompactor
+
+if TYPE_CHECKING:
+    import openai
+
+# Longest input the embedding models accept; longer texts are embedded in pieces
+EMBEDDING_MAX_INPUT_TOKENS = 8191
 
 class OpenAIModel:
     def __init__(self, 
                  embedding_model: str = "text-embedding-3-large", 
-                 transcription_model: str = "whisper-1"):
-        # Load environment variables from .env
-        load_dotenv()
+                 transcription_model: str = "whisper-1",
+                 client: Optional["openai.OpenAI"] = None,
+                 cache: Optional[SharedCache] = None):
         self.embedding_model = embedding_model
         self.transcription_model = transcription_model
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.api_key
+        # Shared pooled client unless one is injected
+        self.client = client or get_provider_clients().openai()
+        # Embeddings are deterministic, so they are shared across workers
+        self.cache = cache if cache is not None else get_shared_cache()
+        self.compactor = PromptCompactor(model=embedding_model)
+        # Inputs and tokens per embeddings request, and requests sent at once, for batches
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+        self.batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+        self.batch_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+    def create_embedding_base64(self, text: str, dimensions: Optional[int] = None) -> str:
+        """
+        Create an embedding and return it exactly as the API sends it: base64
+        little-endian float32, with no per-float parsing.
+        :param text: The text to embed.
+        :param dimensions: Optional shortened size, using the model's native truncation.
+        :return: The base64-encoded float32 vector.
+        """
+        return self.create_embeddings_base64([text], dimensions)[0]
+
+    def create_embeddings_base64(self, texts: List[str], dimensions: Optional[int] = None) -> List[str]:
+        """
+        Embed many texts with as few round trips as possible: cached and repeated
+        texts are embedded once, the rest are packed into requests of at most
+        `batch_size` inputs and `batch_tokens` tokens, sent concurrently.
+        Texts longer than the model accepts are embedded in pieces and averaged.
+        :param texts: The texts to embed.
+        :param dimensions: Optional shortened size, using the model's native truncation.
+        :return: One base64-encoded float32 vector per text, in input order.
+        :raises ValueError: If a text is empty or whitespace only, before anything is sent
+                            (the API would reject the whole request it is batched in).
+        """
+        blank = [index for index, text in enumerate(texts) if not text.strip()]
+        if blank:
+            raise ValueError(f"Cannot embed empty text (at positions {blank[:10]}).")
+        keys = [content_hash(self.embedding_model, dimensions or "", text) for text in texts]
+        embeddings: Dict[str, str] = {}
+        if self.cache is not None:
+            embeddings.update(self.cache.get_many("embedding", keys))
+
+        pieces: List[Tuple[str, str, int]] = []  # (key, text, tokens)
+        for key, text in dict(zip(keys, texts)).items():
+            if key in embeddings:
+                continue
+            tokens = self.compactor.count_tokens(text)
+            if tokens <= EMBEDDING_MAX_INPUT_TOKENS:
+                pieces.append((key, text, tokens))
+            else:
+                pieces.extend((key, part, self.compactor.count_tokens(part))
+                              for part in self.compactor.split(text, EMBEDDING_MAX_INPUT_TOKENS))
+        if not pieces:
+            return [embeddings[key] for key in keys]
+
+        batches = self._batches(pieces)
+        with ThreadPoolExecutor(max_workers=min(self.batch_concurrency, len(batches))) as executor:
+            results = list(executor.map(lambda batch: self._embed_batch([text for _, text, _ in batch], dimensions), batches))
 
-    def create_embedding(self, text: str):
+        parts: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        for batch, vectors in zip(batches, results):
+            for (key, _, tokens), vector in zip(batch, vectors):
+                parts[key].append((tokens, vector))
+        computed = {key: chunks[0][1] if len(chunks) == 1 else self._average(chunks) for key, chunks in parts.items()}
+        if self.cache is not None:
+            self.cache.set_many("embedding", computed)
+        embeddings.update(computed)
+        return [embeddings[key] for key in keys]
+
+    def _batches(self, pieces: List[Tuple[str, str, int]]) -> List[List[Tuple[str, str, int]]]:
+        batches, batch, batch_tokens = [], [], 0
+        for piece in pieces:
+            if batch and (len(batch) >= self.batch_size or batch_tokens + piece[2] > self.batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(piece)
+            batch_tokens += piece[2]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts: List[str], dimensions: Optional[int]) -> List[str]:
+        extra = {"dimensions": dimensions} if dimensions else {}
+        response = self.client.embeddings.create(
+            input=texts,
+            model=self.embedding_model,
+            encoding_format="base64",
+            **extra
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    @staticmethod
+    def _average(chunks: List[Tuple[int, str]]) -> str:
+        """Token-weighted mean of the pieces of a long text, normalized and encoded like the API's vectors."""
+        import numpy as np
+
+        weights = np.array([tokens for tokens, _ in chunks], dtype=np.float32)
+        vectors = np.stack([decode_float32(vector) for _, vector in chunks])
+        mean = (vectors * weights[:, None]).sum(axis=0) / weights.sum()
+        norm = np.linalg.norm(mean)
+        mean = mean / norm if norm else mean
+        return base64.b64encode(mean.astype("<f4").tobytes()).decode()
+
+    def create_embedding_array(self, text: str, dimensions: Optional[int] = None):
+        """
+        Create an embedding as a float32 numpy array.
+        """
+        return decode_float32(self.create_embedding_base64(text, dimensions))
+
+    def create_embedding(self, text: str, dimensions: Optional[int] = None):
         """
         Create an embedding for the given text using the specified embedding model.
         :param text: The text to embed.
+        :param dimensions: Optional shortened size, using the model's native truncation.
         :return: A list of floating point numbers representing the embedding.
         """
-        response = openai.embeddings.create(
-            input=text,
-            model=self.embedding_model
-        )
-        # Extract the embedding vector from the response
-        embedding = response["data"][0]["embedding"]
-        return embedding
+        return self.create_embedding_array(text, dimensions).tolist()
 
     def transcribe_audio(self, audio_path: str):
         """
@@ -35,9 +145,8 @@ class OpenAIModel:
         :return: The transcribed text.
         """
         with open(audio_path, "rb") as audio_file:
-            transcript = openai.audio.transcriptions.create(self.transcription_model, audio_file)
-        # Assuming the transcript is returned as a dictionary with a "text" key
-        return transcript["text"]
+            transcript = self.client.audio.transcriptions.create(model=self.transcription_model, file=audio_file)
+        return transcript.text
 
     def join_content(self, speech_text: str, user_text: str, image_text: str, video_text: Optional[str] = None) -> str:
         """
@@ -55,6 +164,10 @@ if __name__ == "__main__":
     text = "Hello world, this is a test."
     embedding = model.create_embedding(text)
     print("Embedding:", embedding)
+
+    # Example: Embed a batch in as few requests as possible
+    vectors = model.create_embeddings_base64(["first document", "second document", "a much longer document " * 5000])
+    print("Batch:", len(vectors), "vectors")
     
     # Example: Transcribe an audio file (ensure the path is valid)
     # audio_path = "path_to_audio_file.wav"
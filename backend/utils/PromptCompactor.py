@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from .Metrics import metrics
+
+# Loaded once per process and model; None when tiktoken could not load it (e.g. offline)
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+# Lines worth keeping when a proof has to be cut down to fit the budget
+_RELEVANT = re.compile(
+    r"RM\s?[\d,]+\.\d{2}|transaction|transfer|reference|recipient|sender|amount|status|successful|failed|"
+    r"account|bank|\bID\b|\d{1,2}\s+[A-Z][a-z]{2}\s+\d{4}|\d{1,2}:\d{2}",
+    re.IGNORECASE,
+)
+_PAGE_HEADING = re.compile(r"^\s*#+\s*(OCR Results|Page\s+\d+)\s*$", re.IGNORECASE)
+# Lines at the top and bottom of each page that may be headers or footers
+FURNITURE_LINES = 3
+_PAGE_NUMBER = re.compile(r"^\s*(page\s+)?\d+\s*(/|of)\s*\d+\s*$", re.IGNORECASE)
+
+
+@dataclass
+class CompactedPrompt:
+    conversation_chain: str
+    proof_buyer: str
+    proof_seller: str
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class PromptCompactor:
+    """
+    Shrinks the inputs of the dispute resolution prompt to a token budget.
+
+    - Proofs: drops the OCR page headings, page numbers and any line repeated
+      on several pages (headers, footers, disclaimers), then, if still too long,
+      keeps the transaction-relevant lines (amounts, IDs, dates, parties) first.
+    - Conversation: renders the frontend's JSON chat as plain lines and, if too
+      long, keeps the opening and the most recent messages around an omission marker.
+
+    Tokens are counted with tiktoken; if the encoding cannot be loaded (e.g.
+    offline) an estimate of 4 characters per token is used instead.
+    """
+
+    def __init__(self, model: str = "gpt-4o", token_budget: Optional[int] = None, proof_share: float = 0.3):
+        """
+        :param model: Model whose tokenizer is used for counting.
+        :param token_budget: Total tokens for conversation plus both proofs (default: PROMPT_TOKEN_BUDGET or 6000).
+        :param proof_share: Fraction of the budget each proof may use; the conversation gets the rest.
+        """
+        self.model = model
+        self.token_budget = token_budget or int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+        self.proof_share = proof_share
+
+    def _get_encoding(self):
+        if self.model not in _encodings:
+            with _encodings_lock:
+                if self.model not in _encodings:
+                    encoding = None
+                    try:
+                        import tiktoken
+                        try:
+                            encoding = tiktoken.encoding_for_model(self.model)
+                        except KeyError:
+                            encoding = tiktoken.get_encoding("o200k_base")
+                    except Exception as e:
+                        print(f"tiktoken encoding unavailable, estimating token counts: {e}")
+                    _encodings[self.model] = encoding
+        return _encodings[self.model]
+
+    def count_tokens(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int, keep_end: bool = False) -> str:
+        """Cut `text` to at most `max_tokens` tokens, keeping its start (or its end with `keep_end`)."""
+        max_tokens = max(max_tokens, 0)
+        encoding = self._get_encoding()
+        if encoding is None:
+            limit = max_tokens * 4
+            return text if len(text) <= limit else (text[len(text) - limit:] if keep_end else text[:limit])
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[len(tokens) - max_tokens:] if keep_end else tokens[:max_tokens])
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """Cut `text` into consecutive pieces of at most `max_tokens` tokens each."""
+        max_tokens = max(max_tokens, 1)
+        encoding = self._get_encoding()
+        if encoding is None:
+            limit = max_tokens * 4
+            return [text[start:start + limit] for start in range(0, len(text), limit)] or [text]
+        tokens = encoding.encode(text, disallowed_special=())
+        return [encoding.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)] or [text]
+
+    def _fit_lines(self, lines: List[str], max_tokens: int, keep_first: Callable[[str], bool]) -> List[str]:
+        """Keep lines in their original order, preferring those `keep_first` selects, until the budget is used."""
+        order = sorted(range(len(lines)), key=lambda i: (not keep_first(lines[i]), i))
+        kept, used = set(), 0
+        for i in order:
+            cost = self.count_tokens(lines[i]) + 1
+            if used + cost > max_tokens:
+                continue
+            kept.add(i)
+            used += cost
+        return [lines[i] for i in sorted(kept)]
+
+    def compact_proof(self, markdown: str, max_tokens: int) -> str:
+        """
+        Remove page furniture from OCR Markdown and fit it into `max_tokens`.
+        :param markdown: Output of `OCRScanner.convert_pdf_to_markdown`.
+        """
+        pages = []
+        for page in re.split(r"^\s*#+\s*Page\s+\d+\s*$", markdown, flags=re.IGNORECASE | re.MULTILINE):
+            page_lines = [line.strip() for line in page.splitlines()]
+            page_lines = [line for line in page_lines
+                          if line and not _PAGE_HEADING.match(line) and not _PAGE_NUMBER.match(line)]
+            if page_lines:
+                pages.append(page_lines)
+
+        # Headers, footers and disclaimers: lines repeated in the top or bottom lines of several pages.
+        # Transaction lines are never furniture, even when repeated (e.g. two identical charges).
+        def furniture(page_lines: List[str]) -> set:
+            edges = page_lines[:FURNITURE_LINES] + page_lines[-FURNITURE_LINES:]
+            return {line for line in edges if not _RELEVANT.search(line)}
+
+        seen_on = Counter(line for page_lines in pages for line in furniture(page_lines))
+        repeated = {line for line, count in seen_on.items() if count > 1}
+
+        lines, emitted = [], set()
+        for page_lines in pages:
+            edges = furniture(page_lines)
+            for line in page_lines:
+                if line in repeated and line in edges:
+                    if line in emitted:
+                        continue
+                    emitted.add(line)
+                lines.append(line)
+
+        if self.count_tokens("\n".join(lines)) > max_tokens:
+            lines = self._fit_lines(lines, max_tokens, lambda line: bool(_RELEVANT.search(line)))
+        return "\n".join(lines)
+
+    @staticmethod
+    def _conversation_lines(conversation_chain: str) -> List[str]:
+        try:
+            messages = json.loads(conversation_chain)
+        except (ValueError, TypeError):
+            messages = None
+        if isinstance(messages, list) and all(isinstance(message, dict) for message in messages):
+            return [f"{message.get('user', message.get('role', 'User'))}: {message.get('text', message.get('content', ''))}"
+                    for message in messages]
+        return [line.strip() for line in conversation_chain.splitlines() if line.strip()]
+
+    def compact_conversation(self, conversation_chain: str, max_tokens: int, keep_head: int = 2) -> str:
+        """
+        Render the conversation as plain lines and fit it into `max_tokens`,
+        keeping the first `keep_head` messages and as many recent ones as fit.
+        """
+        lines = self._conversation_lines(conversation_chain)
+        text = "\n".join(lines)
+        if self.count_tokens(text) <= max_tokens:
+            return text
+
+        head = lines[:keep_head]
+        budget = max_tokens - self.count_tokens("\n".join(head)) - 16
+        tail: List[str] = []
+        for line in reversed(lines[keep_head:]):
+            cost = self.count_tokens(line) + 1
+            if cost > budget:
+                break
+            tail.insert(0, line)
+            budget -= cost
+        if not tail and budget > 0 and len(lines) > keep_head:
+            # The last message alone is too long: keep its end rather than nothing
+            tail = [self.truncate(lines[-1], budget, keep_end=True)]
+        omitted = len(lines) - len(head) - len(tail)
+        return "\n".join(head + [f"[... {omitted} messages omitted ...]"] + tail)
+
+    def compact(self, conversation_chain: str, proof_buyer: str, proof_seller: str) -> CompactedPrompt:
+        """
+        Compact all three prompt inputs to fit the token budget.
+        :return: The compacted texts with token counts before and after.
+        """
+        # Counted on the same plain-line rendering as the result, so JSON syntax is not reported as saved
+        rendered_conversation = "\n".join(self._conversation_lines(conversation_chain))
+        tokens_before = sum(self.count_tokens(text) for text in (rendered_conversation, proof_buyer, proof_seller))
+        proof_budget = int(self.token_budget * self.proof_share)
+        compact_buyer = self.compact_proof(proof_buyer, proof_budget)
+        compact_seller = self.compact_proof(proof_seller, proof_budget)
+        # The conversation gets whatever the proofs did not use
+        conversation_budget = self.token_budget - self.count_tokens(compact_buyer) - self.count_tokens(compact_seller)
+        compact_conversation = self.compact_conversation(conversation_chain, conversation_budget)
+
+        compacted = CompactedPrompt(
+            conversation_chain=compact_conversation,
+            proof_buyer=compact_buyer,
+            proof_seller=compact_seller,
+            tokens_before=tokens_before,
+            tokens_after=sum(self.count_tokens(text) for text in (compact_conversation, compact_buyer, compact_seller)),
+        )
+        metrics.prompt_tokens_saved.inc(max(compacted.tokens_saved, 0), prompt="resolve_dispute")
+        return compacted
+
+
+# Example usage:
+if __name__ == "__main__":
+    compactor = PromptCompactor(token_budget=300)
+    page = "GXBank\nCustomer support: 03-1234 5678\n-RM1.00\nQR transfer to **Lim Jack Sheng** is successful\n"
+    proof = "# OCR Results\n\n" + "".join(f"## Page {i}\n\n{page}\nPage {i} of 3\n\n" for i in range(1, 4))
+    chat = json.dumps([{"user": "Buyer" if i % 2 else "Seller", "text": f"Message number {i} about the payment."} for i in range(60)])
+
+    result = compactor.compact(chat, proof, proof)
+    print(result.proof_buyer)
+    print(result.conversation_chain)
+    print(f"Tokens: {result.tokens_before} -> {result.tokens_after} (saved {result.tokens_saved})")
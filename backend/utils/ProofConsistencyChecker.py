@@ -0,0 +1,230 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+# Patterns for the GXBank receipt layout (see backend/data/), matched against OCR Markdown or a PDF text layer
+_AMOUNT = re.compile(r"(?<![\w.])([+-])?\s*RM\s?([\d,]+\.\d{2})\b")
+_COUNTERPARTY = re.compile(r"transfer\s+(to|from)\s+(.+?)(?:\s+is\s+successful|\s*$)", re.IGNORECASE | re.MULTILINE)
+_DATE = re.compile(r"\b(\d{1,2}\s+[A-Z][a-z]{2}\s+\d{4}),?\s+(\d{1,2}:\d{2}\s*[AP]M)\b")
+_TRANSACTION_ID = re.compile(r"Transaction\s+ID\s*:?\s*([A-Za-z0-9][A-Za-z0-9.\-]*)", re.IGNORECASE)
+_REFERENCE = re.compile(r"Recipient\s+reference\s*:?\s*\n?\s*(.+)", re.IGNORECASE)
+# Markdown decoration Gemini adds around values (bold, headings, table pipes)
+_MARKDOWN = re.compile(r"[*#|`]")
+
+
+@dataclass
+class TransactionFields:
+    """Transaction fields read from one proof of transfer (None when absent)."""
+    transaction_id: Optional[str] = None
+    amount: Optional[str] = None
+    date: Optional[str] = None
+    sender: Optional[str] = None
+    recipient: Optional[str] = None
+    reference: Optional[str] = None
+    direction: Optional[str] = None  # "debit" (money out) or "credit" (money in)
+
+    def value(self) -> Optional[Decimal]:
+        if self.amount is None:
+            return None
+        try:
+            return Decimal(self.amount.replace("RM", "").replace(",", ""))
+        except InvalidOperation:
+            return None
+
+    def timestamp(self) -> Optional[datetime]:
+        if self.date is None:
+            return None
+        try:
+            return datetime.strptime(self.date, "%d %b %Y, %I:%M %p")
+        except ValueError:
+            return None
+
+    def is_statement(self) -> bool:
+        """Whether the proof reads as a bank receipt: a transaction ID and amount, plus a date or counterparty."""
+        return (self.transaction_id is not None and self.value() is not None
+                and (self.timestamp() is not None or self.sender is not None or self.recipient is not None))
+
+    def proof_fields(self) -> Dict[str, Optional[str]]:
+        """The fields in the shape of `DisputeResolution.proof_buyer` / `proof_seller`."""
+        return {
+            "transaction_id": self.transaction_id,
+            "amount": self.amount,
+            "date": self.date,
+            "sender": self.sender,
+            "recipient": self.recipient,
+            "reference": self.reference,
+        }
+
+
+@dataclass
+class ConsistencyVerdict:
+    """
+    Outcome of comparing the two proofs. `selected_tool` is None when the
+    evidence is not conclusive and the LLM has to decide.
+    """
+    selected_tool: Optional[str]
+    matches: List[str] = field(default_factory=list)
+    conflicts: List[str] = field(default_factory=list)
+    buyer: TransactionFields = field(default_factory=TransactionFields)
+    seller: TransactionFields = field(default_factory=TransactionFields)
+
+    @property
+    def conclusive(self) -> bool:
+        return self.selected_tool is not None
+
+    def summary(self) -> str:
+        if self.selected_tool == "allGood":
+            matched = ", ".join(self.matches[:-1]) + " and " + self.matches[-1]
+            return (f"Both proofs show the same {matched}, with the money leaving the buyer and reaching the seller. "
+                    "The transfer is consistent and completed successfully.")
+        if self.selected_tool == "notifyAndEscalate":
+            return (f"The proofs conflict: {'; '.join(self.conflicts)}. "
+                    "This points to an altered or mismatched receipt, so the case is escalated for human review.")
+        if self.selected_tool in ("getBuyerBankStatement", "getSellerBankStatement"):
+            party = "buyer" if self.selected_tool == "getBuyerBankStatement" else "seller"
+            return (f"The {party}'s document is not a bank statement or transfer receipt, so the {party}'s "
+                    "bank statement has to be fetched again before the transfer can be verified.")
+        return "The proofs could not be matched conclusively by the automated check."
+
+
+class ProofConsistencyChecker:
+    """
+    Rule-based cross-check of the buyer's and seller's proofs of transfer.
+
+    Extracts the transaction ID, amount, date, parties and reference from
+    each proof and compares them. Clear-cut cases (same transaction ID and
+    amount, or the same ID with a different amount) are decided here in
+    microseconds; everything else is left to the LLM. A conflict is only
+    escalated when both proofs read as bank receipts: when just one does, the
+    other party's statement is fetched again instead.
+    """
+
+    def extract(self, text: str) -> TransactionFields:
+        """
+        Read the transaction fields from OCR Markdown or a PDF text layer.
+        :param text: The proof's text.
+        :return: The fields found; missing ones are None.
+        """
+        text = _MARKDOWN.sub("", text or "")
+        fields = TransactionFields()
+
+        amount = _AMOUNT.search(text)
+        if amount:
+            sign, digits = amount.groups()
+            fields.amount = f"RM{digits}"
+            fields.direction = {"-": "debit", "+": "credit"}.get(sign)
+
+        counterparty = _COUNTERPARTY.search(text)
+        if counterparty:
+            preposition, name = counterparty.groups()
+            name = name.strip()
+            if preposition.lower() == "to":
+                fields.recipient = name
+                fields.direction = fields.direction or "debit"
+            else:
+                fields.sender = name
+                fields.direction = fields.direction or "credit"
+
+        date = _DATE.search(text)
+        if date:
+            day, clock = date.groups()
+            fields.date = f"{' '.join(day.split())}, {clock.replace(' ', '')[:-2]} {clock[-2:]}"
+
+        transaction_id = _TRANSACTION_ID.search(text)
+        if transaction_id:
+            fields.transaction_id = transaction_id.group(1).strip(".-")
+
+        reference = _REFERENCE.search(text)
+        if reference:
+            fields.reference = reference.group(1).strip()
+        return fields
+
+    def compare(self, buyer: TransactionFields, seller: TransactionFields) -> ConsistencyVerdict:
+        """
+        Compare the fields of both proofs.
+        :return: A verdict selecting "allGood" when the ID, amount and date all agree and the money
+                 flows from buyer to seller, "notifyAndEscalate" when the ID matches but the amount or
+                 date does not (or neither ID nor amount match) and both proofs are bank receipts,
+                 "getBuyerBankStatement" / "getSellerBankStatement" when only the other party's proof
+                 is one, and None otherwise.
+        """
+        verdict = ConsistencyVerdict(selected_tool=None, buyer=buyer, seller=seller)
+
+        id_match = None
+        if buyer.transaction_id and seller.transaction_id:
+            id_match = buyer.transaction_id.lower() == seller.transaction_id.lower()
+            self._record(verdict, id_match, "transaction ID",
+                         f"transaction ID {buyer.transaction_id} (buyer) vs {seller.transaction_id} (seller)")
+
+        amount_match = None
+        if buyer.value() is not None and seller.value() is not None:
+            amount_match = buyer.value() == seller.value()
+            self._record(verdict, amount_match, "amount", f"amount {buyer.amount} (buyer) vs {seller.amount} (seller)")
+
+        date_match = None
+        if buyer.timestamp() is not None and seller.timestamp() is not None:
+            date_match = buyer.timestamp() == seller.timestamp()
+            self._record(verdict, date_match, "date", f"date {buyer.date} (buyer) vs {seller.date} (seller)")
+
+        # The buyer's receipt must show money going out and the seller's money coming in
+        flow_ok = buyer.direction != "credit" and seller.direction != "debit"
+        if not flow_ok:
+            verdict.conflicts.append(
+                f"the buyer's proof shows a {buyer.direction or 'unknown'} and the seller's a {seller.direction or 'unknown'}"
+            )
+
+        buyer_statement, seller_statement = buyer.is_statement(), seller.is_statement()
+        if not (buyer_statement and seller_statement):
+            # An unrelated upload is not evidence of tampering; ask for the missing statement instead
+            if buyer_statement:
+                verdict.selected_tool = "getSellerBankStatement"
+            elif seller_statement:
+                verdict.selected_tool = "getBuyerBankStatement"
+        elif id_match and amount_match and date_match and flow_ok:
+            verdict.selected_tool = "allGood"
+        elif (id_match and (amount_match is False or date_match is False)) or (id_match is False and amount_match is False):
+            verdict.selected_tool = "notifyAndEscalate"
+        return verdict
+
+    @staticmethod
+    def _record(verdict: ConsistencyVerdict, matched: bool, label: str, conflict: str):
+        if matched:
+            verdict.matches.append(label)
+        else:
+            verdict.conflicts.append(conflict)
+
+    def check(self, proof_buyer: str, proof_seller: str) -> ConsistencyVerdict:
+        """
+        Extract and compare both proofs.
+        :param proof_buyer: Text of the buyer's proof.
+        :param proof_seller: Text of the seller's proof.
+        """
+        return self.compare(self.extract(proof_buyer), self.extract(proof_seller))
+
+
+# Example usage:
+if __name__ == "__main__":
+    checker = ProofConsistencyChecker()
+    proof_buyer = """## Page 1
+
+-RM1.00
+
+QR transfer to **Lim Jack Sheng** is successful
+
+08 Feb 2025, 10:38 PM
+
+Recipient reference
+Transfer
+
+Transaction ID
+3e5ee129ed634d0682f467e12498c831
+"""
+    proof_seller = proof_buyer.replace("-RM1.00", "+RM1.00").replace("to **Lim Jack Sheng**", "from **Sim Sze Yu**")
+    proof_fake = proof_buyer.replace("-RM1.00", "-RM2.00").replace("e12498c831", "e12498c83")
+    proof_unrelated = "## Page 1\n\nCourse planning\n\nTransaction ID: N/A\n\nFee: RM250.00\n"
+
+    for name, proof in (("genuine", proof_buyer), ("fake", proof_fake), ("unrelated", proof_unrelated)):
+        verdict = checker.check(proof, proof_seller)
+        print(f"{name}: {verdict.selected_tool} - {verdict.summary()}")
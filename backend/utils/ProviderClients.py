@@ -0,0 +1,198 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+from .Metrics import metrics
+
+# Provider SDKs are imported on first use to keep server startup cheap
+if TYPE_CHECKING:
+    import openai
+    import google.generativeai as genai
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx when installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """
+    Pooled httpx transport that records call counts, errors and latency for
+    every request made through the shared OpenAI client.
+    """
+
+    def __init__(self, provider: str, **kwargs):
+        super().__init__(**kwargs)
+        self.provider = provider
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        # "/v1/chat/completions" -> "chat.completions"
+        operation = request.url.path.split("/v1/", 1)[-1].strip("/").replace("/", ".")
+        with metrics.provider_call(self.provider, operation):
+            response = super().handle_request(request)
+            if response.status_code >= 400:
+                metrics.provider_errors.inc(provider=self.provider, operation=operation)
+            return response
+
+
+class ProviderClients:
+    """
+    Process-wide registry of provider clients (OpenAI, Gemini, Supabase, and
+    plain HTTP for OpenAI-compatible servers).
+
+    Every component shares the same pooled, keep-alive connections so a request
+    does not pay a fresh TLS handshake per call. Clients are created lazily on
+    first use and reused for the life of the process.
+    """
+
+    def __init__(self,
+                 max_connections: Optional[int] = None,
+                 max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None,
+                 connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None,
+                 max_retries: int = 2):
+        load_dotenv()
+        self.max_connections = max_connections or int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = max_keepalive_connections or int(os.getenv("PROVIDER_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = keepalive_expiry or float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "60"))
+        self.connect_timeout = connect_timeout or float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = read_timeout or float(os.getenv("PROVIDER_READ_TIMEOUT", "60"))
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._openai_client: Optional["openai.OpenAI"] = None
+        self._openai_transport: Optional[InstrumentedTransport] = None
+        self._http_client: Optional[httpx.Client] = None
+        self._http_transport: Optional[InstrumentedTransport] = None
+        self._gemini_configured = False
+        self._gemini_models: Dict[str, "genai.GenerativeModel"] = {}
+        self._supabase_clients: Dict[Tuple[str, str], object] = {}
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def openai(self) -> "openai.OpenAI":
+        """
+        Return the shared OpenAI client, creating it on first use.
+        :return: An `openai.OpenAI` client backed by a pooled httpx client.
+        """
+        if self._openai_client is None:
+            import openai
+
+            with self._lock:
+                if self._openai_client is None:
+                    self._openai_transport = InstrumentedTransport("openai", http2=HTTP2_AVAILABLE, limits=self.limits)
+                    http_client = openai.DefaultHttpxClient(
+                        transport=self._openai_transport,
+                        timeout=self.timeout,
+                    )
+                    self._openai_client = openai.OpenAI(
+                        api_key=os.getenv("OPENAI_API_KEY"),
+                        http_client=http_client,
+                        timeout=self.timeout,
+                        max_retries=self.max_retries,
+                    )
+        return self._openai_client
+
+    def http(self) -> httpx.Client:
+        """
+        Return the shared httpx client used for OpenAI-compatible inference
+        servers, with the same pooling, timeouts and instrumentation as the OpenAI client.
+        """
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_transport = InstrumentedTransport("openai_compatible", http2=HTTP2_AVAILABLE, limits=self.limits)
+                    self._http_client = httpx.Client(transport=self._http_transport, timeout=self.timeout)
+        return self._http_client
+
+    def gemini_model(self, model_name: str = "gemini-2.0-flash") -> "genai.GenerativeModel":
+        """
+        Return a shared Gemini model handle. `genai.configure` resets the
+        underlying transport, so it is called once per process instead of once
+        per scanner instance. `GEMINI_API_ENDPOINT` (e.g. a local stand-in
+        server) switches to the REST transport against that endpoint.
+        :param model_name: The Gemini model to use.
+        :return: A cached `genai.GenerativeModel`.
+        """
+        import google.generativeai as genai
+
+        with self._lock:
+            if not self._gemini_configured:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not found. Please set GEMINI_API_KEY in your environment or .env file.")
+                endpoint = os.getenv("GEMINI_API_ENDPOINT")
+                options = {"client_options": {"api_endpoint": endpoint}} if endpoint else {}
+                transport = os.getenv("GEMINI_TRANSPORT") or ("rest" if endpoint else None)
+                genai.configure(api_key=api_key, transport=transport, **options)
+                self._gemini_configured = True
+            if model_name not in self._gemini_models:
+                self._gemini_models[model_name] = genai.GenerativeModel(model_name)
+            return self._gemini_models[model_name]
+
+    def supabase(self, url: str, key: str):
+        """
+        Return a shared Supabase client for the given project.
+        :param url: The Supabase project URL.
+        :param key: The Supabase API key.
+        :return: A cached `supabase.Client`.
+        """
+        import supabase
+
+        with self._lock:
+            if (url, key) not in self._supabase_clients:
+                options = supabase.ClientOptions(postgrest_client_timeout=self.read_timeout)
+                self._supabase_clients[(url, key)] = supabase.create_client(url, key, options=options)
+            return self._supabase_clients[(url, key)]
+
+    def drop_connections(self):
+        """
+        Close pooled connections while keeping every client usable. Called in
+        the server process before forking workers so no TLS socket opened
+        during warmup ends up shared between processes.
+        """
+        for transport in (self._openai_transport, self._http_transport):
+            if transport is not None:
+                transport.close()
+
+    def close(self):
+        """Close every pooled connection. Called on application shutdown."""
+        with self._lock:
+            if self._openai_client is not None:
+                self._openai_client.close()
+                self._openai_client = None
+                self._openai_transport = None
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+                self._http_transport = None
+            self._supabase_clients.clear()
+            self._gemini_models.clear()
+            self._gemini_configured = False
+
+
+_provider_clients: Optional[ProviderClients] = None
+_provider_clients_lock = threading.Lock()
+
+
+def get_provider_clients() -> ProviderClients:
+    """Return the process-wide `ProviderClients` instance."""
+    global _provider_clients
+    if _provider_clients is None:
+        with _provider_clients_lock:
+            if _provider_clients is None:
+                _provider_clients = ProviderClients()
+    return _provider_clients
@@ -0,0 +1,194 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# The profile attached to the current request, if profiling was requested
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class RequestProfile:
+    """
+    Sampling profile plus wall-clock span breakdown of a single request.
+    A background thread samples, at a fixed interval, the stacks of the threads
+    currently working inside one of the request's spans (a thread takes part from
+    the start of a span to its end, so pooled threads are not sampled while they
+    serve other requests), and aggregates them as collapsed stacks.
+    """
+
+    def __init__(self, name: str, sample_interval: float = 0.005):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.sample_interval = sample_interval
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.wall_time = 0.0
+        self.spans: List[Dict] = []
+        self.samples: Counter = Counter()
+        # Threads inside a span of this request, with how many of its spans each is in
+        self.thread_ids: Counter = Counter()
+        self._lock = threading.Lock()
+        self.context_token = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id[:8]}", daemon=True)
+
+    def start_sampling(self):
+        self._sampler.start()
+
+    def stop_sampling(self):
+        self._stop.set()
+        self._sampler.join()
+        self.wall_time = time.perf_counter() - self.start
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = list(self.thread_ids)
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def enter_thread(self):
+        """Start sampling the calling thread (until the matching `leave_thread`)."""
+        with self._lock:
+            self.thread_ids[threading.get_ident()] += 1
+
+    def leave_thread(self):
+        with self._lock:
+            thread_id = threading.get_ident()
+            self.thread_ids[thread_id] -= 1
+            if self.thread_ids[thread_id] <= 0:
+                del self.thread_ids[thread_id]
+
+    def add_span(self, name: str, start: float, end: float):
+        """Record a span; `start` and `end` are `time.perf_counter()` values."""
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                "thread": threading.current_thread().name,
+            })
+
+    def to_dict(self) -> Dict:
+        totals: Dict[str, float] = {}
+        for item in self.spans:
+            totals[item["name"]] = round(totals.get(item["name"], 0.0) + item["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "request": self.name,
+            "started_at": self.started_at,
+            "wall_time_ms": round(self.wall_time * 1000, 3),
+            "sample_interval_ms": self.sample_interval * 1000,
+            "span_totals_ms": totals,
+            "spans": sorted(self.spans, key=lambda item: item["start_ms"]),
+            # Collapsed stacks ("frame;frame;frame count"), loadable by flamegraph tools
+            "collapsed_stacks": "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()),
+        }
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _active_profile.get()
+
+
+def record_span(name: str, start: float, end: float):
+    """Attach a finished span to the active profile. A no-op when not profiling."""
+    profile = _active_profile.get()
+    if profile is not None:
+        profile.add_span(name, start, end)
+
+
+@contextmanager
+def sampled_thread():
+    """Sample the calling thread for the active profile while the block runs. A no-op when not profiling."""
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter_thread()
+    try:
+        yield
+    finally:
+        profile.leave_thread()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block as a span of the active profile, sampling its thread meanwhile. A no-op when not profiling."""
+    if _active_profile.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        with sampled_thread():
+            yield
+    finally:
+        record_span(name, start, time.perf_counter())
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling, enabled by the `X-Profile` header or the
+    `profile` query flag. Only callers presenting `PROFILE_TOKEN` in the
+    `X-Profile-Token` header may profile; without the token configured the
+    feature is off. Profiles are saved as JSON artifacts under `PROFILE_DIR`.
+    """
+
+    def __init__(self, token: Optional[str] = None, profile_dir: Optional[str] = None, sample_interval: float = 0.005):
+        self.token = token if token is not None else os.getenv("PROFILE_TOKEN", "")
+        self.profile_dir = Path(profile_dir or os.getenv("PROFILE_DIR", "profiles"))
+        self.sample_interval = sample_interval
+
+    @staticmethod
+    def is_requested(headers, query_params) -> bool:
+        flag = headers.get("x-profile") or query_params.get("profile")
+        return flag is not None and flag.lower() in ("1", "true", "yes")
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        return bool(self.token) and token is not None and hmac.compare_digest(token, self.token)
+
+    def start(self, name: str) -> RequestProfile:
+        """Start profiling; the request's handler must run in a context copied after this call."""
+        profile = RequestProfile(name, self.sample_interval)
+        profile.context_token = _active_profile.set(profile)
+        profile.start_sampling()
+        return profile
+
+    @staticmethod
+    def detach(profile: RequestProfile):
+        """Stop attaching work of the calling context to `profile` (the handler's copied context keeps it)."""
+        _active_profile.reset(profile.context_token)
+
+    def finish(self, profile: RequestProfile) -> Path:
+        """Stop sampling and write the profile to disk."""
+        profile.stop_sampling()
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / f"{profile.id}.json"
+        path.write_text(json.dumps(profile.to_dict(), indent=2))
+        return path
+
+    def artifact_path(self, profile_id: str) -> Optional[Path]:
+        """Return the saved artifact for `profile_id`, or None if it does not exist."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self.profile_dir / f"{profile_id}.json"
+        return path if path.exists() else None
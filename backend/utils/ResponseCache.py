@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from .Metrics import metrics
+from .SharedCache import SharedCache, content_hash, get_shared_cache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class ResponseCache:
+    """
+    Cache for deterministic (temperature 0) chat completions.
+
+    Keys are the model plus a hash of the whitespace-normalized messages and
+    the remaining request parameters. Lookups go to an in-process LRU first,
+    then to the optional persistent tier (the SharedCache, so all workers and
+    restarts benefit). Calls with any other temperature are never cached.
+    Used by the LLMProvider, which looks answers up before calling a model.
+    """
+
+    namespace = "llm_response"
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 persistent: Optional[SharedCache] = None):
+        """
+        :param max_entries: Size of the memory tier (default: RESPONSE_CACHE_SIZE or 1024).
+        :param ttl: Seconds an answer stays valid in both tiers (default: RESPONSE_CACHE_TTL or 1 day).
+        :param persistent: Second tier; None keeps answers in memory only.
+        """
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+        self.ttl = ttl or float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+        self.persistent = persistent
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+
+    @staticmethod
+    def cacheable(params: Dict[str, Any]) -> bool:
+        return params.get("temperature") == 0 and not params.get("stream") and params.get("n", 1) == 1
+
+    @staticmethod
+    def key(params: Dict[str, Any]) -> str:
+        """Cache key for a chat-completion request: model plus a hash of the normalized prompt and options."""
+        messages = [
+            {"role": message["role"], "content": _WHITESPACE.sub(" ", str(message.get("content", ""))).strip()}
+            for message in params.get("messages", [])
+        ]
+        options = {name: value for name, value in params.items() if name not in ("model", "messages")}
+        return f"{params.get('model')}:{content_hash(json.dumps(messages, sort_keys=True), json.dumps(options, sort_keys=True, default=str))}"
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def bypass(self):
+        """Count a call that skipped the cache (non-zero temperature, streamed or sampled several times)."""
+        self._count("bypassed")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+        if self.persistent is not None:
+            value = self.persistent.peek(self.namespace, key)
+            if value is not None:
+                self._count("persistent_hits")
+                self._remember(key, value)
+                return value
+        self._count("misses")
+        return None
+
+    def _remember(self, key: str, value: str):
+        with self._lock:
+            self._memory[key] = (time.time() + self.ttl, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def set(self, key: str, value: str):
+        self._remember(key, value)
+        if self.persistent is not None:
+            self.persistent.set(self.namespace, key, value, ttl=self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters per tier plus the memory tier size."""
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._memory))
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide `ResponseCache`. Its persistent tier is the
+    SharedCache unless `RESPONSE_CACHE_PERSISTENT=0` (or the SharedCache is disabled).
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                persistent = get_shared_cache() if os.getenv("RESPONSE_CACHE_PERSISTENT", "1") == "1" else None
+                _response_cache = ResponseCache(persistent=persistent)
+    return _response_cache
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from .Metrics import metrics
+
+
+# Keys per query of `get_many`, below SQLite's limit on bound parameters
+_MANY_CHUNK = 500
+
+
+def content_hash(*parts) -> str:
+    """Stable SHA-256 over strings/bytes, used to build cache keys."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SharedCache:
+    """
+    On-disk key/value cache shared by every worker process on the host.
+
+    Backed by SQLite in WAL mode, so concurrent readers and writers from
+    several forked workers see the same entries. Values are stored as JSON
+    under a namespace (e.g. "ocr", "embedding") with an optional TTL.
+
+    The "ocr" and "embedding" namespaces, written without a TTL by their
+    callers, get a default TTL and a maximum size. Every `purge_every` writes
+    (and at startup, see `purge`) expired entries are deleted and those
+    namespaces are trimmed to their size, oldest entries first.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.getenv("SHARED_CACHE_PATH", "cache/shared_cache.sqlite3"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        month = str(30 * 24 * 3600)
+        self.default_ttls = {
+            "ocr": float(os.getenv("SHARED_CACHE_TTL_OCR", month)),
+            "embedding": float(os.getenv("SHARED_CACHE_TTL_EMBEDDING", month)),
+        }
+        self.max_entries = {
+            "ocr": int(os.getenv("SHARED_CACHE_MAX_OCR", "10000")),
+            "embedding": int(os.getenv("SHARED_CACHE_MAX_EMBEDDING", "50000")),
+        }
+        self.purge_every = int(os.getenv("SHARED_CACHE_PURGE_EVERY", "1000"))
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (namespace, expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections must not cross threads or a fork, so keep one per thread and pid
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _expires_at(self, namespace: str, ttl: Optional[float]) -> Optional[float]:
+        ttl = ttl or self.default_ttls.get(namespace)
+        return time.time() + ttl if ttl else None
+
+    def _written(self, count: int = 1):
+        # Counted per process; each worker purges after its own `purge_every` writes
+        with self._writes_lock:
+            self._writes += count
+            due = self._writes >= self.purge_every
+            if due:
+                self._writes = 0
+        if due:
+            try:
+                self.purge()
+            except sqlite3.Error as e:
+                print(f"Shared cache purge failed: {e}")
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """
+        Return the cached value or None when missing or expired.
+        :param namespace: Logical cache name, also used as the metrics label.
+        :param key: Cache key within the namespace.
+        """
+        value = self.peek(namespace, key)
+        metrics.record_cache(namespace, value is not None)
+        return value
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Look up many keys with as few queries as possible (one per `_MANY_CHUNK` keys).
+        :return: The live values found, by key; each key counts as a hit or a miss.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        connection = self._connection()
+        for start in range(0, len(keys), _MANY_CHUNK):
+            chunk = keys[start:start + _MANY_CHUNK]
+            rows = connection.execute(
+                f"SELECT key, value FROM cache WHERE namespace = ? AND key IN ({', '.join('?' * len(chunk))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, *chunk, time.time()),
+            ).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+        for key in keys:
+            metrics.record_cache(namespace, key in found)
+        return found
+
+    def peek(self, namespace: str, key: str) -> Optional[Any]:
+        """Like `get`, without counting towards the cache hit metrics (used for polling)."""
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        Store a JSON-serializable value.
+        :param ttl: Seconds until the entry expires; None uses the namespace's default
+                    TTL, if it has one, and otherwise keeps it until evicted.
+        """
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), self._expires_at(namespace, ttl)),
+        )
+        self._written()
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl: Optional[float] = None):
+        """Store many JSON-serializable values in one transaction."""
+        expires_at = self._expires_at(namespace, ttl)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                [(namespace, key, json.dumps(value), expires_at) for key, value in items.items()],
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self._written(len(items))
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Store a value only if no live entry exists. Atomic across processes,
+        so it doubles as a short-lived cross-worker lock.
+        :return: True if the value was stored, False if a live entry already existed.
+        """
+        connection = self._connection()
+        expires_at = self._expires_at(namespace, ttl)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, time.time()),
+            )
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def compare_and_set(self, namespace: str, key: str, expected: Optional[Any], value: Any,
+                        ttl: Optional[float] = None) -> bool:
+        """
+        Store `value` only if the live entry still equals `expected` (None: no live entry).
+        Atomic across processes, for read-modify-write updates shared by several workers.
+        :return: True if the value was stored, False if another writer changed the entry first.
+        """
+        connection = self._connection()
+        expires_at = self._expires_at(namespace, ttl)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            current = None if row is None or (row[1] is not None and row[1] <= time.time()) else json.loads(row[0])
+            stored = current == expected
+            if stored:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), expires_at),
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if stored:
+            self._written()
+        return stored
+
+    def values(self, namespace: str) -> List[Any]:
+        """Every live value of a namespace."""
+        rows = self._connection().execute(
+            "SELECT value FROM cache WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time()),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete(self, namespace: str, key: str):
+        self._connection().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed."""
+        cursor = self._connection().execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def purge(self) -> int:
+        """
+        Delete expired entries, then the oldest entries (earliest expiry) of every
+        namespace above its `max_entries`. Runs every `purge_every` writes; call it
+        at startup too, so a restarted server starts from a bounded file.
+        :return: How many entries were removed.
+        """
+        removed = self.purge_expired()
+        connection = self._connection()
+        for namespace, limit in self.max_entries.items():
+            count = connection.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)).fetchone()[0]
+            if count > limit:
+                cursor = connection.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                    " SELECT key FROM cache WHERE namespace = ? ORDER BY expires_at LIMIT ?)",
+                    (namespace, namespace, count - limit),
+                )
+                removed += cursor.rowcount
+        return removed
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Return the process-wide `SharedCache`, or None when disabled with
+    `SHARED_CACHE_ENABLED=0`.
+    """
+    global _shared_cache
+    if os.getenv("SHARED_CACHE_ENABLED", "1") != "1":
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache()
+    return _shared_cache
@@ -0,0 +1,136 @@
+import os
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from .IncrementalConversationAnalyzer import ConversationState, IncrementalConversationAnalyzer
+from .Metrics import metrics
+from .SharedCache import content_hash
+
+
+@dataclass
+class _Speculation:
+    version: int = 0
+    context_hash: str = ""
+    task: Optional[asyncio.Task] = None
+    running: bool = False  # Past the idle wait, analyzing
+    state: Optional[ConversationState] = None
+
+
+class SpeculativeAnalyzer:
+    """
+    Runs conversation analysis in the background once a chat has been idle for
+    a short while, so the result is ready when the user asks for it.
+
+    Every message bumps the conversation's version and restarts the idle timer;
+    a speculation still waiting is cancelled, one already running is told it is
+    stale (it stops before its next LLM call and saves nothing, leaving its
+    messages to the newer analysis). An explicit analysis of the same chat content
+    returns the stored result, or joins the running speculation, instead of
+    starting over.
+
+    Speculations live in this process; with several workers an explicit request
+    landing elsewhere still benefits through the shared incremental state.
+    """
+
+    def __init__(self, analyzer: IncrementalConversationAnalyzer, idle_seconds: Optional[float] = None,
+                 max_conversations: int = 1024):
+        """
+        :param analyzer: Does the actual (incremental) analysis.
+        :param idle_seconds: Quiet time after the last message before analyzing (default: SPECULATIVE_IDLE_MS or 1500 ms).
+        :param max_conversations: Speculations kept in memory, least recently updated dropped first.
+        """
+        self.analyzer = analyzer
+        self.idle_seconds = idle_seconds if idle_seconds is not None else float(os.getenv("SPECULATIVE_IDLE_MS", "1500")) / 1000
+        self.max_conversations = max_conversations
+        self._speculations: "OrderedDict[str, _Speculation]" = OrderedDict()
+
+    def message_arrived(self, conversation_id: str, conversation_chain: str) -> int:
+        """
+        Record that `conversation_chain` is the chat's new content and schedule its analysis after the idle period.
+        :return: The conversation's new version.
+        """
+        speculation = self._speculations.pop(conversation_id, None) or _Speculation()
+        self._speculations[conversation_id] = speculation
+        while len(self._speculations) > self.max_conversations:
+            _, evicted = self._speculations.popitem(last=False)
+            self._cancel(evicted)
+
+        self._cancel(speculation)
+        speculation.version += 1
+        speculation.context_hash = content_hash(conversation_chain)
+        speculation.state = None
+        speculation.running = False
+        speculation.task = asyncio.create_task(self._speculate(conversation_id, conversation_chain, speculation, speculation.version))
+        return speculation.version
+
+    @staticmethod
+    def _cancel(speculation: _Speculation):
+        # A running analysis cannot be interrupted mid-thread; it notices the version bump instead
+        if speculation.task is not None and not speculation.task.done() and not speculation.running:
+            speculation.task.cancel()
+            metrics.speculative_analyses.inc(outcome="cancelled")
+
+    async def _speculate(self, conversation_id: str, conversation_chain: str, speculation: _Speculation,
+                         version: int) -> Optional[ConversationState]:
+        # Nobody awaits this task unless a request joins it, so failures end here instead of propagating
+        await asyncio.sleep(self.idle_seconds)
+        speculation.running = True
+        stale = lambda: speculation.version != version
+        try:
+            state = await asyncio.to_thread(self.analyzer.analyze, conversation_id, conversation_chain, stale)
+        except Exception as e:
+            print(f"Speculative analysis of {conversation_id} failed: {e}")
+            metrics.speculative_analyses.inc(outcome="failed")
+            return None
+        if stale():
+            # Built from an older chat (or left unlabeled): nobody may use it
+            metrics.speculative_analyses.inc(outcome="cancelled")
+            return None
+        speculation.state = state
+        return state
+
+    async def analyze(self, conversation_id: str, conversation_chain: str) -> Tuple[ConversationState, str]:
+        """
+        Analyze the chat now, reusing the speculation when it covers the same content.
+        :return: The state and how it was obtained: "hit" (stored), "joined" (awaited the
+                 running speculation) or "miss" (analyzed on the spot).
+        """
+        speculation = self._speculations.get(conversation_id)
+        if speculation is not None and speculation.context_hash == content_hash(conversation_chain):
+            if speculation.state is not None:
+                metrics.speculative_analyses.inc(outcome="hit")
+                return speculation.state, "hit"
+            if speculation.running and not speculation.task.done():
+                state = await asyncio.shield(speculation.task)
+                if self.analyzer.covers(state, conversation_chain):
+                    metrics.speculative_analyses.inc(outcome="joined")
+                    return state, "joined"
+                # The speculation failed or went stale while we waited: analyze on the spot below
+            else:
+                # Still waiting out the idle period: the user asked first
+                self._cancel(speculation)
+
+        metrics.speculative_analyses.inc(outcome="miss")
+        state = await asyncio.to_thread(self.analyzer.analyze, conversation_id, conversation_chain)
+        return state, "miss"
+
+
+# Example usage:
+if __name__ == "__main__":
+    import json
+    import time
+
+    async def example():
+        speculative = SpeculativeAnalyzer(IncrementalConversationAnalyzer(cache=None), idle_seconds=0.5)
+        chat = [{"user": "Buyer", "text": "I paid RM1.00 but the code was never released."}]
+        speculative.message_arrived("demo", json.dumps(chat))
+        chat.append({"user": "Seller", "text": "I don't see any payment from you."})
+        speculative.message_arrived("demo", json.dumps(chat))  # Cancels the first, still idle
+        await asyncio.sleep(3)  # The user reads the chat before pressing the AI button
+
+        start = time.perf_counter()
+        state, outcome = await speculative.analyze("demo", json.dumps(chat))
+        print(state.label, outcome, f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    asyncio.run(example())
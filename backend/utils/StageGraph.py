@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from typing import Any, Callable, Dict, Optional, Sequence
+from .Metrics import metrics
+from .Deadline import Deadline, StageTimeout
+
+# Caps how many stages run at once across all requests in this process
+_stage_slots = threading.BoundedSemaphore(int(os.getenv("PIPELINE_STAGE_CONCURRENCY", "8")))
+
+# Stages are driven from here; each driver waits on its Deadline-managed call
+_driver: Optional[ThreadPoolExecutor] = None
+_driver_lock = threading.Lock()
+
+
+def _get_driver() -> ThreadPoolExecutor:
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("STAGE_EXECUTOR_WORKERS", "32")), thread_name_prefix="stage-driver"
+                )
+    return _driver
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable[..., Any], after: Sequence[str], optional: bool,
+                 when: Optional[Callable[..., bool]], hedge: bool):
+        self.name = name
+        self.hedge = hedge
+        self.fn = fn
+        self.after = list(after)
+        self.optional = optional
+        self.when = when
+
+
+class StageGraph:
+    """
+    Runs pipeline stages as a dependency graph.
+
+    A stage starts as soon as every stage it depends on has finished, so
+    independent stages (e.g. OCR of both proofs) run side by side and the
+    wall time follows the critical path. Every stage runs within its
+    `Deadline` budget and holds one of the process-wide stage slots
+    (`PIPELINE_STAGE_CONCURRENCY`) while it runs.
+    """
+
+    def __init__(self, deadline: Deadline, on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        """
+        :param deadline: Budget shared by every stage.
+        :param on_stage: Called with the stage name and its timing whenever a stage finishes or is skipped.
+        """
+        self.deadline = deadline
+        self.on_stage = on_stage
+        self.stages: Dict[str, _Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        self._started = time.perf_counter()
+
+    def add(self, name: str, fn: Callable[..., Any], after: Sequence[str] = (), optional: bool = False,
+            when: Optional[Callable[..., bool]] = None, hedge: bool = True) -> "StageGraph":
+        """
+        Register a stage.
+        :param name: Stage name, also used for metrics and deadline budgets.
+        :param fn: Called with the results of the `after` stages, in that order.
+        :param after: Names of the stages this one depends on.
+        :param optional: If True, a failure or timeout yields None instead of failing the graph.
+        :param when: Called with the same arguments as `fn`; if it returns False the stage is skipped
+                     and its result is None.
+        :param hedge: Whether the deadline may hedge the whole stage; False when `fn` hedges its own calls.
+        """
+        missing = [dependency for dependency in after if dependency not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+        self.stages[name] = _Stage(name, fn, after, optional, when, hedge)
+        return self
+
+    def run_stage(self, name: str, fn: Callable[..., Any], *args, hedge: bool = True) -> Any:
+        """Run a single stage now, with the same budget, slot and timing bookkeeping."""
+        start = time.perf_counter()
+        status = "error"
+        try:
+            # Waiting for a slot counts against the end-to-end deadline, like the stage itself
+            if not _stage_slots.acquire(timeout=max(0.0, self.deadline.remaining())):
+                metrics.stage_timeouts.inc(stage=name)
+                raise StageTimeout(name, 0.0)
+            try:
+                with metrics.stage(name):
+                    result = self.deadline.run(name, fn, *args, hedge=hedge)
+            finally:
+                _stage_slots.release()
+            status = "ok"
+            return result
+        except StageTimeout:
+            status = "timeout"
+            raise
+        finally:
+            self._record(name, {
+                "start_ms": round((start - self._started) * 1000, 1),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "status": status,
+            })
+
+    def _record(self, name: str, timing: Dict[str, Any]):
+        self.timings[name] = timing
+        if self.on_stage is not None:
+            self.on_stage(name, timing)
+
+    def _run_one(self, stage: _Stage) -> Any:
+        args = [self.results[dependency] for dependency in stage.after]
+        if stage.when is not None and not stage.when(*args):
+            self._record(stage.name, {"start_ms": None, "duration_ms": None, "status": "skipped"})
+            return None
+        try:
+            return self.run_stage(stage.name, stage.fn, *args, hedge=stage.hedge)
+        except Exception:
+            if stage.optional:
+                return None
+            raise
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run every registered stage.
+        :return: Results by stage name.
+        :raises: The first error of a required stage (e.g. `StageTimeout`). Stages
+                 not started yet are skipped; results finished so far stay in `results`.
+        """
+        driver = _get_driver()
+        waiting = dict(self.stages)
+        running: Dict[Future, _Stage] = {}
+        while waiting or running:
+            ready = [stage for stage in waiting.values() if all(d in self.results for d in stage.after)]
+            for stage in ready:
+                del waiting[stage.name]
+                # Copy the context so profiling spans from the driver thread are kept
+                running[driver.submit(copy_context().run, self._run_one, stage)] = stage
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                if future.exception() is not None:
+                    for skipped in waiting:
+                        self._record(skipped, {"start_ms": None, "duration_ms": None, "status": "skipped"})
+                    raise future.exception()
+                self.results[stage.name] = future.result()
+        return self.results
@@ -1,13 +1,14 @@
-import supabase
 from dotenv import load_dotenv
 import os
+from .ProviderClients import get_provider_clients
+from .Metrics import metrics
 
 load_dotenv()
 
 class DatabaseChecker:
-    def __init__(self, url: str, key: str):
-        """Initialize the Supabase client."""
-        self.client = supabase.create_client(url, key)
+    def __init__(self, url: str, key: str, client=None):
+        """Initialize with the shared Supabase client for this project."""
+        self.client = client or get_provider_clients().supabase(url, key)
 
     def is_blacklisted(self, username: str) -> bool:
         """
@@ -16,7 +17,8 @@ class DatabaseChecker:
         :param username: The name of the user to check.
         :return: True if the user is blacklisted, False otherwise.
         """
-        response = self.client.table("users").select("blacklist").eq("name", username).execute()
+        with metrics.provider_call("supabase", "users.select"):
+            response = self.client.table("users").select("blacklist").eq("name", username).execute()
         
         # Check if user exists
         if response.data and len(response.data) > 0:
@@ -0,0 +1,87 @@
+import re
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple
+from .Metrics import metrics
+
+
+def tool_choice_format(tool_names: Iterable[str]) -> Dict[str, Any]:
+    """
+    Strict structured-output format restricting the answer to
+    {"selected_tool": <one of tool_names>}.
+    :param tool_names: Allowed tool names.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "tool_choice",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {"selected_tool": {"type": "string", "enum": list(tool_names)}},
+                "required": ["selected_tool"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def _key(text: str) -> str:
+    # "Refund Buyer", "refund_buyer" and "`refundBuyer`." all compare equal
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def _selected(answer: str) -> str:
+    """The "selected_tool" value of a structured answer, else the stripped answer."""
+    text = (answer or "").strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(parsed, dict) and isinstance(parsed.get("selected_tool"), str):
+        return parsed["selected_tool"].strip()
+    return text
+
+
+def normalize_tool(answer: str, tool_names: Iterable[str]) -> Optional[str]:
+    """
+    Map a model answer onto one of `tool_names`: the structured {"selected_tool": ...}
+    value, the bare name with any case, quoting or punctuation, or the only tool
+    named in a sentence.
+    :return: The matching tool name, or None if the answer names none (or several).
+    """
+    tool_names = list(tool_names)
+    text = re.sub(r"^\s*(?:selected[_ ]tool|tool)\s*[:=]\s*", "", _selected(answer), flags=re.I)
+
+    by_key = {_key(name): name for name in tool_names}
+    if _key(text) in by_key:
+        return by_key[_key(text)]
+    mentioned = {name for name in tool_names if re.search(rf"(?<![A-Za-z0-9]){re.escape(name)}(?![A-Za-z0-9])", text, re.I)}
+    return mentioned.pop() if len(mentioned) == 1 else None
+
+
+def validated_tool(answer: str, tool_names: Iterable[str], default: str, agent: str) -> Tuple[str, str]:
+    """
+    Validate a model's tool answer without asking again: exact names pass, near
+    misses are normalized and anything else becomes `default`.
+    :param agent: Metric label, e.g. "tool_selection".
+    :return: The tool name and how it was obtained ("exact", "normalized" or "default").
+    """
+    tool_names = list(tool_names)
+    if _selected(answer) in tool_names:
+        result, tool = "exact", _selected(answer)
+    else:
+        tool = normalize_tool(answer, tool_names)
+        result = "normalized" if tool is not None else "default"
+        if tool is None:
+            print(f"{agent}: answer {answer[:80]!r} names no available tool, using {default}")
+            tool = default
+    metrics.tool_choices.inc(agent=agent, result=result)
+    return tool, result
+
+
+# Example usage:
+if __name__ == "__main__":
+    tools = ["refundBuyer", "transactionIssues", "neutralIssue"]
+    for answer in ['{"selected_tool": "refundBuyer"}', "refundBuyer.", "**Refund Buyer**",
+                   "The most suitable tool is transactionIssues.", "I am not sure."]:
+        print(repr(answer), "->", validated_tool(answer, tools, default="neutralIssue", agent="example"))
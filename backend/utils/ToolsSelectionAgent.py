@@ -1,14 +1,74 @@
-import openai
 import os
-from dotenv import load_dotenv
-from typing import List, Dict
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+from .LLMProvider import LLMProvider, get_llm_provider
+from .EmbeddingClassifier import EmbeddingClassifier, Classification
+from .PromptCompactor import PromptCompactor
+from .ToolChoice import tool_choice_format, validated_tool
+
+# Labeled example contexts (resolution summaries) for the dispute tools, averaged into each tool's centroid.
+# Tools without examples are classified on their description alone.
+EXAMPLES = {
+    "getBuyerBankStatement": [
+        "The buyer's document is not a bank receipt and shows no transaction details, so the buyer's bank statement is needed.",
+        "The buyer's proof is unreadable and is missing the transaction ID and amount.",
+        "The buyer uploaded an unrelated document instead of a proof of transfer.",
+    ],
+    "getSellerBankStatement": [
+        "The seller's document is not a bank statement and shows no incoming transfer, so the seller's statement is needed.",
+        "The seller's proof is unreadable and is missing the transaction ID and amount.",
+        "The seller uploaded an unrelated document instead of their bank statement.",
+    ],
+    "notifyAndEscalate": [
+        "The proofs conflict: the transaction ID matches but the amount differs, indicating an altered receipt.",
+        "The buyer's receipt shows signs of tampering, with inconsistent fonts and a mismatched date.",
+        "The transaction IDs differ between the two proofs and the conversation suggests fraud.",
+    ],
+    "allGood": [
+        "Both proofs show the same transaction ID, amount and date, and the transfer completed successfully.",
+        "The seller's statement confirms receipt of the buyer's payment; no further action is needed.",
+        "The proofs are consistent and valid, and the transaction is complete.",
+    ],
+}
+
+# Contexts longer than this are cut before embedding
+EMBEDDING_MAX_TOKENS = 2000
+# Classifiers kept for distinct tool sets passed to `select_tool`
+MAX_CLASSIFIERS = 32
+# Chosen when the model's answer names no available tool: a human looks at the case
+DEFAULT_TOOL = "notifyAndEscalate"
 
 class ToolsSelectionAgent:
-    def __init__(self, model: str = "gpt-4o-mini"):
-        load_dotenv()
+    def __init__(self, model: str = "gpt-4o-mini", llm: Optional[LLMProvider] = None,
+                 use_classifier: Optional[bool] = None):
+        """
+        :param model: Model asked when the classifier is not confident (or disabled).
+        :param llm: LLM provider (default: the shared one).
+        :param use_classifier: Try an embedding classifier over the tool descriptions before
+                               the LLM (default: EMBEDDING_CLASSIFIER, on).
+        """
         self.model = model
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.api_key
+        # Shared provider (LLM_PROVIDER); its temperature-0 answers are served from the response cache
+        self.llm = llm or get_llm_provider()
+        self.use_classifier = os.getenv("EMBEDDING_CLASSIFIER", "1") == "1" if use_classifier is None else use_classifier
+        self.compactor = PromptCompactor()
+        # One classifier per tool set, least recently used dropped first
+        self._classifiers: "OrderedDict[Tuple[Tuple[str, str], ...], EmbeddingClassifier]" = OrderedDict()
+        self._classifiers_lock = threading.Lock()
+
+    def classifier_for(self, available_tools: Dict[str, str]) -> EmbeddingClassifier:
+        key = tuple(sorted((str(name), str(description)) for name, description in available_tools.items()))
+        with self._classifiers_lock:
+            classifier = self._classifiers.get(key)
+            if classifier is None:
+                classifier = EmbeddingClassifier("tool_selection", dict(key), EXAMPLES)
+                self._classifiers[key] = classifier
+                while len(self._classifiers) > MAX_CLASSIFIERS:
+                    self._classifiers.popitem(last=False)
+            self._classifiers.move_to_end(key)
+            return classifier
 
     def select_tool(self, context: str, available_tools: Dict[str, str]) -> str:
         """
@@ -17,23 +77,43 @@ class ToolsSelectionAgent:
         :param available_tools: A dictionary mapping tool names to their descriptions.
         :return: The name of the selected tool.
         """
+        return self.select_tool_scored(context, available_tools).label
+
+    def select_tool_scored(self, context: str, available_tools: Dict[str, str]) -> Classification:
+        """
+        Like `select_tool`, also reporting the classifier margin and whether
+        the embedding classifier or the LLM decided.
+        """
+        if not self.use_classifier or len(available_tools) < 2:
+            start = time.perf_counter()
+            label = self._ask_llm(context, available_tools)
+            return Classification(label=label, margin=None, decided_by="llm", latency_ms=(time.perf_counter() - start) * 1000)
+        text = self.compactor.truncate(context, EMBEDDING_MAX_TOKENS)
+        return self.classifier_for(available_tools).classify(text, fallback=lambda: self._ask_llm(context, available_tools))
+
+    def _ask_llm(self, context: str, available_tools: Dict[str, str]) -> str:
+        if not available_tools:
+            raise ValueError("No tools to select from.")
         prompt = f"""
         You are an intelligent assistant that selects the most appropriate tool based on the given context.
         Below is a list of available tools:
         {available_tools}
         
-        Based on the following context, return only the name of the most suitable tool:
+        Based on the following context, select the most suitable tool:
         Context: {context}
         """
         
-        response = openai.chat.completions.create(
+        # The answer is constrained to the available tool names and validated once, never re-asked
+        answer = self.llm.complete(
+            [{"role": "system", "content": "You are a tool selection assistant."},
+             {"role": "user", "content": prompt}],
             model=self.model,
-            messages=[{"role": "system", "content": "You are a tool selection assistant."},
-                      {"role": "user", "content": prompt}],
-            temperature=0
+            temperature=0,
+            response_format=tool_choice_format(available_tools),
         )
         
-        tool_name = response.choices[0].message.content.strip()
+        default = DEFAULT_TOOL if DEFAULT_TOOL in available_tools else next(iter(available_tools))
+        tool_name, _ = validated_tool(answer.content, available_tools, default=default, agent="tool_selection")
         return tool_name
 
 # Example usage:
@@ -45,5 +125,5 @@ if __name__ == "__main__":
         "notifyAndEscalate": "Automate notifications and escalate cases that require human intervention.",
     }
     context = "The buyer needs to upload their bank statement."
-    selected_tool = agent.select_tool(context, available_tools)
-    print(selected_tool)
+    result = agent.select_tool_scored(context, available_tools)
+    print(result.label, result.margin, result.decided_by)
@@ -12,10 +12,10 @@ const MainPage = () => {
   const [isAIActive, setIsAIActive] = useState(false);
   const [pdfBuyer, setPdfBuyer] = useState(null); 
   const [pdfSeller, setPdfSeller] = useState(null); 
-  const [buyerConversation, setBuyerConversation] = useState([]);  // New state for Buyer conversation
-  const [sellerConversation, setSellerConversation] = useState([]); // New state for Seller conversation
+  const [conversation, setConversation] = useState([]); // Buyer and Seller messages in the order they were sent
   const [currentStep, setCurrentStep] = useState('initial');
   const fileInputRef = useRef(null);
+  const conversationId = useRef(crypto.randomUUID()); // Lets the backend analyze only the new messages
   const [audioUrl, setAudioUrl] = useState(null); // Store the audio URL for playback
   const [isRecording, setIsRecording] = useState(false);
   const [fraudDetected, setFraudDetected] = useState(false);
@@ -95,12 +95,19 @@ const MainPage = () => {
     const newMessage = { user: currentUser, text: message };
     setChat([...chat, newMessage]);
   
-    // Add the message to the respective conversation packet
-    if (currentUser === "Buyer") {
-      setBuyerConversation([...buyerConversation, newMessage]);
-    } else {
-      setSellerConversation([...sellerConversation, newMessage]);
-    }
+    // Append to the conversation in arrival order, so each update extends the one the backend already analyzed
+    const nextConversation = [...conversation, newMessage];
+    setConversation(nextConversation);
+
+    // Let the backend analyze the chat while it is idle, so the AI button answers right away
+    fetch('http://localhost:8000/conversation_message', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        conversation_id: conversationId.current,
+        context: JSON.stringify(nextConversation),
+      }),
+    }).catch((error) => console.error('Error scheduling analysis:', error));
   
     setMessage("");
   };  
@@ -109,17 +116,14 @@ const MainPage = () => {
     setIsAIActive(true);
     
     // Create conversation chain string
-    const conversationChain = JSON.stringify([
-        ...buyerConversation,
-        ...sellerConversation
-    ]);
+    const conversationChain = JSON.stringify(conversation);
 
     try {
         // Call conversation analysis endpoint
         const analysisResponse = await fetch('http://localhost:8000/analyze_conversation', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ context: conversationChain }),
+            body: JSON.stringify({ context: conversationChain, conversation_id: conversationId.current }),
         });
 
         if (!analysisResponse.ok) {
@@ -230,7 +234,7 @@ const handleSubmit = async () => {
     // Append both PDFs and conversation chain to the FormData.
     formDataRef.current.append('pdf_file_buyer', pdfBuyer);
     formDataRef.current.append('pdf_file_seller', pdfSeller);
-    formDataRef.current.append('conversation_chain', JSON.stringify([...buyerConversation, ...sellerConversation]));
+    formDataRef.current.append('conversation_chain', JSON.stringify(conversation));
 
     // Debug: Log FormData entries.
     for (let [key, value] of formDataRef.current.entries()) {